@@ -0,0 +1,231 @@
+"""
+OpenGeoMetadata Aardvark records for GeoBlacklight, built from the published _ISO.xml records. Run `python aardvark.py`
+- One <assigned name>.json in each dataset directory on the file server, next to the zip
+- One combined JSONL of every record for bulk indexing
+"""
+
+import argparse
+import json
+import metadataFields
+import os
+import re
+import sanity_check
+import shapefileInspector
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from updateMetadata import APPLICATION_URL, ARK_REGEX, FILE_SERVER_PATH, RIGHTS, identifier_urls
+
+WORKERS = os.cpu_count() or 1
+
+# Records handed to each worker at a time
+CHUNK_SIZE = 64
+
+# Longest temporal extent listed year by year in gbl_indexYear_im
+MAX_INDEX_YEARS = 500
+
+PROVIDER = "University of Wisconsin-Milwaukee"
+
+# The ISO paths each Aardvark field is read from, streamed by metadataFields
+# {*} matches any namespace, so the gml 3.2 records arcpy exports and the gml records metadataBackend writes both match
+IDENTIFICATION = "{*}identificationInfo/*"
+CITATION = f"{IDENTIFICATION}/{{*}}citation/{{*}}CI_Citation"
+FIELD_PATHS = {
+    "fileIdentifier": "{*}fileIdentifier/{*}CharacterString",
+    "title": f"{CITATION}/{{*}}title/{{*}}CharacterString",
+    "alternateTitle": f"{CITATION}/{{*}}alternateTitle/{{*}}CharacterString",
+    "abstract": f"{IDENTIFICATION}/{{*}}abstract/{{*}}CharacterString",
+    "credit": f"{IDENTIFICATION}/{{*}}credit/{{*}}CharacterString",
+    "keyword": f"{IDENTIFICATION}/{{*}}descriptiveKeywords/{{*}}MD_Keywords/{{*}}keyword/{{*}}CharacterString",
+    "otherConstraints": f"{IDENTIFICATION}/{{*}}resourceConstraints/{{*}}MD_LegalConstraints/{{*}}otherConstraints/{{*}}CharacterString",
+    "format": "{*}distributionInfo/{*}MD_Distribution/{*}distributionFormat/{*}MD_Format/{*}name/{*}CharacterString",
+    "west": ".//{*}EX_GeographicBoundingBox/{*}westBoundLongitude/{*}Decimal",
+    "east": ".//{*}EX_GeographicBoundingBox/{*}eastBoundLongitude/{*}Decimal",
+    "south": ".//{*}EX_GeographicBoundingBox/{*}southBoundLatitude/{*}Decimal",
+    "north": ".//{*}EX_GeographicBoundingBox/{*}northBoundLatitude/{*}Decimal",
+    "begin": ".//{*}TimePeriod/{*}beginPosition",
+    "end": ".//{*}TimePeriod/{*}endPosition",
+    "instant": ".//{*}TimeInstant/{*}timePosition",
+}
+# The fields that keep every value; the rest only need their first, so reading stops sooner
+MULTIPLE_FIELDS = {"alternateTitle", "abstract", "credit", "keyword", "otherConstraints", "begin", "end", "instant"}
+YEAR_REGEX = re.compile(r"^\s*(-?\d{4})")
+
+def extract(iso_path) -> dict[str, list[str]]:
+    # The values of every mapped ISO field, stripped, in document order, streamed without building the tree
+    return metadataFields.extract(iso_path, FIELD_PATHS, MULTIPLE_FIELDS)
+
+def first(values, field, default=None):
+    return values[field][0] if values[field] else default
+
+def access_rights(rights) -> str:
+    # The rights directory the dataset is published in decides who can download it
+    return "Public" if rights == "public" else "Restricted"
+
+def envelope(values) -> str:
+    # Solr's ENVELOPE(west, east, north, south), or None if the record has no complete bounding box
+    corners = [first(values, corner) for corner in ("west", "east", "north", "south")]
+    if None in corners:
+        return None
+    return f"ENVELOPE({','.join(corners)})"
+
+def data_extent(dataset_directory) -> dict[str, list[str]]:
+    # The bounding box fields read from the shapefile headers in the published zip, for records without one
+    for zip_path in sorted(Path(dataset_directory).glob("*.zip")):
+        bounds = shapefileInspector.zip_extent(zip_path)
+        if bounds is not None:
+            return {side: [repr(value)] for side, value in zip(("west", "south", "east", "north"), bounds)}
+    return {}
+
+def index_years(values) -> list[int]:
+    # Every year of the temporal extent, or just its ends when the extent is longer than MAX_INDEX_YEARS
+    years = [int(match[1]) for match in map(YEAR_REGEX.match, values["begin"] + values["end"] + values["instant"]) if match]
+    if not years:
+        return []
+    low, high = min(years), max(years)
+    if high - low > MAX_INDEX_YEARS:
+        return [low, high]
+    return list(range(low, high + 1))
+
+def temporal(values) -> list[str]:
+    if values["begin"]:
+        return [f"{first(values, 'begin')[:10]} to {first(values, 'end', '')[:10]}".strip()]
+    return [instant[:10] for instant in values["instant"]]
+
+def aardvark_record(values, arkid, rights, modified) -> dict:
+    '''The Aardvark record of one dataset
+    - The ARK, the download URL and the metadata URL come from identifier_urls, like the ones written into the metadata and bound in NOID
+    - Empty fields are left out
+    '''
+    assignedName = re.search(ARK_REGEX, arkid)[2]
+    altTitle = first(values, "alternateTitle", assignedName)
+    urls = identifier_urls(arkid, rights, altTitle)
+    references = {"http://schema.org/downloadUrl": urls["download_URI"],
+                  "http://www.isotc211.org/schemas/2005/gmd/": urls["metadata_URL"]}
+    record = {
+        "id": urls["ark_URI"].removeprefix(APPLICATION_URL),
+        "dct_title_s": first(values, "title", altTitle),
+        "dct_alternative_sm": values["alternateTitle"],
+        "dct_description_sm": values["abstract"],
+        "dct_creator_sm": values["credit"],
+        "dct_subject_sm": values["keyword"],
+        "dct_temporal_sm": temporal(values),
+        "gbl_indexYear_im": index_years(values),
+        "dct_rights_sm": values["otherConstraints"],
+        "dct_accessRights_s": access_rights(rights),
+        "dct_format_s": first(values, "format"),
+        "gbl_resourceClass_sm": ["Datasets"],
+        "dct_identifier_sm": [f"ark:/{arkid}", urls["ark_URI"]],
+        "dct_references_s": json.dumps(references),
+        "locn_geometry": envelope(values),
+        "dcat_bbox": envelope(values),
+        "schema_provider_s": PROVIDER,
+        "gbl_mdModified_dt": modified,
+        "gbl_mdVersion_s": "Aardvark",
+    }
+    return {field: value for field, value in record.items() if value not in (None, [], "")}
+
+def convert(task) -> tuple[str, dict, str]:
+    '''Build and write the Aardvark record of one _ISO.xml. Runs in the worker processes
+    - task is (metadata path, rights directory name, dataset directory, whether to write the per-ARK file)
+    - A record without a bounding box gets the extent of the shapefile in the dataset directory's zip, if it has one
+    - Returns (assigned name, record, error); a record that can't be built comes back with its error instead
+    '''
+    iso_path, rights, dataset_directory, per_ark = task
+    assignedName = Path(iso_path).name.removesuffix("_ISO.xml")
+    try:
+        values = extract(iso_path)
+        arkid = first(values, "fileIdentifier", "")
+        match = re.search(ARK_REGEX, arkid)
+        if match is None or match[2] != assignedName:
+            raise Exception(f"fileIdentifier {arkid!r} does not match the assigned name {assignedName}")
+        arkid = f"{match[1]}/{match[2]}"
+        if envelope(values) is None:
+            values.update(data_extent(dataset_directory))
+        modified = datetime.fromtimestamp(os.stat(iso_path).st_mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        record = aardvark_record(values, arkid, rights, modified)
+        if per_ark:
+            write_json(Path(dataset_directory) / f"{assignedName}.json", record)
+        return assignedName, record, None
+    except Exception as error:
+        return assignedName, None, f"{type(error).__name__}: {error}"
+
+def write_json(path, record) -> None:
+    # Written beside the target and renamed over it, so the web server never serves half a record
+    temporary = path.with_name(f".{path.name}.tmp")
+    temporary.write_text(json.dumps(record, indent=2), encoding="utf-8")
+    os.replace(temporary, path)
+
+def tasks(file_server_path=FILE_SERVER_PATH, rights=RIGHTS, per_ark=True) -> tuple[list[tuple], list[str]]:
+    '''One task per metadata record that has a published dataset directory
+    - Lists the metadata directory and each rights directory once
+    - Returns the tasks and the metadata records that have no dataset directory
+    '''
+    file_server_path = Path(file_server_path)
+    report = {"missing_directories": []}
+    metadata, _ = sanity_check.list_if_present(file_server_path / "metadata", sanity_check.METADATA_REGEX, report)
+    published = {}
+    for rights_name in rights:
+        names, _ = sanity_check.list_if_present(file_server_path / rights_name, sanity_check.DATASET_REGEX, report)
+        for name, is_directory in names.items():
+            if is_directory:
+                published.setdefault(name, rights_name)
+
+    work, unpublished = [], []
+    for name in sorted(metadata):
+        if name not in published:
+            unpublished.append(name)
+            continue
+        directory = file_server_path / published[name] / name
+        work.append((str(file_server_path / "metadata" / f"{name}_ISO.xml"), published[name], directory, per_ark))
+    return work, unpublished
+
+def generate(file_server_path=FILE_SERVER_PATH, jsonl_path=None, workers=WORKERS, per_ark=True) -> dict:
+    '''Convert every published _ISO.xml to Aardvark with a process pool
+    - Records stream back in order and go straight into the JSONL, so memory stays flat however big the archive is
+    - Returns counts, the records that failed and the metadata records without a dataset directory
+    '''
+    work, unpublished = tasks(file_server_path, per_ark=per_ark)
+    summary = {"records": 0, "failed": {}, "unpublished": unpublished}
+    jsonl = open(jsonl_path, "w", encoding="utf-8") if jsonl_path else None
+    try:
+        for assignedName, record, error in convert_all(work, workers):
+            if error is not None:
+                summary["failed"][assignedName] = error
+                continue
+            summary["records"] += 1
+            if jsonl is not None:
+                jsonl.write(json.dumps(record) + "\n")
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+    return summary
+
+def convert_all(work, workers=WORKERS):
+    # convert() every task, in order, through a process pool when there is enough work to pay for one
+    if workers > 1 and len(work) > CHUNK_SIZE:
+        with ProcessPoolExecutor(workers) as executor:
+            yield from executor.map(convert, work, chunksize=CHUNK_SIZE)
+    else:
+        yield from map(convert, work)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write Aardvark JSON for every published dataset")
+    parser.add_argument("--file-server-path", type=Path, default=FILE_SERVER_PATH)
+    parser.add_argument("--jsonl", type=Path, help="also write every record to this JSONL for bulk indexing")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--no-per-ark", action="store_true", help="only write the JSONL, not a JSON in each dataset directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = generate(args.file_server_path, args.jsonl, args.workers, not args.no_per_ark)
+    print(f"{summary['records']} Aardvark records in {time.perf_counter() - start:.2f} s")
+    for name in summary["unpublished"]:
+        print(f"Warning: {name}_ISO.xml has no dataset directory")
+    for name, error in summary["failed"].items():
+        print(f"Failed: {name}: {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Local reservation pool of minted ARKs, persisted on disk so unused ids survive a crash.
+It is also the ledger of offline mode: ingest takes ARKs from blocks reserved beforehand and its binds wait
+here until `python arkPool.py reconcile <pool>` sends them to NOID and checks them.
+"""
+
+import argparse
+import bindCache
+import json
+import noidClient
+import sqlite3
+
+from datetime import datetime
+from pathlib import Path
+
+class ArkPool:
+    '''A pool of ARKs minted ahead of time in one `mint+N` request
+    - The pool lives in a SQLite file, so it is safe to share between threads and worker processes
+    - take() hands out the oldest unused ARK, refilling the pool from the minter when it is empty
+    - ARKs that were minted but never handed out stay in the file and are used first on the next run
+    '''
+
+    def __init__(self, db_path, minter, batch_size=50):
+        # minter is a function that takes a count and returns a list of that many arkids
+        self.db_path = Path(db_path)
+        self.minter = minter
+        self.batch_size = batch_size
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS arks (
+                arkid TEXT PRIMARY KEY,
+                minted_at TEXT NOT NULL,
+                taken_at TEXT)""")
+            # Binds made offline: the elements to set and the ones to purge first, until reconciled and verified
+            connection.execute("""CREATE TABLE IF NOT EXISTS pending_binds (
+                arkid TEXT PRIMARY KEY,
+                bind_params TEXT NOT NULL,
+                purged TEXT NOT NULL,
+                recorded_at TEXT NOT NULL,
+                bound_at TEXT,
+                verified_at TEXT)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A generous timeout, since many workers may be waiting on each other's short write transactions
+        return sqlite3.connect(self.db_path, timeout=120, isolation_level=None)
+
+    def take(self) -> str:
+        '''Hand out the oldest unused ARK
+        - The write lock is only held to mark one ARK taken, never while the minter talks to NOID
+        - A worker that finds the pool empty mints a batch and commits it before taking from it, so every minted ARK
+          is in the file first. Workers that find it empty at once each mint a batch; the spare ARKs wait for later runs.
+        '''
+        while True:
+            arkid = self._take_unused()
+            if arkid is not None:
+                return arkid
+            if self.refill() == 0:
+                raise Exception("Failed to mint an arkid!")
+
+    def _take_unused(self):
+        # Mark the oldest unused ARK taken in one short write transaction. None if the pool is empty.
+        connection = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers can never take the same ARK
+            connection.execute("BEGIN IMMEDIATE")
+            arkid = self._next_unused(connection)
+            if arkid is not None:
+                connection.execute("UPDATE arks SET taken_at = ? WHERE arkid = ?", (now(), arkid))
+            connection.execute("COMMIT")
+            return arkid
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def add(self, arkids) -> int:
+        # Put already-minted arkids into the pool. Returns how many were new.
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            added = self._insert(connection, arkids)
+            connection.execute("COMMIT")
+            return added
+        finally:
+            connection.close()
+
+    def refill(self, count=None) -> int:
+        # Mint ahead of time, e.g. before starting a large batch
+        return self.add(self.minter(count or self.batch_size))
+
+    def available(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT count(*) FROM arks WHERE taken_at IS NULL").fetchone()[0]
+
+    def record_commands(self, commands) -> str:
+        '''Keep NOID bind and fetch commands for later instead of sending them, and answer like NOID would
+        - bind set and bind purge are merged into each arkid's pending bind; a purge drops the pending values
+        - fetch answers with what NOID will have once the pending binds are reconciled
+        '''
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            pending, answer = {}, []
+            for command in commands:
+                words = command.strip().split(" ", 4)
+                if words[0] == "bind" and len(words) >= 4 and words[1] in ("set", "purge"):
+                    arkid, element = words[2], words[3]
+                    if arkid not in pending:
+                        pending[arkid] = self._pending(connection, arkid)
+                    bind_params, purged = pending[arkid]
+                    if words[1] == "set" and len(words) == 5:
+                        bind_params[element] = words[4].strip('"')
+                    elif words[1] == "purge":
+                        bind_params.pop(element, None)
+                        if element not in purged:
+                            purged.append(element)
+                    answer.append(f"id: {arkid}\nelement: {element}\nbind: {words[1]}\nStatus: ok\n")
+                elif words[0] in ("fetch", "get") and len(words) >= 2:
+                    bind_params = pending[words[1]][0] if words[1] in pending else self._pending(connection, words[1])[0]
+                    answer.append("".join([f"id: {words[1]}\n"] + [f"{key}: {value}\n" for key, value in bind_params.items()]))
+                else:
+                    answer.append(f"error: {command} can't be recorded offline\n")
+            connection.executemany("INSERT OR REPLACE INTO pending_binds VALUES (?, ?, ?, ?, NULL, NULL)",
+                                   [(arkid, json.dumps(bind_params), json.dumps(purged), now())
+                                    for arkid, (bind_params, purged) in pending.items()])
+            connection.execute("COMMIT")
+            return "\n".join(answer) + "\n"
+        except BaseException:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def pending_binds(self, verified=False) -> dict[str, tuple[dict, list, str]]:
+        # {arkid: (bind_params, purged elements, bound_at)} of the binds not yet reconciled, or not yet verified
+        column = "verified_at" if verified else "bound_at"
+        with self._connect() as connection:
+            rows = connection.execute(f"SELECT arkid, bind_params, purged, bound_at FROM pending_binds WHERE {column} IS NULL").fetchall()
+        return {row[0]: (json.loads(row[1]), json.loads(row[2]), row[3]) for row in rows}
+
+    def mark(self, arkids, column) -> None:
+        # Set bound_at or verified_at, or clear both for binds that need sending again (column None)
+        with self._connect() as connection:
+            if column is None:
+                connection.executemany("UPDATE pending_binds SET bound_at = NULL, verified_at = NULL WHERE arkid = ?",
+                                       [(arkid,) for arkid in arkids])
+            else:
+                connection.executemany(f"UPDATE pending_binds SET {column} = ? WHERE arkid = ?", [(now(), arkid) for arkid in arkids])
+
+    def _pending(self, connection, arkid) -> tuple[dict, list]:
+        # The pending bind of arkid, or a fresh one if it has none or the last one was already reconciled
+        row = connection.execute("SELECT bind_params, purged, bound_at FROM pending_binds WHERE arkid = ?", (arkid,)).fetchone()
+        if row is None or row[2] is not None:
+            return {}, []
+        return json.loads(row[0]), json.loads(row[1])
+
+    def _next_unused(self, connection):
+        row = connection.execute("SELECT arkid FROM arks WHERE taken_at IS NULL ORDER BY rowid LIMIT 1").fetchone()
+        return None if row is None else row[0]
+
+    def _insert(self, connection, arkids) -> int:
+        before = connection.total_changes
+        minted_at = now()
+        connection.executemany("INSERT OR IGNORE INTO arks (arkid, minted_at) VALUES (?, ?)",
+                               [(arkid, minted_at) for arkid in arkids])
+        return connection.total_changes - before
+
+def now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
+
+def exhausted(count):
+    # The minter of an offline pool: nothing can be minted, only the ARKs reserved beforehand are there
+    raise noidClient.NoidError("The ARK pool has no reserved arkids left. Reserve more with "
+                               "`python arkPool.py reserve <pool> <count>` while NOID is reachable")
+
+class OfflineResponse:
+    # Just enough of a requests response for the NoidClient methods
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+class OfflineNoidClient(noidClient.NoidClient):
+    '''A NoidClient that never touches the network, for ingesting while NOID is slow or down
+    - `mint+N` takes N ARKs reserved in the pool beforehand. Minting locally would collide with NOID's own sequence.
+    - Command scripts are recorded in the pool by ArkPool.record_commands() for reconcile()
+    '''
+
+    offline = True
+
+    def __init__(self, pool_path):
+        super().__init__("offline:")
+        self.pool = ArkPool(pool_path, exhausted)
+
+    def request(self, method, query, data=None) -> OfflineResponse:
+        if method == "GET" and query.startswith("mint+"):
+            return OfflineResponse("".join(f"id: {self.pool.take()}\n" for _ in range(int(query[len("mint+"):]))))
+        if method == "POST" and query == "-":
+            return OfflineResponse(self.pool.record_commands(line for line in data.splitlines() if line.strip()))
+        raise noidClient.NoidError(f"NOID request `{query}` can't be made offline")
+
+_offline_clients: dict[str, OfflineNoidClient] = {}
+
+def get_offline_client(pool_path) -> OfflineNoidClient:
+    # One shared offline client per ARK pool per process, like noidClient.get_client()
+    key = str(pool_path)
+    if key not in _offline_clients:
+        _offline_clients[key] = OfflineNoidClient(pool_path)
+    return _offline_clients[key]
+
+def reconcile(pool, client, cache=None, max_commands=450, fetch_batch_size=500) -> dict:
+    '''Send the binds made offline to NOID, then fetch them back and check NOID has exactly those values
+    - Purges go before the sets of the same arkid, and each batch is one POST
+    - A bind NOID rejected, or one that doesn't read back the same, stays pending for the next reconcile
+    - cache, a bindCache.BindCache, gets the values of every bind once NOID has them
+    '''
+    summary = {"bound": 0, "verified": 0, "failed": {}}
+    pending = pool.pending_binds()
+    with noidClient.BindBatch(client, max_commands, max_wait=float("inf")) as batch:
+        for arkid, (bind_params, purged, _) in pending.items():
+            batch.add(arkid, noidClient.bind_commands(arkid, purged, purge=True) + noidClient.bind_commands(arkid, bind_params))
+    bound = [arkid for arkid in pending if batch.statuses.get(arkid) == "ok"]
+    pool.mark(bound, "bound_at")
+    summary["bound"] = len(bound)
+    for arkid in pending:
+        if batch.statuses.get(arkid) != "ok":
+            summary["failed"][arkid] = batch.statuses.get(arkid, "not sent")
+
+    unverified = {arkid: values for arkid, values in pool.pending_binds(verified=True).items() if values[2] is not None}
+    arkids = sorted(unverified)
+    for start in range(0, len(arkids), fetch_batch_size):
+        fetched = client.fetch(arkids[start:start + fetch_batch_size])
+        verified, mismatched = [], []
+        for arkid in arkids[start:start + fetch_batch_size]:
+            bind_params, purged, _ = unverified[arkid]
+            expected = {element: str(value).strip() for element, value in bind_params.items()}
+            actual = {element: value for element, value in fetched.get(arkid, {}).items() if element in expected or element in purged}
+            if actual == expected:
+                verified.append(arkid)
+                if cache is not None:
+                    if purged:
+                        cache.forget(arkid)
+                    cache.store(arkid, bind_params)
+            else:
+                mismatched.append(arkid)
+                differing = sorted(element for element in set(actual) | set(expected) if actual.get(element) != expected.get(element))
+                summary["failed"][arkid] = f"NOID has different values for {', '.join(differing)}"
+        pool.mark(verified, "verified_at")
+        pool.mark(mismatched, None)
+        summary["verified"] += len(verified)
+    return summary
+
+def main() -> None:
+    # Imported here: updateMetadata imports this module
+    import updateMetadata
+
+    parser = argparse.ArgumentParser(description="Reserve ARKs for offline ingest and reconcile the binds made offline")
+    parser.add_argument("--noid-url", default=updateMetadata.NOID_URL)
+    commands = parser.add_subparsers(dest="command", required=True)
+    reserve = commands.add_parser("reserve", help="mint a block of ARKs into the pool with one request")
+    reserve.add_argument("pool", type=Path)
+    reserve.add_argument("count", type=int)
+    status = commands.add_parser("status", help="count the reserved ARKs and the pending binds")
+    status.add_argument("pool", type=Path)
+    reconcile_parser = commands.add_parser("reconcile", help="bind the pending binds in NOID and verify them")
+    reconcile_parser.add_argument("pool", type=Path)
+    reconcile_parser.add_argument("--bind-cache", type=Path, help="keep this bind cache in step")
+    args = parser.parse_args()
+
+    client = noidClient.get_client(args.noid_url)
+    pool = ArkPool(args.pool, client.mint)
+    if args.command == "reserve":
+        print(f"Reserved {pool.refill(args.count)} ARKs, {pool.available()} available")
+    elif args.command == "status":
+        print(f"{pool.available()} reserved ARKs available, {len(pool.pending_binds())} binds waiting to be sent, "
+              f"{len(pool.pending_binds(verified=True))} not yet verified")
+    else:
+        cache = None if args.bind_cache is None else bindCache.BindCache(args.bind_cache)
+        summary = reconcile(pool, client, cache)
+        print(f"Bound {summary['bound']}, verified {summary['verified']}, {len(summary['failed'])} still pending")
+        for arkid, problem in summary["failed"].items():
+            print(f"Pending: {arkid}: {problem}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Asyncio ingest pipeline: datasets flow through bounded queues between stages, so NOID round-trips,
+metadata work and zipping of different datasets overlap instead of adding up
+"""
+
+import asyncio
+import batchIngest
+import csv
+import ingestJournal
+import noidClient
+import runLog
+import time
+import updateMetadata
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import aiohttp
+except ImportError: # Without aiohttp the NOID calls run on a thread, through noidClient
+    aiohttp = None
+
+# Datasets waiting between two stages. Queues this short keep memory flat: a slow stage
+# makes the stages before it wait instead of piling up datasets.
+QUEUE_SIZE = 8
+
+# Datasets zipped at once; zipBuilder already compresses each one on every core
+ZIP_WORKERS = 2
+
+# Datasets in the metadata stages at once. arcpy is not thread-safe, so with the arcpy
+# backend every arcpy call happens on one thread.
+METADATA_WORKERS = batchIngest.WORKERS
+
+# The most datasets bound in one POST. Smaller batches go out whenever the bind stage would otherwise wait.
+BIND_BATCH_DATASETS = batchIngest.BIND_BATCH_SIZE // len(updateMetadata.BIND_ELEMENTS)
+
+class AsyncNoidClient:
+    '''The NOID calls the pipeline makes, awaitable
+    - Uses aiohttp when it is installed, with the same retries as noidClient.NoidClient
+    - Otherwise runs noidClient's pooled requests client on a thread
+    '''
+
+    def __init__(self, noid_url, client=None):
+        self.noid_url = noid_url
+        self.client = client or noidClient.get_client(noid_url) # Retry settings, and the fallback
+        self.session = None
+
+    async def __aenter__(self):
+        if aiohttp is not None and not self.client.offline:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.client.timeout),
+                                                 connector=aiohttp.TCPConnector(limit=8))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session is not None:
+            await self.session.close()
+
+    async def request(self, method, query, data=None) -> tuple[str, dict]:
+        # The answer, and the measures of this request for the run log. Other coroutines and threads make
+        # requests at the same time, so the thread's noidClient.http_stats() can't tell them apart.
+        start = time.perf_counter()
+        text = await self._request(method, query, data)
+        return text, {"http_requests": 1, "http_seconds": round(time.perf_counter() - start, 6)}
+
+    async def _request(self, method, query, data=None) -> str:
+        if self.session is None:
+            response = await asyncio.to_thread(self.client.request, method, query, data)
+            return response.text
+
+        for attempt in range(self.client.retries + 1):
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, self.noid_url + query, data=data) as response:
+                    status = response.status
+                    text = await response.text()
+                if status not in noidClient.RETRY_STATUS:
+                    break
+                problem = f"status code {status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                status = None
+                problem = error
+            finally:
+                noidClient.record_request(time.perf_counter() - start)
+            if attempt == self.client.retries:
+                raise noidClient.NoidError(f"NOID request `{query}` failed after {self.client.retries + 1} attempts: {problem}")
+            print(f"NOID request `{query}` failed ({problem}), retrying...")
+            await asyncio.sleep(self.client.backoff * 2 ** attempt)
+        if status != 200:
+            raise noidClient.NoidError(f"NOID request `{query}` returned status code {status}")
+        return text
+
+    async def mint(self, count) -> tuple[list[str], dict]:
+        text, measures = await self.request("GET", f"mint+{count}")
+        return noidClient.minted_arkids(text), measures
+
+    async def run_commands(self, commands) -> tuple[str, dict]:
+        return await self.request("POST", "-", data="".join(command + "\n" for command in commands))
+
+class Job:
+    # One dataset on its way through the pipeline
+    def __init__(self, directory, completed=(), arkid=None):
+        self.directory = Path(directory)
+        self.completed = set(completed) # ingestJournal stages already done, in an earlier run or this one
+        self.arkid = arkid
+        self.dataset = None
+        self.events = []
+        self.result = None # The finished log row and warnings, once the dataset has failed or been skipped
+
+class Pipeline:
+    '''Runs datasets through the ingest stages, each stage feeding the next through a bounded queue
+    - dataset: Dataset(), which finds the data and reads its metadata (metadata executor)
+    - mint: arkids for all the datasets waiting, from the ARK pool (thread) or one `mint+N` (async NOID)
+    - metadata: identifiers, hours, ISO/FGDC export, bind commands (metadata executor)
+    - bind: one POST with the bind commands of all the datasets waiting (async NOID)
+    - zip: zipfile and ISO metadata into staging, then published onto the fileserver (zip executor)
+    A dataset that fails is purged and passed along to be logged; later stages leave it alone.
+    '''
+
+    def __init__(self, csv_output, journal_path=None, run_log_path=None, zip_workers=ZIP_WORKERS, metadata_workers=None):
+        self.csv_output = csv_output
+        self.journal = None if journal_path is None else ingestJournal.IngestJournal(journal_path)
+        self.run_log_path = run_log_path
+        if metadata_workers is None:
+            metadata_workers = 1 if updateMetadata.METADATA_BACKEND == "arcpy" else METADATA_WORKERS
+        self.metadata_workers = metadata_workers
+        self.zip_workers = zip_workers
+        self.metadata_executor = ThreadPoolExecutor(max_workers=metadata_workers, thread_name_prefix="metadata")
+        self.zip_executor = ThreadPoolExecutor(max_workers=zip_workers, thread_name_prefix="zip")
+        self.stage_functions = {stage: (description, run) for stage, description, run in batchIngest.STAGES}
+
+    def fail(self, job, description, error) -> None:
+        # Runs on an executor thread: purging touches the fileserver, and NOID if the dataset was bound
+        if self.journal is not None:
+            self.journal.reset(job.directory)
+        job.result = batchIngest.fail(job.dataset, job.directory, f"Failed to {description} for {str(job.directory)}\n",
+                                      error, batch_binds="bound" not in job.completed, events=job.events)
+
+    def run_steps(self, job, stages) -> None:
+        # Run some of batchIngest.STAGES on one dataset, skipping the ones the journal has as done
+        for stage in stages:
+            if stage in job.completed:
+                continue
+            description, run = self.stage_functions[stage]
+            try:
+                with runLog.stage(job.events, job.directory, stage) as measures:
+                    measures.update(batchIngest.stage_bytes(stage, job.dataset, run(job.dataset)))
+            except Exception as error:
+                self.fail(job, description, error)
+                return
+            job.completed.add(stage)
+            if self.journal is not None:
+                self.journal.complete(job.directory, stage)
+
+    def create_dataset(self, job) -> None:
+        try:
+            with runLog.stage(job.events, job.directory, "dataset"):
+                job.dataset = updateMetadata.Dataset(job.directory)
+        except Exception as error:
+            self.fail(job, "create Dataset object", error)
+
+    def update_metadata(self, job) -> None:
+        self.run_steps(job, ["identifiers", "hours", "exported"])
+        if job.result is None and "bound" not in job.completed:
+            # Read from the metadata here, on the metadata executor, because arcpy objects are involved
+            batchIngest.prepare_bind(job.dataset)
+
+    def write_outputs(self, job) -> None:
+        self.run_steps(job, ["zipped", "verified", "metadata", "published"])
+
+    async def mint(self, jobs) -> None:
+        # Datasets the journal has an arkid for keep it
+        needed = [job for job in jobs if job.arkid is None]
+        arkids = []
+        if needed:
+            events = []
+            try:
+                with runLog.stage(events, "", "mint batch") as measures:
+                    if updateMetadata.ARK_POOL_PATH is not None:
+                        # From the reservation pool like batchIngest, which is also where offline ingest gets them
+                        arkids = await asyncio.to_thread(self.take_arkids, len(needed))
+                    else:
+                        arkids, request = await self.noid.mint(len(needed))
+                        measures.update(request)
+                    measures["arks"] = len(arkids)
+                if len(arkids) < len(needed):
+                    raise noidClient.NoidError(f"Asked NOID for {len(needed)} arkids and got {len(arkids)}")
+            except Exception as error:
+                for job in needed:
+                    await self.on_executor(self.zip_executor, self.fail, job, "mint an arkid", error)
+                jobs = [job for job in jobs if job.result is None]
+                arkids = []
+            finally:
+                self.write_events(events)
+
+        for job, arkid in zip(needed, arkids):
+            job.arkid = arkid
+        if self.journal is not None and arkids:
+            await asyncio.to_thread(self.record_arkids, needed[:len(arkids)])
+        for job in jobs:
+            try:
+                with runLog.stage(job.events, job.directory, "minted"):
+                    job.dataset.metadata.mint_identifier(job.arkid)
+                    job.dataset.set_fileserver_paths()
+                job.completed.add("minted")
+            except Exception as error:
+                await self.on_executor(self.zip_executor, self.fail, job, "mint an arkid", error)
+
+    async def bind(self, jobs) -> None:
+        jobs = [job for job in jobs if "bound" not in job.completed]
+        if not jobs:
+            return
+        arkids = [job.dataset.metadata.identifier.arkid for job in jobs]
+        events = []
+        try:
+            # Datasets whose bindings are all in the bind cache already have no commands
+            commands = [command for job in jobs for command in job.dataset.bind_commands]
+            text = ""
+            if commands:
+                with runLog.stage(events, "", "bind batch") as measures:
+                    measures["arks"] = len(arkids)
+                    text, request = await self.noid.run_commands(commands)
+                    measures.update(request)
+            statuses = noidClient.ark_statuses(arkids, text)
+        except noidClient.NoidError as error:
+            statuses = {arkid: str(error) for arkid in arkids}
+        finally:
+            self.write_events(events)
+
+        failed = []
+        bound = [job for job, arkid in zip(jobs, arkids) if statuses[arkid] == "ok"]
+        if bound:
+            await asyncio.to_thread(self.record_bound, bound)
+        for job, arkid in zip(jobs, arkids):
+            if statuses[arkid] != "ok":
+                await self.on_executor(self.zip_executor, self.fail, job, "NOID bind", statuses[arkid])
+                failed.append(arkid)
+        if failed:
+            # Undo whatever part of the batch NOID did bind for the failing datasets
+            purge_commands = [command for arkid in failed
+                              for command in noidClient.bind_commands(arkid, updateMetadata.BIND_ELEMENTS, purge=True)]
+            try:
+                await self.noid.run_commands(purge_commands)
+                await asyncio.to_thread(self.forget_bindings, failed)
+            except noidClient.NoidError as error:
+                print(error)
+
+    def take_arkids(self, count) -> list[str]:
+        # Runs on a thread: the pool is SQLite, and refilling it talks to NOID
+        pool = updateMetadata.ark_pool()
+        return [pool.take() for _ in range(count)]
+
+    def record_arkids(self, jobs) -> None:
+        # Runs on a thread: the journal is SQLite, and the event loop shouldn't wait on it
+        for job in jobs:
+            self.journal.record_arkid(job.directory, job.arkid)
+
+    def record_bound(self, jobs) -> None:
+        # Runs on a thread, like record_arkids(): the bind cache and the journal are SQLite
+        for job in jobs:
+            updateMetadata.remember_binding(job.dataset.metadata.identifier.arkid, job.dataset.bind_params)
+            job.completed.add("bound")
+            if self.journal is not None:
+                self.journal.complete(job.directory, "bound")
+
+    def forget_bindings(self, arkids) -> None:
+        for arkid in arkids:
+            updateMetadata.forget_binding(arkid)
+
+    async def on_executor(self, executor, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, function, *args)
+
+    def write_events(self, events) -> None:
+        if self.run_log is not None:
+            self.run_log.write(events)
+
+    async def worker_stage(self, inbox, outbox, consumers, executor, function) -> None:
+        # `consumers` datasets at a time go through function on executor
+        async def consume():
+            while True:
+                job = await inbox.get()
+                if job is None:
+                    await inbox.put(None) # Let the other consumers see the end too
+                    return
+                if job.result is None:
+                    await self.on_executor(executor, function, job)
+                await outbox.put(job)
+        await asyncio.gather(*(consume() for _ in range(consumers)))
+        await outbox.put(None)
+
+    async def batch_stage(self, inbox, outbox, batch_size, function) -> None:
+        # Everything waiting in the inbox (up to batch_size datasets) goes through function together
+        finished = False
+        while not finished:
+            batch = []
+            job = await inbox.get()
+            while True:
+                if job is None:
+                    finished = True
+                    break
+                batch.append(job)
+                if len(batch) >= batch_size or inbox.empty():
+                    break
+                job = inbox.get_nowait()
+            ready = [job for job in batch if job.result is None]
+            if ready:
+                await function(ready)
+            for job in batch:
+                await outbox.put(job)
+        await outbox.put(None)
+
+    async def source(self, dataset_directories, outbox) -> None:
+        for directory in dataset_directories:
+            directory = Path(directory)
+            job = Job(directory)
+            if self.journal is not None:
+                job.completed = await asyncio.to_thread(self.journal.completed, directory)
+                job.arkid = await asyncio.to_thread(self.journal.arkid, directory)
+                if job.completed >= set(ingestJournal.STAGES):
+                    print(f"Already ingested {str(directory)}, skipping\n")
+                    with runLog.stage(job.events, directory, "skipped"):
+                        pass
+                    job.result = {"row": [str(directory), "passing", job.arkid.split("/")[1], "Already ingested, skipped", ""],
+                                  "warnings": []}
+            await outbox.put(job) # Waits while the first stage is full
+        await outbox.put(None)
+
+    async def sink(self, inbox, logwriter, csvfile, summary) -> None:
+        while (job := await inbox.get()) is not None:
+            if job.result is None:
+                print(f"Successfully updated and ingested {str(job.directory)}!\n")
+                job.result = {"row": [str(job.directory), "passing", batchIngest.assigned_name(job.dataset), "", ""],
+                              "warnings": []}
+            logwriter.writerow(job.result["row"])
+            csvfile.flush()
+            if self.journal is not None:
+                await asyncio.to_thread(self.journal.finish, job.directory, job.result["row"][1])
+            self.write_events(job.events)
+            summary["datasets"] += 1
+            if job.result["row"][1] == "failing":
+                summary["failing"] += 1
+                summary["recent_failures"].append(job.result["warnings"])
+
+    async def run(self, dataset_directories) -> dict:
+        summary = {"datasets": 0, "failing": 0, "recent_failures": deque(maxlen=runLog.RECENT_FAILURES)}
+        queues = [asyncio.Queue(maxsize=QUEUE_SIZE) for _ in range(6)]
+        new_log = not Path(self.csv_output).exists() or Path(self.csv_output).stat().st_size == 0
+        self.run_log = None if self.run_log_path is None else runLog.RunLog(self.run_log_path)
+        batchIngest.clean_staging(self.journal)
+        try:
+            with open(self.csv_output, 'a', newline='') as csvfile:
+                logwriter = csv.writer(csvfile)
+                if new_log:
+                    logwriter.writerow(batchIngest.LOG_HEADER)
+                async with AsyncNoidClient(updateMetadata.NOID_URL, updateMetadata.noid_client()) as self.noid:
+                    await asyncio.gather(
+                        self.source(dataset_directories, queues[0]),
+                        self.worker_stage(queues[0], queues[1], self.metadata_workers, self.metadata_executor, self.create_dataset),
+                        self.batch_stage(queues[1], queues[2], updateMetadata.MINT_BATCH_SIZE, self.mint),
+                        self.worker_stage(queues[2], queues[3], self.metadata_workers, self.metadata_executor, self.update_metadata),
+                        self.batch_stage(queues[3], queues[4], BIND_BATCH_DATASETS, self.bind),
+                        self.worker_stage(queues[4], queues[5], self.zip_workers, self.zip_executor, self.write_outputs),
+                        self.sink(queues[5], logwriter, csvfile, summary))
+        finally:
+            self.metadata_executor.shutdown()
+            self.zip_executor.shutdown()
+            if self.run_log is not None:
+                self.run_log.close()
+        summary["recent_failures"] = list(summary["recent_failures"])
+        return summary
+
+def run_pipeline(dataset_directories, csv_output, journal_path=None, run_log_path=None,
+                 zip_workers=ZIP_WORKERS, metadata_workers=None) -> dict:
+    '''Ingest every dataset directory through the asyncio pipeline
+    - Takes the same log, journal and run log files as batchIngest.run_batch() and returns the same summary
+    - Log rows are written in the order datasets finish, not the order they were given in
+    - dataset_directories can be any iterable; the next directory is read when the first queue has room
+    '''
+    pipeline = Pipeline(csv_output, journal_path, run_log_path, zip_workers, metadata_workers)
+    return asyncio.run(pipeline.run(dataset_directories))
@@ -0,0 +1,331 @@
+"""
+Batch engine for running the updateMetadata.Dataset pipeline over many dataset directories at once
+"""
+
+import csv
+import ingestJournal
+import noidClient
+import os
+import poolMap
+import runLog
+import updateMetadata
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+# arcpy is not thread-safe, so every dataset gets its own worker process.
+# Most of the time in a dataset goes to NOID round-trips and zip I/O on the
+# archive share, so one worker per core is a sensible default.
+WORKERS = os.cpu_count() or 1
+
+# updateMetadata settings that are copied into every worker process. Workers re-import
+# updateMetadata, so anything changed at runtime in this process would otherwise be lost.
+SETTINGS = ["NOID_URL", "FILE_SERVER_PATH", "ARK_POOL_PATH", "MINT_BATCH_SIZE", "SCAN_CACHE_PATH", "METADATA_BACKEND",
+            "STAGING_PATH", "BIND_CACHE_PATH", "NOID_OFFLINE"]
+
+# Datasets handed to the worker processes ahead of the results being logged. Only this many
+# directories are read from the input at a time, so a manifest or listing is never read up front.
+SUBMIT_AHEAD = 2 * WORKERS
+
+# Binding: workers hand their `bind set` commands back to this process, which sends the
+# commands of many datasets in one POST once BIND_BATCH_SIZE commands are queued or
+# the oldest has waited BIND_BATCH_WAIT seconds.
+BIND_BATCH_SIZE = 450 # 50 datasets
+BIND_BATCH_WAIT = 30.0
+
+LOG_HEADER = ["INPATH", "STATUS", "ARKID", "WARNING", "ERROR"]
+
+# The stages every dataset goes through after the Dataset object is created and its arkid minted, in order.
+# Each entry is (ingestJournal stage, description used in the warning, function that runs the stage)
+STAGES = [
+    ("identifiers", "create and write identifiers", lambda dataset: dataset.metadata.create_and_write_identifiers()),
+    ("hours", "update AGSL hours", lambda dataset: dataset.metadata.update_agsl_hours()),
+    ("exported", "export metadata", lambda dataset: dataset.metadata.dual_metadata_export()),
+    ("bound", "NOID bind", lambda dataset: dataset.metadata.bind()), # Replaced with prepare_bind() when binds are batched
+    ("zipped", "ingest", lambda dataset: dataset.write_zip()),
+    ("verified", "verify the zipfile", lambda dataset: dataset.verify_zip()),
+    ("metadata", "copy ISO metadata", lambda dataset: dataset.copy_metadata()),
+    ("published", "publish", lambda dataset: dataset.publish()), # Waits for the bind when binds are batched
+]
+
+def current_settings() -> dict:
+    return {name: getattr(updateMetadata, name) for name in SETTINGS}
+
+def apply_settings(settings) -> None:
+    # Runs once in every worker process as it starts
+    for name, value in settings.items():
+        setattr(updateMetadata, name, value)
+
+def assigned_name(dataset) -> str:
+    # The identifier only exists once create_and_write_identifiers() has minted it
+    try:
+        return dataset.metadata.identifier.assignedName
+    except AttributeError:
+        return ""
+
+def prepare_bind(dataset) -> None:
+    # Only build the commands, run_batch() sends them. No commands if the bind cache has every value already.
+    dataset.bind_params = dataset.metadata.changed_bind_params()
+    dataset.bind_commands = dataset.metadata.bind_commands(bind_params=dataset.bind_params)
+
+def stage_bytes(stage, dataset, returned) -> dict:
+    # What a stage read from and wrote to disk, for the run log
+    if stage == "zipped":
+        return {"bytes_read": sum(member["size"] for member in dataset.zip_manifest),
+                "bytes_written": dataset.staged_zip.stat().st_size}
+    elif stage == "verified":
+        return {"bytes_read": dataset.staged_zip.stat().st_size}
+    elif stage == "exported" and returned is not None:
+        return {"bytes_written": sum(path.stat().st_size for path in returned)}
+    elif stage == "metadata":
+        size = dataset.staged_metadata.stat().st_size
+        return {"bytes_read": size, "bytes_written": size}
+    return {}
+
+def clean_staging(journal=None) -> None:
+    '''Remove what earlier runs left in the staging directory, before a batch starts
+    - Those outputs were never published, so the journal forgets they were built
+    - Assumes one batch runs against a fileserver at a time
+    '''
+    staging = updateMetadata.staging_root()
+    staging.mkdir(parents=True, exist_ok=True)
+    stale = list(staging.iterdir())
+    for path in stale:
+        updateMetadata.discard(path)
+    if stale:
+        print(f"Removed {len(stale)} unpublished datasets from {staging}")
+    if journal is not None:
+        journal.reset_unpublished()
+
+def purge(dataset, unbind=True, events=None) -> list[str]:
+    '''Undo the side effects of a failing dataset
+    - Purges the NOID bindings (unless they were never sent)
+    - Discards the staged zipfile and metadata. Nothing reaches the fileserver until every stage has succeeded.
+    - Returns a list with the text of any errors raised along the way
+    '''
+    errors = []
+    if dataset is None:
+        return errors
+
+    if unbind and hasattr(dataset.metadata, "identifier"):
+        try:
+            with runLog.stage([] if events is None else events, dataset.path, "purge"):
+                dataset.metadata.bind(purge=True)
+        except Exception as error:
+            print(error)
+            errors.append(str(error))
+    print()
+    print('###PURGE###')
+    print()
+    dataset.discard()
+    return errors
+
+def ingest_dataset(dataset_directory, batch_binds=False, journal_path=None) -> dict:
+    '''Run the full pipeline on one dataset directory
+    - Returns a dict with the log row for the dataset, a list of warnings and the run log events
+    - With batch_binds the bind commands are returned instead of sent, and the staged outputs
+      are only published once run_batch() knows the bind succeeded
+    - With a journal, stages that already completed are skipped and the arkid minted before is reused
+    - A dataset that fails after an earlier run's batched bind went out returns its arkid, for run_batch() to purge
+    - Runs in a worker process, so everything returned has to be picklable
+    '''
+    dataset_directory = Path(dataset_directory)
+    dataset = None
+    journal = None if journal_path is None else ingestJournal.IngestJournal(journal_path)
+    completed = set() if journal is None else journal.completed(dataset_directory)
+    events = []
+
+    def failed(description, error):
+        result = fail(dataset, dataset_directory, f"Failed to {description} for {str(dataset_directory)}\n", error,
+                      batch_binds, events)
+        result["events"] = events
+        if batch_binds and "bound" in completed:
+            # An earlier run's bind is still in NOID; run_batch() purges it with the next batch
+            result["arkid"] = journal.arkid(dataset_directory)
+        if journal is not None:
+            journal.reset(dataset_directory)
+        return result
+
+    if completed >= set(ingestJournal.STAGES):
+        print(f"Already ingested {str(dataset_directory)}, skipping\n")
+        assignedName = journal.arkid(dataset_directory).split("/")[1]
+        with runLog.stage(events, dataset_directory, "skipped"):
+            pass
+        return {"row": [str(dataset_directory), "passing", assignedName, "Already ingested, skipped", ""],
+                "warnings": [], "bind_commands": None, "events": events}
+
+    try:
+        with runLog.stage(events, dataset_directory, "dataset"):
+            dataset = updateMetadata.Dataset(dataset_directory)
+    except Exception as error:
+        return failed("create Dataset object", error)
+
+    try:
+        with runLog.stage(events, dataset_directory, "minted"):
+            arkid = None if journal is None else journal.arkid(dataset_directory)
+            dataset.metadata.mint_identifier(arkid)
+            if journal is not None and arkid is None:
+                journal.record_arkid(dataset_directory, dataset.metadata.identifier.arkid)
+            dataset.set_fileserver_paths()
+    except Exception as error:
+        return failed("mint an arkid", error)
+
+    for stage, description, run_stage in STAGES:
+        if batch_binds and stage == "bound":
+            run_stage = prepare_bind
+        elif batch_binds and stage == "published":
+            continue
+        elif stage in completed:
+            continue
+        try:
+            with runLog.stage(events, dataset_directory, stage) as measures:
+                measures.update(stage_bytes(stage, dataset, run_stage(dataset)))
+        except Exception as error:
+            return failed(description, error)
+        # A batched bind is only complete once run_batch() has sent it
+        if journal is not None and run_stage is not prepare_bind:
+            journal.complete(dataset_directory, stage)
+
+    print(f"Successfully updated and ingested {str(dataset_directory)}!\n")
+    return {
+        "row": [str(dataset_directory), "passing", assigned_name(dataset), "", ""],
+        "warnings": [],
+        "arkid": dataset.metadata.identifier.arkid,
+        "bind_commands": getattr(dataset, "bind_commands", None),
+        "bind_params": getattr(dataset, "bind_params", None),
+        "outputs": dataset.staged_outputs(),
+        "staging": dataset.staging_dir,
+        "events": events,
+    }
+
+def fail(dataset, dataset_directory, warning, error, batch_binds=False, events=None) -> dict:
+    print(warning)
+    print(error)
+    warnings = [warning, str(error)]
+    row = [str(dataset_directory), "failing", assigned_name(dataset), warning, str(error)]
+    warnings.extend(purge(dataset, unbind=not batch_binds, events=events))
+    return {"row": row, "warnings": warnings, "bind_commands": None}
+
+def settle_binds(result, statuses, batch, journal) -> None:
+    # Publish a dataset once its batched bind came back ok, otherwise fail it and discard its staged outputs
+    status = statuses.pop(result["arkid"])
+    if status == "ok":
+        updateMetadata.remember_binding(result["arkid"], result["bind_params"])
+        if journal is not None:
+            journal.complete(result["row"][0], "bound")
+        try:
+            with runLog.stage(result["events"], result["row"][0], "published"):
+                updateMetadata.publish(result["outputs"], result["staging"])
+            if journal is not None:
+                journal.complete(result["row"][0], "published")
+            return
+        except Exception as error:
+            warning = f"Failed to publish for {result['row'][0]}\n"
+            status = str(error)
+    else:
+        warning = f"Failed to NOID bind for {result['row'][0]}\n"
+    print(warning)
+    print(status)
+    result["row"][1] = "failing"
+    result["row"][3] = warning
+    result["row"][4] = status
+    result["warnings"] = [warning, status]
+    updateMetadata.discard(result["staging"])
+    batch.purge(result["arkid"], updateMetadata.BIND_ELEMENTS)
+    updateMetadata.forget_binding(result["arkid"])
+    if journal is not None:
+        journal.reset(result["row"][0])
+
+def run_batch(dataset_directories, csv_output, workers=WORKERS, journal_path=None, run_log_path=None) -> dict:
+    '''Ingest every dataset directory on a pool of worker processes
+    - dataset_directories can be any iterable, like a datasetSource generator; it is read as the workers need more
+    - Log rows are appended to csv_output in the same order as dataset_directories
+    - workers=1 runs everything in this process, which is handy for debugging
+    - journal_path is an ingestJournal file; a rerun with the same journal picks up where the last run stopped
+    - run_log_path is a runLog JSONL file that gets an event for every stage of every dataset
+    - Returns the number of datasets and failures, with the warnings of the last RECENT_FAILURES failures
+    '''
+    summary = {"datasets": 0, "failing": 0, "recent_failures": deque(maxlen=runLog.RECENT_FAILURES)}
+    run_log = None if run_log_path is None else runLog.RunLog(run_log_path)
+    journal = None if journal_path is None else ingestJournal.IngestJournal(journal_path)
+    ingest = partial(ingest_dataset, batch_binds=True, journal_path=journal_path)
+    batch = noidClient.BindBatch(updateMetadata.noid_client(), BIND_BATCH_SIZE, BIND_BATCH_WAIT)
+    # Results wait here until their binds have been sent, so the log stays in order
+    pending = deque()
+
+    clean_staging(journal)
+    new_log = not Path(csv_output).exists() or Path(csv_output).stat().st_size == 0
+    with open(csv_output, 'a', newline='') as csvfile:
+        logwriter = csv.writer(csvfile)
+        if new_log:
+            logwriter.writerow(LOG_HEADER)
+
+        def write_settled():
+            while len(pending) > 0:
+                result = pending[0]
+                if result["bind_commands"] is not None:
+                    if result["arkid"] not in batch.statuses:
+                        return
+                    settle_binds(result, batch.statuses, batch, journal)
+                pending.popleft()
+                logwriter.writerow(result["row"])
+                if journal is not None:
+                    journal.finish(result["row"][0], result["row"][1])
+                if run_log is not None:
+                    run_log.write(result["events"])
+                summary["datasets"] += 1
+                if result["row"][1] == "failing":
+                    summary["failing"] += 1
+                    summary["recent_failures"].append(result["warnings"])
+            csvfile.flush()
+
+        def send_binds(send, *args):
+            # BindBatch sends a batch whenever it is full or due; log the batches that went out
+            events = []
+            try:
+                with runLog.stage(events, "", "bind batch") as measures:
+                    measures["arks"] = len(send(*args))
+            finally:
+                if run_log is not None and "http_requests" in events[0]:
+                    run_log.write(events)
+            for arkid, status in batch.take_purged().items():
+                if status != "ok":
+                    print(f"Failed to purge the NOID bindings of {arkid}: {status}")
+
+        if workers <= 1:
+            results = map(ingest, dataset_directories)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=apply_settings,
+                                           initargs=(current_settings(),))
+            # Results come back in submission order, which keeps the log ordered
+            results = poolMap.bounded_map(executor, ingest, dataset_directories, max(SUBMIT_AHEAD, workers))
+
+        try:
+            for result in results:
+                pending.append(result)
+                if result["bind_commands"] is not None:
+                    send_binds(batch.add, result["arkid"], result["bind_commands"])
+                elif result["row"][1] == "failing" and result.get("arkid") is not None:
+                    send_binds(batch.purge, result["arkid"], updateMetadata.BIND_ELEMENTS)
+                    updateMetadata.forget_binding(result["arkid"])
+                elif batch.due():
+                    send_binds(batch.flush)
+                write_settled()
+            send_binds(batch.flush)
+            write_settled()
+            send_binds(batch.flush) # Purges for datasets whose bind failed in the last batch
+        except KeyboardInterrupt:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if run_log is not None:
+                run_log.close()
+
+    summary["recent_failures"] = list(summary["recent_failures"])
+    return summary
@@ -0,0 +1,484 @@
+"""
+Benchmarks for the ingest pipeline. Run one with `python benchmark.py <name>`
+"""
+
+import aardvark
+import argparse
+import asyncPipeline
+import batchIngest
+import contextlib
+import datasetScan
+import fixtures
+import fixity
+import hashlib
+import io
+import metadataBackend
+import metadataFields
+import migrations
+import os
+import random
+import sanity_check
+import shapefileInspector
+import solrFeed
+import sys
+import tempfile
+import time
+import updateMetadata
+import zipBuilder
+import zipVerify
+import zipfile
+
+import xml.etree.ElementTree as ET
+
+from pathlib import Path
+from standInServer import StandInNoidServer, StandInSolrServer
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def report(name, seconds, count, unit="datasets") -> None:
+    print(f"{name:<32} {seconds:8.3f} s  {count / seconds:10.1f} {unit}/s")
+
+def bench_mint(args) -> None:
+    '''Per-dataset minting (one `mint+1` per dataset) against pooled minting (`mint+N`)'''
+    with StandInNoidServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        updateMetadata.NOID_URL = server.url
+
+        def mint_each():
+            updateMetadata.ARK_POOL_PATH = None
+            for _ in range(args.count):
+                updateMetadata.Identifier().mint()
+
+        def mint_pooled():
+            updateMetadata.ARK_POOL_PATH = Path(tmp) / "pool.sqlite"
+            updateMetadata.MINT_BATCH_SIZE = args.batch_size
+            for _ in range(args.count):
+                updateMetadata.Identifier().mint()
+
+        print(f"Minting {args.count} arkids, {args.latency * 1000:.0f} ms simulated NOID latency")
+        requests_before = server.request_count
+        report("per-dataset mint+1", timed(mint_each), args.count)
+        print(f"{'':<32} {server.request_count - requests_before} NOID requests")
+        requests_before = server.request_count
+        report(f"pooled mint+{args.batch_size}", timed(mint_pooled), args.count)
+        print(f"{'':<32} {server.request_count - requests_before} NOID requests")
+
+def legacy_classify(rootdir) -> tuple[int, Path]:
+    # What Dataset.fetch_dataset_from_directory() used to do: rglob("*"), then rglob again for the dataset
+    counts = {".gdb": 0, ".shp": 0, ".adf": 0}
+    for path in Path(rootdir).rglob("*"):
+        if path.suffix in counts:
+            counts[path.suffix] += 1
+    if counts[".shp"] == 1 and counts[".gdb"] == 0 and counts[".adf"] == 0:
+        return 1, next(Path(rootdir).rglob("*.shp"))
+    if counts[".gdb"] == 1 and counts[".shp"] == 0 and counts[".adf"] == 0:
+        return 2, next(Path(rootdir).rglob("*.gdb"))
+    return 0, None
+
+def bench_scan(args) -> None:
+    '''Dataset type detection: rglob twice against one os.scandir pass, cold and cached'''
+    with tempfile.TemporaryDirectory() as tmp:
+        directories = [Path(tmp) / f"Dataset_{number}" for number in range(args.datasets)]
+        for directory in directories:
+            fixtures.synthetic_geodatabase(directory, args.tables)
+        cache_path = Path(tmp) / "scan_cache.sqlite"
+
+        def scan_all(classify):
+            for directory in directories:
+                assert classify(directory)[0] == 2
+
+        print(f"{args.datasets} geodatabase datasets, {args.tables * 4} files each")
+        report("rglob (legacy)", timed(scan_all, legacy_classify), args.datasets)
+        report("scandir", timed(scan_all, datasetScan.classify), args.datasets)
+        report("scandir, cache cold", timed(scan_all, lambda d: datasetScan.classify(d, cache_path)), args.datasets)
+        report("scandir, cache warm", timed(scan_all, lambda d: datasetScan.classify(d, cache_path)), args.datasets)
+
+def legacy_zip(source_dir, zip_path, compression) -> None:
+    # What Dataset.ingest() used to do: ZipFile.write() every member, then reopen it for printdir()
+    with zipfile.ZipFile(zip_path, mode="w", compression=compression) as archive:
+        for member in Path(source_dir).rglob("*"):
+            archive.write(member, member.relative_to(source_dir))
+    with zipfile.ZipFile(zip_path) as archive, contextlib.redirect_stdout(io.StringIO()):
+        archive.printdir()
+
+def small_files(directory, count, kilobytes) -> None:
+    # `count` compressible files of about `kilobytes` each, like a dataset directory of many shapefile parts
+    directory.mkdir(parents=True)
+    text = "".join(f"{number},{random.random():.6f},{random.random():.6f}\n" for number in range(kilobytes * 40)).encode()
+    for number in range(count):
+        (directory / f"layer_{number // 5:04d}.{('dbf', 'prj', 'shp', 'shx', 'cpg')[number % 5]}").write_bytes(text[:kilobytes * 1024])
+
+def bench_zip(args) -> None:
+    '''Deliverable zipfile: zipfile.ZipFile on one thread against zipBuilder.build_zip, for one big raster or many small files'''
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "Dataset"
+        if args.small_files:
+            small_files(source, args.small_files, args.kilobytes)
+        else:
+            fixtures.synthetic_raster(source, args.megabytes)
+        size = sum(path.stat().st_size for path in source.rglob("*") if path.is_file()) / 1024 / 1024
+        print(f"Zipping {size:.0f} MB, {args.workers} workers")
+        for name, run in (("ZipFile stored (legacy)", lambda out: legacy_zip(source, out, zipfile.ZIP_STORED)),
+                          ("ZipFile deflated", lambda out: legacy_zip(source, out, zipfile.ZIP_DEFLATED)),
+                          ("build_zip", lambda out: zipBuilder.build_zip(source, out, workers=args.workers))):
+            output = Path(tmp) / f"{name.split()[0]}.zip"
+            seconds = timed(run, output)
+            report(name, seconds, size, "MB")
+            print(f"{'':<32} {output.stat().st_size / 1024 / 1024:.0f} MB archive")
+
+def bench_verify(args) -> None:
+    '''Checking a deliverable zipfile: reopen and printdir, ZipFile.testzip on one thread, and zipVerify.check_zip'''
+    with tempfile.TemporaryDirectory() as tmp:
+        source, output = Path(tmp) / "Dataset", Path(tmp) / "Dataset.zip"
+        fixtures.synthetic_raster(source, args.megabytes)
+        zipBuilder.build_zip(source, output)
+        size = output.stat().st_size / 1024 / 1024
+        print(f"Checking a {size:.0f} MB zip, {args.workers} workers")
+
+        def printdir():
+            with zipfile.ZipFile(output) as archive, contextlib.redirect_stdout(io.StringIO()):
+                archive.printdir()
+
+        def testzip():
+            with zipfile.ZipFile(output) as archive:
+                archive.testzip()
+
+        report("reopen and printdir (legacy)", timed(printdir), size, "MB")
+        report("ZipFile.testzip", timed(testzip), size, "MB")
+        report("check_zip with sources", timed(zipVerify.check_zip, output, source, args.workers), size, "MB")
+
+class InMemoryMetadata:
+    # Just enough of arcpy.metadata.Metadata for AGSLMetadata
+    def __init__(self, xml):
+        self.xml = xml
+        self.title = "Synthetic record"
+        self.credits = "UWM Libraries"
+
+    def save(self):
+        if isinstance(self.xml, bytes):
+            self.xml = self.xml.decode()
+
+def legacy_metadata_pass(xml) -> None:
+    # How often the old AGSLMetadata parsed and serialized one record through the pipeline
+    root = ET.fromstring(xml) # get_dataset_metadata
+    for _ in range(2): # save() after identifiers and after hours
+        root = ET.fromstring(ET.tostring(root))
+    ET.fromstring(ET.tostring(root)) # bind()
+    for _ in range(3): # main() printing fields
+        ET.fromstring(ET.tostring(root))
+
+def metadata_pass(xml) -> None:
+    record = updateMetadata.AGSLMetadata((xml, InMemoryMetadata(xml), ET.fromstring(xml)))
+    record.mint_identifier("77981/gmgs4x54g16")
+    with contextlib.redirect_stdout(io.StringIO()):
+        record.create_and_write_identifiers()
+        record.update_agsl_hours()
+    record.bind_params()
+    for field in ("metadataFileID", "identCode", "datasetURI"):
+        record.text(field)
+
+def bench_metadata(args) -> None:
+    '''Metadata handling for one dataset: parse and re-serialize everywhere against one live tree'''
+    xml = fixtures.arcgis_metadata_xml("DoorCounty_Lighthouses_2010", args.lineage)
+    print(f"{args.records} records of {len(xml) / 1024:.0f} KB ({args.lineage} lineage entries)")
+    report("parse per access (legacy)", timed(lambda: [legacy_metadata_pass(xml) for _ in range(args.records)]), args.records, "records")
+    report("parse once, cached fields", timed(lambda: [metadata_pass(xml) for _ in range(args.records)]), args.records, "records")
+
+def bench_fields(args) -> None:
+    '''Reading the title and credits of ArcGIS records with thumbnails: the whole tree against metadataFields'''
+    xml = fixtures.arcgis_metadata_xml("DoorCounty_Lighthouses_2010", args.lineage, thumbnail_kilobytes=args.thumbnail)
+    print(f"{args.records} records of {len(xml) / 1024:.0f} KB ({args.lineage} lineage entries, {args.thumbnail} KB thumbnail)")
+
+    def whole_tree():
+        for _ in range(args.records):
+            root = ET.fromstring(xml)
+            root.findtext(metadataBackend.SIDECAR_FIELDS["title"]), root.findtext(metadataBackend.SIDECAR_FIELDS["credits"])
+
+    report("whole tree (legacy)", timed(whole_tree), args.records, "records")
+    report("metadataFields.extract", timed(lambda: [metadataFields.extract(xml, metadataBackend.SIDECAR_FIELDS)
+                                                    for _ in range(args.records)]), args.records, "records")
+
+def bench_shapefiles(args) -> None:
+    '''Shapefile extent and schema: reading the whole .shp, .shx and .dbf against memory-mapped headers'''
+    with tempfile.TemporaryDirectory() as tmp:
+        shapefiles = [fixtures.synthetic_shapefile(Path(tmp) / f"Dataset_{number}", f"Dataset_{number}", args.kilobytes)
+                      for number in range(args.datasets)]
+
+        def read_whole():
+            for shp in shapefiles:
+                for suffix in (".shp", ".shx", ".dbf", ".prj"):
+                    shp.with_suffix(suffix).read_bytes()
+
+        def inspect_all():
+            for shp in shapefiles:
+                assert not shapefileInspector.inspect(shp)["errors"]
+
+        print(f"{args.datasets} point shapefiles of {args.kilobytes} KB")
+        report("whole files", timed(read_whole), args.datasets, "shapefiles")
+        report("shapefileInspector.inspect", timed(inspect_all), args.datasets, "shapefiles")
+
+def synthetic_fileserver(root, records) -> None:
+    # A fileserver with `records` datasets split across the rights directories, each with its metadata record
+    for directory in ["metadata"] + updateMetadata.RIGHTS:
+        (root / directory).mkdir(parents=True)
+    for number in range(records):
+        name = f"gmgs{number:07d}"
+        (root / updateMetadata.RIGHTS[number % 2] / name).mkdir()
+        (root / "metadata" / f"{name}_ISO.xml").touch()
+
+def legacy_sanity_check(root) -> None:
+    # What sanity_check.py used to do: exists() and is_dir() probes per record, then everything listed again to count
+    public_path, restricted_path, metadata_path = root / "public", root / "restricted-uw-system", root / "metadata"
+    for file in metadata_path.iterdir():
+        arkid = file.name[:11]
+        if (public_path / arkid).exists() and (public_path / arkid).is_dir():
+            continue
+        elif (restricted_path / arkid).exists() and (restricted_path / arkid).is_dir():
+            continue
+    for rights_path in (public_path, restricted_path):
+        for data_dir in rights_path.iterdir():
+            data_dir.is_dir()
+            (metadata_path / f"{data_dir.name}_ISO.xml").exists()
+    for directory in (metadata_path, public_path, restricted_path):
+        sum(1 for _ in directory.iterdir())
+
+def bench_sanity(args) -> None:
+    '''Fileserver consistency check: per-record stat probes against one scandir per directory'''
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_fileserver(Path(tmp), args.records)
+        print(f"{args.records} datasets and metadata records")
+        report("exists() probes (legacy)", timed(legacy_sanity_check, Path(tmp)), args.records, "records")
+        report("scandir and sets", timed(sanity_check.check, Path(tmp)), args.records, "records")
+
+def synthetic_iso_fileserver(root, records) -> None:
+    # synthetic_fileserver, with each metadata record an ISO export of a synthetic ArcGIS record
+    synthetic_fileserver(root, records)
+    arcgis = ET.fromstring(fixtures.arcgis_metadata_xml("Synthetic_Aardvark", lineage_steps=0))
+    for number in range(records):
+        name = f"gmgs{number:07d}"
+        ET.SubElement(arcgis, "mdFileID").text = f"ark:/77981/{name}"
+        (root / "metadata" / f"{name}_ISO.xml").write_bytes(ET.tostring(metadataBackend.iso_record(arcgis)))
+        arcgis.remove(arcgis.find("mdFileID"))
+
+def bench_aardvark(args) -> None:
+    '''Aardvark JSON for a whole fileserver: one process against the process pool'''
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_iso_fileserver(Path(tmp), args.records)
+        print(f"{args.records} ISO records")
+        jsonl = Path(tmp) / "aardvark.jsonl"
+        report("one process", timed(aardvark.generate, Path(tmp), jsonl, 1), args.records, "records")
+        report(f"{args.workers} worker processes", timed(aardvark.generate, Path(tmp), jsonl, args.workers), args.records, "records")
+
+def bench_feed(args) -> None:
+    '''Solr feed of a whole catalog, then a nightly feed after a few records changed'''
+    with tempfile.TemporaryDirectory() as tmp, StandInSolrServer() as solr:
+        root, ledger = Path(tmp) / "web", Path(tmp) / "feed.sqlite"
+        synthetic_iso_fileserver(root, args.records)
+        changed = max(1, args.records * args.changed_percent // 100)
+        print(f"{args.records} ISO records, {changed} changed between feeds")
+        report("full feed", timed(solrFeed.feed, root, ledger, solr.url, None, args.batch_size, args.workers, True),
+               args.records, "records")
+        for number in range(changed):
+            path = root / "metadata" / f"gmgs{number * (args.records // changed):07d}_ISO.xml"
+            path.write_text(path.read_text().replace("Synthetic record", "Edited record"))
+        report("incremental feed", timed(solrFeed.feed, root, ledger, solr.url, None, args.batch_size, args.workers),
+               args.records, "records")
+        print(f"{len(solr.documents)} documents in the stand-in core after {solr.request_count} update requests")
+
+def bench_fixity(args) -> None:
+    '''Fixity audit of a fileserver of zips, first hashing everything, then again with nothing changed'''
+    with tempfile.TemporaryDirectory() as tmp:
+        root, ledger = Path(tmp) / "web", Path(tmp) / "fixity.sqlite"
+        data = os.urandom(int(args.megabytes * 1024 * 1024))
+        for number in range(args.datasets):
+            ark_dir = root / "public" / f"gmgs{number:07d}"
+            ark_dir.mkdir(parents=True)
+            zip_data = number.to_bytes(4, "little") + data
+            (ark_dir / "Synthetic.zip").write_bytes(zip_data)
+            fixity.update_manifest(ark_dir / fixity.MANIFEST_NAME, {"Synthetic.zip": hashlib.sha256(zip_data).hexdigest()})
+        megabytes = args.datasets * args.megabytes
+        print(f"{args.datasets} ARK directories, {megabytes:.0f} MB of zips, {args.workers} workers")
+        report("full audit", timed(fixity.audit, root, ledger, args.workers), megabytes, "MB")
+        report("incremental audit", timed(fixity.audit, root, ledger, args.workers), args.datasets, "files")
+
+def bench_migrate(args) -> None:
+    '''AGSL hours changed across an archive: a Dataset and update_agsl_hours() per dataset against the migration runner'''
+    updateMetadata.METADATA_BACKEND = "xml"
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = fixtures.synthetic_archive(Path(tmp) / "legacy", args.datasets, ("shapefile",), 0.01)
+        archive = fixtures.synthetic_archive(Path(tmp) / "archive", args.datasets, ("shapefile",), 0.01)
+        print(f"{args.datasets} shapefiles, {args.workers} workers")
+
+        def legacy_run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                for directory in legacy:
+                    updateMetadata.Dataset(directory).metadata.update_agsl_hours()
+
+        def migrate(dry_run):
+            results = list(migrations.run(archive, migrations.AGSL_HOURS, dry_run, args.workers))
+            if any(result["error"] for result in results):
+                raise Exception(next(result["error"] for result in results if result["error"]))
+
+        report("Dataset per record (legacy)", timed(legacy_run), args.datasets)
+        report("migration, dry run", timed(migrate, True), args.datasets)
+        report("migration", timed(migrate, False), args.datasets)
+        report("migration, nothing to change", timed(migrate, False), args.datasets)
+
+@contextlib.contextmanager
+def quiet():
+    # Silence stdout at the file descriptor, so worker processes are quiet too
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+def megabytes_in(directories) -> float:
+    return sum(path.stat().st_size for directory in directories for path in directory.rglob("*") if path.is_file()) / 1024 / 1024
+
+def bench_ingest(args) -> None:
+    '''End-to-end ingest of synthetic datasets against a stand-in NOID server and a temporary fileserver'''
+    kinds = args.kinds.split(",")
+    if "geodatabase" in kinds and args.backend != "arcpy":
+        print("Geodatabase metadata can only be read with the arcpy metadata backend")
+        return
+    with StandInNoidServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        web = Path(tmp) / "web"
+        for directory in ["metadata"] + updateMetadata.RIGHTS:
+            (web / directory).mkdir(parents=True)
+        updateMetadata.NOID_URL = server.url
+        updateMetadata.FILE_SERVER_PATH = web
+        updateMetadata.METADATA_BACKEND = args.backend
+        updateMetadata.ARK_POOL_PATH = Path(tmp) / "pool.sqlite"
+
+        staged = fixtures.synthetic_archive(Path(tmp) / "staged", args.datasets, kinds, args.megabytes, restricted_every=4)
+        batched = fixtures.synthetic_archive(Path(tmp) / "batched", args.datasets, kinds, args.megabytes, restricted_every=4)
+        pipelined = fixtures.synthetic_archive(Path(tmp) / "pipelined", args.datasets, kinds, args.megabytes, restricted_every=4)
+        size = megabytes_in(staged)
+        print(f"{args.datasets} datasets ({', '.join(kinds)}), {size:.0f} MB, {args.backend} metadata backend, "
+              f"{args.latency * 1000:.0f} ms simulated NOID latency")
+
+        # One dataset at a time in this process, timing every stage
+        stages = {"dataset": 0.0, "minted": 0.0}
+        stages.update((stage, 0.0) for stage, _, _ in batchIngest.STAGES)
+        with quiet():
+            for directory in staged:
+                start = time.perf_counter()
+                dataset = updateMetadata.Dataset(directory)
+                stages["dataset"] += time.perf_counter() - start
+                stages["minted"] += timed(dataset.metadata.mint_identifier)
+                dataset.set_fileserver_paths()
+                for stage, _, run in batchIngest.STAGES:
+                    stages[stage] += timed(run, dataset)
+        for stage, seconds in stages.items():
+            report(f"stage: {stage}", seconds, args.datasets)
+        report("stage: zipped", stages["zipped"], size, "MB")
+        report("all stages", sum(stages.values()), args.datasets)
+        report("all stages", sum(stages.values()), size, "MB")
+
+        # The whole batch through run_batch(), with worker processes and batched binds
+        with quiet():
+            seconds = timed(batchIngest.run_batch, batched, Path(tmp) / "log.csv", args.workers)
+        report(f"run_batch, {args.workers} workers", seconds, args.datasets)
+        report(f"run_batch, {args.workers} workers", seconds, size, "MB")
+
+        # The whole batch through the asyncio pipeline
+        with quiet():
+            seconds = timed(asyncPipeline.run_pipeline, pipelined, Path(tmp) / "log.csv")
+        report("asyncio pipeline", seconds, args.datasets)
+        report("asyncio pipeline", seconds, size, "MB")
+        failing = (Path(tmp) / "log.csv").read_text().count(",failing,")
+        if failing:
+            print(f"{failing} datasets failed, see the log")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    mint = benchmarks.add_parser("mint", help=bench_mint.__doc__)
+    mint.add_argument("--count", type=int, default=900)
+    mint.add_argument("--batch-size", type=int, default=updateMetadata.MINT_BATCH_SIZE)
+    mint.add_argument("--latency", type=float, default=0.02, help="seconds added to every NOID request")
+    mint.set_defaults(run=bench_mint)
+
+    scan = benchmarks.add_parser("scan", help=bench_scan.__doc__)
+    scan.add_argument("--datasets", type=int, default=20)
+    scan.add_argument("--tables", type=int, default=1000, help="tables in each synthetic geodatabase")
+    scan.set_defaults(run=bench_scan)
+
+    zip_parser = benchmarks.add_parser("zip", help=bench_zip.__doc__)
+    zip_parser.add_argument("--megabytes", type=int, default=512, help="size of the synthetic raster")
+    zip_parser.add_argument("--small-files", type=int, default=0, help="zip this many small files instead of a raster")
+    zip_parser.add_argument("--kilobytes", type=int, default=256, help="size of each small file")
+    zip_parser.add_argument("--workers", type=int, default=zipBuilder.WORKERS)
+    zip_parser.set_defaults(run=bench_zip)
+
+    verify = benchmarks.add_parser("verify", help=bench_verify.__doc__)
+    verify.add_argument("--megabytes", type=int, default=512, help="size of the synthetic raster")
+    verify.add_argument("--workers", type=int, default=zipVerify.WORKERS)
+    verify.set_defaults(run=bench_verify)
+
+    metadata = benchmarks.add_parser("metadata", help=bench_metadata.__doc__)
+    metadata.add_argument("--records", type=int, default=200)
+    metadata.add_argument("--lineage", type=int, default=500, help="geoprocessing history entries per record")
+    metadata.set_defaults(run=bench_metadata)
+
+    fields = benchmarks.add_parser("fields", help=bench_fields.__doc__)
+    fields.add_argument("--records", type=int, default=200)
+    fields.add_argument("--lineage", type=int, default=200, help="geoprocessing history entries per record")
+    fields.add_argument("--thumbnail", type=int, default=1024, help="kilobytes of thumbnail per record")
+    fields.set_defaults(run=bench_fields)
+
+    shapefiles = benchmarks.add_parser("shapefiles", help=bench_shapefiles.__doc__)
+    shapefiles.add_argument("--datasets", type=int, default=900)
+    shapefiles.add_argument("--kilobytes", type=int, default=1024, help="size of each synthetic .shp")
+    shapefiles.set_defaults(run=bench_shapefiles)
+
+    sanity = benchmarks.add_parser("sanity", help=bench_sanity.__doc__)
+    sanity.add_argument("--records", type=int, default=100000)
+    sanity.set_defaults(run=bench_sanity)
+
+    aardvark_parser = benchmarks.add_parser("aardvark", help=bench_aardvark.__doc__)
+    aardvark_parser.add_argument("--records", type=int, default=5000)
+    aardvark_parser.add_argument("--workers", type=int, default=aardvark.WORKERS)
+    aardvark_parser.set_defaults(run=bench_aardvark)
+
+    feed = benchmarks.add_parser("feed", help=bench_feed.__doc__)
+    feed.add_argument("--records", type=int, default=5000)
+    feed.add_argument("--changed-percent", type=int, default=1)
+    feed.add_argument("--batch-size", type=int, default=solrFeed.BATCH_SIZE)
+    feed.add_argument("--workers", type=int, default=aardvark.WORKERS)
+    feed.set_defaults(run=bench_feed)
+
+    migrate = benchmarks.add_parser("migrate", help=bench_migrate.__doc__)
+    migrate.add_argument("--datasets", type=int, default=2000)
+    migrate.add_argument("--workers", type=int, default=migrations.WORKERS)
+    migrate.set_defaults(run=bench_migrate)
+
+    fixity_parser = benchmarks.add_parser("fixity", help=bench_fixity.__doc__)
+    fixity_parser.add_argument("--datasets", type=int, default=200)
+    fixity_parser.add_argument("--megabytes", type=float, default=2, help="size of each synthetic zip")
+    fixity_parser.add_argument("--workers", type=int, default=fixity.WORKERS)
+    fixity_parser.set_defaults(run=bench_fixity)
+
+    ingest = benchmarks.add_parser("ingest", help=bench_ingest.__doc__)
+    ingest.add_argument("--datasets", type=int, default=40)
+    ingest.add_argument("--megabytes", type=float, default=4, help="size of each synthetic dataset")
+    ingest.add_argument("--kinds", default="shapefile,arcgrid", help=f"comma-separated, from {', '.join(fixtures.KINDS)}")
+    ingest.add_argument("--backend", default="xml", help="metadata backend (geodatabases need arcpy)")
+    ingest.add_argument("--latency", type=float, default=0.02, help="seconds added to every NOID request")
+    ingest.add_argument("--workers", type=int, default=batchIngest.WORKERS)
+    ingest.set_defaults(run=bench_ingest)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
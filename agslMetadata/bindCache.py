@@ -0,0 +1,173 @@
+"""
+The values last bound in NOID for every arkid, so a re-bind only sends the elements that changed.
+Run `python bindCache.py refresh <cache>` to reload it from NOID, or `python bindCache.py rebind-urls <cache>`
+to re-bind the URLs of every cached arkid after a URL change.
+"""
+
+import argparse
+import ingestJournal
+import noidClient
+import sqlite3
+
+from datetime import datetime
+from pathlib import Path
+
+# Bound on every change, but never a change by itself
+STAMP_ELEMENT = "meta-when"
+
+# The elements built from identifier_urls(), which rebind-urls recomputes
+URL_ELEMENTS = ["where", "meta-uri", "download"]
+
+# arkids per `fetch` POST when refreshing
+FETCH_BATCH_SIZE = 500
+
+class BindCache:
+    '''SQLite table of (arkid, element, value), written only once NOID has confirmed the bind
+    - Every connection is short-lived, so worker processes can all read the same file
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS bindings (
+                arkid TEXT NOT NULL,
+                element TEXT NOT NULL,
+                value TEXT NOT NULL,
+                bound_at TEXT NOT NULL,
+                PRIMARY KEY (arkid, element))""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    def get(self, arkid) -> dict[str, str]:
+        with self._connect() as connection:
+            rows = connection.execute("SELECT element, value FROM bindings WHERE arkid = ?", (arkid,)).fetchall()
+        return dict(rows)
+
+    def get_all(self) -> dict[str, dict[str, str]]:
+        bindings = {}
+        with self._connect() as connection:
+            for arkid, element, value in connection.execute("SELECT arkid, element, value FROM bindings ORDER BY arkid"):
+                bindings.setdefault(arkid, {})[element] = value
+        return bindings
+
+    def store(self, arkid, bind_params) -> None:
+        # Remember elements NOID now has for arkid; the ones not in bind_params are left as they were
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO bindings VALUES (?, ?, ?, ?)",
+                                   [(arkid, element, str(value).strip(), now()) for element, value in bind_params.items()])
+
+    def forget(self, arkid) -> None:
+        # After a purge NOID has nothing for arkid
+        with self._connect() as connection:
+            connection.execute("DELETE FROM bindings WHERE arkid = ?", (arkid,))
+
+    def replace(self, bindings) -> None:
+        # {arkid: {element: value}} exactly as NOID has them
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM bindings WHERE arkid = ?", [(arkid,) for arkid in bindings])
+            connection.executemany("INSERT INTO bindings VALUES (?, ?, ?, ?)",
+                                   [(arkid, element, value, now()) for arkid, elements in bindings.items()
+                                    for element, value in elements.items()])
+
+    def refresh(self, client, arkids, elements, batch_size=FETCH_BATCH_SIZE) -> int:
+        '''Reload the cache for arkids from NOID, one `fetch` POST per batch_size arkids
+        - Only elements are kept, e.g. updateMetadata.BIND_ELEMENTS
+        - Returns the number of arkids NOID had bindings for
+        '''
+        elements = set(elements)
+        found = 0
+        for start in range(0, len(arkids), batch_size):
+            fetched = client.fetch(arkids[start:start + batch_size])
+            bindings = {arkid: {element: value for element, value in values.items() if element in elements}
+                        for arkid, values in fetched.items()}
+            self.replace(bindings)
+            found += sum(1 for values in bindings.values() if values)
+        return found
+
+def now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
+
+def changed_params(previous, bind_params) -> dict[str, str]:
+    '''The bind_params whose values differ from previous, the values NOID already has
+    - meta-when goes with them if anything else changed, and is left out if nothing did
+    '''
+    changed = {element: value for element, value in bind_params.items()
+               if element != STAMP_ELEMENT and previous.get(element) != str(value).strip()}
+    if changed and STAMP_ELEMENT in bind_params:
+        changed[STAMP_ELEMENT] = bind_params[STAMP_ELEMENT]
+    return changed
+
+def url_params(arkid, bound, identifier_urls) -> dict[str, str]:
+    # The URL elements identifier_urls (updateMetadata's) builds today for an arkid bound with `bound`, or {} if they can't be worked out
+    if "rights" not in bound or "download" not in bound:
+        return {}
+    altTitle = bound["download"].rsplit("/", 1)[-1].removesuffix(".zip")
+    urls = identifier_urls(arkid, bound["rights"], altTitle)
+    return {"where": urls["ark_URI"], "meta-uri": urls["metadata_URL"], "download": urls["download_URI"],
+            STAMP_ELEMENT: now()}
+
+def rebind_urls(cache, client, identifier_urls, dry_run=False, max_commands=450) -> dict:
+    '''Re-bind the URL elements of every cached arkid whose URLs changed, in batched POSTs
+    - Sends only the changed elements (and meta-when) and nothing for arkids whose URLs are current
+    - Returns counts of the arkids checked, re-bound and failed, and the commands sent
+    '''
+    summary = {"checked": 0, "rebound": 0, "failed": {}, "commands": 0}
+    pending = {}
+
+    def settle(statuses):
+        for arkid, status in statuses.items():
+            if status == "ok":
+                cache.store(arkid, pending.pop(arkid))
+                summary["rebound"] += 1
+            else:
+                pending.pop(arkid)
+                summary["failed"][arkid] = status
+
+    with noidClient.BindBatch(client, max_commands, max_wait=float("inf")) as batch:
+        for arkid, bound in cache.get_all().items():
+            summary["checked"] += 1
+            changed = changed_params(bound, url_params(arkid, bound, identifier_urls))
+            if not changed:
+                continue
+            summary["commands"] += len(changed)
+            if dry_run:
+                print("\n".join(noidClient.bind_commands(arkid, changed)))
+                continue
+            pending[arkid] = changed
+            settle(batch.set(arkid, changed))
+        settle(batch.flush())
+    return summary
+
+def main() -> None:
+    # Imported here: updateMetadata imports this module
+    import updateMetadata
+
+    parser = argparse.ArgumentParser(description="Keep the NOID bind cache in step with NOID")
+    commands = parser.add_subparsers(dest="command", required=True)
+    refresh = commands.add_parser("refresh", help="reload the cache from NOID with bulk fetches")
+    refresh.add_argument("cache", type=Path)
+    refresh.add_argument("--journal", type=Path, help="also load every arkid in this ingest journal")
+    rebind = commands.add_parser("rebind-urls", help="re-bind where, meta-uri and download wherever they changed")
+    rebind.add_argument("cache", type=Path)
+    rebind.add_argument("--dry-run", action="store_true", help="print the commands instead of sending them")
+    parser.add_argument("--noid-url", default=updateMetadata.NOID_URL)
+    args = parser.parse_args()
+
+    cache = BindCache(args.cache)
+    client = noidClient.get_client(args.noid_url)
+    if args.command == "refresh":
+        arkids = set(cache.get_all())
+        if args.journal is not None:
+            arkids.update(ingestJournal.IngestJournal(args.journal).arkids())
+        found = cache.refresh(client, sorted(arkids), updateMetadata.BIND_ELEMENTS)
+        print(f"Refreshed {len(arkids)} arkids, {found} of them bound in NOID")
+    else:
+        summary = rebind_urls(cache, client, updateMetadata.identifier_urls, args.dry_run)
+        print(f"{summary['checked']} arkids checked, {summary['commands']} commands for the changed URLs, "
+              f"{summary['rebound']} re-bound, {len(summary['failed'])} failed")
+        for arkid, status in summary["failed"].items():
+            print(f"Failed: {arkid}: {status}")
+
+if __name__ == "__main__":
+    main()
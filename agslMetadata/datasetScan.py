@@ -0,0 +1,101 @@
+"""
+Single-pass detection of the dataset type inside a dataset directory
+"""
+
+import json
+import os
+import sqlite3
+
+from pathlib import Path
+
+# Dataset types, as used by updateMetadata.Dataset.datatype
+ERROR = 0
+SHAPEFILE = 1
+FILE_GEODATABASE = 2
+ARCGRID = 3
+MULTIPLE = 4
+
+def classify_directory(rootdir) -> tuple[int, Path, list[str]]:
+    '''Find the dataset in a dataset directory with one os.scandir walk
+    - Returns a tuple with the dataset type, the dataset path and the directories that were listed
+    - The dataset path is the .shp, the .gdb or the ArcGRID folder (None for types 0 and 4)
+    - Never descends into a .gdb, and stops as soon as a second dataset shows up (type 4)
+    '''
+    shapefiles = []
+    geodatabases = []
+    grids = set() # ArcGRID rasters are folders full of .adf files
+    listed = []
+
+    stack = [str(rootdir)]
+    while stack:
+        directory = stack.pop()
+        listed.append(directory)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                suffix = os.path.splitext(entry.name)[1].lower()
+                if suffix == ".gdb":
+                    geodatabases.append(entry.path)
+                elif entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif suffix == ".shp":
+                    shapefiles.append(entry.path)
+                elif suffix == ".adf":
+                    grids.add(directory)
+                else:
+                    continue
+                if len(shapefiles) + len(geodatabases) + len(grids) > 1:
+                    return MULTIPLE, None, listed
+
+    if len(shapefiles) == 1:
+        return SHAPEFILE, Path(shapefiles[0]), listed
+    elif len(geodatabases) == 1:
+        return FILE_GEODATABASE, Path(geodatabases[0]), listed
+    elif len(grids) == 1:
+        return ARCGRID, Path(grids.pop()), listed
+    else:
+        return ERROR, None, listed
+
+class ScanCache:
+    '''Remembers classify_directory() results between runs
+    - A result is reused while every directory listed to produce it still has the same mtime
+    - Kept in SQLite so worker processes can share it
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS scans (
+                path TEXT PRIMARY KEY,
+                datatype INTEGER NOT NULL,
+                dataset TEXT,
+                mtimes TEXT NOT NULL)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    def classify(self, rootdir) -> tuple[int, Path]:
+        rootdir = str(Path(rootdir))
+        with self._connect() as connection:
+            row = connection.execute("SELECT datatype, dataset, mtimes FROM scans WHERE path = ?", (rootdir,)).fetchone()
+        if row is not None and unchanged(json.loads(row[2])):
+            return row[0], None if row[1] is None else Path(row[1])
+
+        datatype, dataset, listed = classify_directory(rootdir)
+        mtimes = {directory: os.stat(directory).st_mtime_ns for directory in listed}
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?)",
+                               (rootdir, datatype, None if dataset is None else str(dataset), json.dumps(mtimes)))
+        return datatype, dataset
+
+def unchanged(mtimes) -> bool:
+    try:
+        return all(os.stat(directory).st_mtime_ns == mtime for directory, mtime in mtimes.items())
+    except OSError:
+        return False
+
+def classify(rootdir, cache_path=None) -> tuple[int, Path]:
+    # classify_directory(), going through the cache when there is one
+    if cache_path is None:
+        datatype, dataset, _ = classify_directory(rootdir)
+        return datatype, dataset
+    return ScanCache(cache_path).classify(rootdir)
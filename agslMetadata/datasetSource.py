@@ -0,0 +1,74 @@
+"""
+Where a batch gets its dataset directories: a manifest CSV like datalist_public.csv, or one level of an archive directory.
+Manifests are read lazily, so the first dataset starts as soon as its row is read and memory doesn't grow with the archive.
+A directory level is listed once and sorted by name, so batches over it run (and resume) in the same order on every machine.
+"""
+
+import csv
+import fnmatch
+import os
+import updateMetadata
+
+from pathlib import PureWindowsPath, Path
+
+# Manifest columns when the manifest has no header row, like the datalists listdatasets.py writes
+MANIFEST_COLUMNS = ["name", "path", "id"]
+
+def rights_in_path(path) -> str:
+    # The rights directory a dataset sits under in the archive (e.g. ...\GeoBlacklight\public\<dataset>), or None
+    for part in reversed(PureWindowsPath(path).parts[:-1]):
+        if part.lower() in updateMetadata.RIGHTS:
+            return part.lower()
+    return None
+
+def manifest_rows(manifest_path):
+    '''Stream the rows of a manifest CSV as dicts with name, path, id and rights
+    - Without a header row the columns are name, path and optionally id
+    - A header row can name the columns (name, path, id or arkid, rights) in any order
+    - rights comes from the rights column, or else from the path
+    '''
+    with open(manifest_path, newline="", encoding="utf-8-sig") as manifest:
+        reader = csv.reader(manifest, skipinitialspace=True)
+        columns = MANIFEST_COLUMNS
+        for number, cells in enumerate(reader):
+            cells = [cell.strip() for cell in cells]
+            if not any(cells):
+                continue
+            if number == 0 and cells[0].lower() == "name":
+                columns = ["id" if cell.lower() == "arkid" else cell.lower() for cell in cells]
+                continue
+            row = dict(zip(columns, cells))
+            row.setdefault("id", "")
+            row.setdefault("name", PureWindowsPath(row.get("path", "")).name)
+            row["rights"] = row.get("rights") or rights_in_path(row.get("path", ""))
+            yield row
+
+def directory_rows(root):
+    # Stream the dataset directories directly under root, sorted by name rather than in scandir order, which varies by file system
+    rights = rights_in_path(Path(root) / "dataset")
+    with os.scandir(root) as entries:
+        directories = sorted((entry.name, entry.path) for entry in entries if entry.is_dir())
+    for name, path in directories:
+        yield {"name": name, "path": path, "id": "", "rights": rights}
+
+def select(rows, rights=None, name_pattern=None, skip_identified=False, skipped=None):
+    '''The dataset directories of the rows that pass every filter, as Paths
+    - rights: only rows in one of these rights directories
+    - name_pattern: only rows whose name matches this glob, e.g. "Milwaukee_*"
+    - skip_identified: leave out rows that already have an ID
+    - skipped: a dict that counts the rows left out, by reason
+    '''
+    skipped = {} if skipped is None else skipped
+    for row in rows:
+        if not row.get("path") or row["path"] == "Undefined":
+            reason = "no path"
+        elif rights and row["rights"] not in rights:
+            reason = "rights"
+        elif name_pattern and not fnmatch.fnmatch(row["name"], name_pattern):
+            reason = "name"
+        elif skip_identified and row["id"]:
+            reason = "has an ID"
+        else:
+            yield Path(row["path"])
+            continue
+        skipped[reason] = skipped.get(reason, 0) + 1
@@ -0,0 +1,191 @@
+"""
+SHA-256 fixity for what ingest publishes. Every ARK directory gets a BagIt-style manifest-sha256.txt listing its zip
+and its ISO record, and `python fixity.py --ledger <ledger.sqlite>` re-verifies the whole fileserver.
+"""
+
+import argparse
+import hashlib
+import os
+import poolMap
+import sqlite3
+import time
+import updateMetadata
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+MANIFEST_NAME = "manifest-sha256.txt"
+
+# Where the audit remembers what it verified, so the next audit only hashes files that changed
+FIXITY_LEDGER_PATH = None
+
+# Bytes read at a time while hashing
+CHUNK_SIZE = 8 * 1024 * 1024
+
+WORKERS = os.cpu_count() or 1
+
+def read_manifest(manifest_path) -> dict[str, str]:
+    # {path relative to the manifest's directory: sha256}
+    entries = {}
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line in manifest:
+            if line.strip():
+                digest, _, path = line.rstrip("\n").partition("  ")
+                entries[path] = digest
+    return entries
+
+def update_manifest(manifest_path, entries) -> None:
+    '''Add or replace entries ({relative path: sha256}) in a manifest, creating it if needed
+    - Written beside the manifest and renamed over it, so it is never half written
+    '''
+    manifest_path = Path(manifest_path)
+    merged = read_manifest(manifest_path) if manifest_path.exists() else {}
+    merged.update(entries)
+    temporary = manifest_path.with_name(f".{manifest_path.name}.tmp")
+    temporary.write_text("".join(f"{digest}  {path}\n" for path, digest in sorted(merged.items())), encoding="utf-8")
+    os.replace(temporary, manifest_path)
+
+def metadata_entry(assignedName) -> str:
+    # The ISO record lives in the metadata directory, two levels up from <rights>/<assigned name>/
+    return f"../../metadata/{assignedName}_ISO.xml"
+
+def hash_file(path) -> tuple[str, int, int, str]:
+    '''SHA-256 of one file in CHUNK_SIZE reads. Runs in the worker processes
+    - Returns (path, size, mtime_ns, sha256), taking the stat before reading so a file changing meanwhile is re-hashed next time
+    - sha256 is None if the file can't be read
+    '''
+    try:
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                digest.update(chunk)
+        return path, stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+    except OSError:
+        return path, None, None, None
+
+class FixityLedger:
+    '''Size, mtime and SHA-256 of every file as last verified
+    - A file whose size and mtime match its entry, and whose manifest digest matches the entry's, is not read again
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                verified_at TEXT NOT NULL)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    def entries(self) -> dict[str, tuple[int, int, str]]:
+        with self._connect() as connection:
+            rows = connection.execute("SELECT path, size, mtime_ns, sha256 FROM files").fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def record(self, rows) -> None:
+        # rows of (path, size, mtime_ns, sha256)
+        verified_at = datetime.now().replace(microsecond=0).isoformat()
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", [(*row, verified_at) for row in rows])
+
+def ark_directories(file_server_path, rights):
+    # Every directory in every rights directory, from one listing of each
+    for rights_name in rights:
+        try:
+            with os.scandir(Path(file_server_path) / rights_name) as entries:
+                yield from sorted(Path(entry.path) for entry in entries if entry.is_dir())
+        except FileNotFoundError:
+            continue
+
+def expected_digests(file_server_path, rights=None) -> tuple[dict[str, str], list[str]]:
+    '''Every file the manifests list, with the digest they expect
+    - Reads one manifest per ARK directory
+    - Returns {absolute path: sha256} and the ARK directories without a manifest
+    '''
+    expected, unmanifested = {}, []
+    for ark_dir in ark_directories(file_server_path, updateMetadata.RIGHTS if rights is None else rights):
+        try:
+            entries = read_manifest(ark_dir / MANIFEST_NAME)
+        except FileNotFoundError:
+            unmanifested.append(str(ark_dir))
+            continue
+        for relative, digest in entries.items():
+            expected[os.path.normpath(ark_dir / relative)] = digest
+    return expected, unmanifested
+
+def audit(file_server_path, ledger_path, workers=WORKERS, full=False) -> dict:
+    '''Check every file in every manifest against its SHA-256
+    - Files unchanged since they last verified (same size, mtime and expected digest) are skipped unless full
+    - The rest are hashed on a process pool, biggest first
+    - Returns counts and the files that are missing or don't match
+    '''
+    ledger = FixityLedger(ledger_path)
+    verified = {} if full else ledger.entries()
+    expected, unmanifested = expected_digests(file_server_path)
+    summary = {"files": len(expected), "skipped": 0, "hashed": 0, "bytes_hashed": 0, "missing": [], "mismatched": [],
+               "unmanifested": unmanifested}
+
+    to_hash = []
+    for path, digest in expected.items():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            summary["missing"].append(path)
+            continue
+        if verified.get(path) == (stat.st_size, stat.st_mtime_ns, digest):
+            summary["skipped"] += 1
+        else:
+            to_hash.append((stat.st_size, path))
+    to_hash = [path for _, path in sorted(to_hash, reverse=True)]
+
+    def results():
+        if workers > 1 and len(to_hash) > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                yield from poolMap.bounded_map(executor, hash_file, to_hash, 4 * workers)
+        else:
+            yield from map(hash_file, to_hash)
+
+    matched = []
+    for path, size, mtime_ns, digest in results():
+        if digest is None:
+            summary["missing"].append(path)
+            continue
+        summary["hashed"] += 1
+        summary["bytes_hashed"] += size
+        if digest == expected[path]:
+            matched.append((path, size, mtime_ns, digest))
+        else:
+            summary["mismatched"].append(path)
+        if len(matched) >= 1000:
+            ledger.record(matched)
+            matched = []
+    ledger.record(matched)
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verify every file on the fileserver against its ARK directory's manifest")
+    parser.add_argument("--file-server-path", type=Path, default=updateMetadata.FILE_SERVER_PATH)
+    parser.add_argument("--ledger", type=Path, default=FIXITY_LEDGER_PATH, required=FIXITY_LEDGER_PATH is None)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--full", action="store_true", help="hash every file, even the ones that haven't changed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = audit(args.file_server_path, args.ledger, args.workers, args.full)
+    print(f"{summary['files']} files: {summary['hashed']} hashed ({summary['bytes_hashed'] / 1024 / 1024:.1f} MB), "
+          f"{summary['skipped']} unchanged since they were verified, in {time.perf_counter() - start:.2f} s")
+    for path in summary["mismatched"]:
+        print(f"Checksum mismatch: {path}")
+    for path in summary["missing"]:
+        print(f"Missing: {path}")
+    for path in summary["unmanifested"]:
+        print(f"No {MANIFEST_NAME}: {path}")
+
+if __name__ == "__main__":
+    main()
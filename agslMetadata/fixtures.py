@@ -0,0 +1,132 @@
+"""
+Synthetic datasets shaped like the AGSL archive, for benchmarks and trying the pipeline without the S: drive
+"""
+
+import base64
+import os
+import random
+import struct
+
+from datetime import date
+from pathlib import Path
+
+KINDS = ["shapefile", "geodatabase", "arcgrid"]
+
+# Roughly Wisconsin: west, south, east, north
+BOUNDS = (-92.89, 42.49, -86.25, 47.31)
+
+WGS84_PRJ = ('GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],'
+             'PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]')
+
+def arcgis_metadata_xml(name, lineage_steps=200, rights="None.", bounds=BOUNDS, thumbnail_kilobytes=0) -> str:
+    # ArcGIS-format metadata shaped like ours: citation, constraints, an AGSL contact, a time period,
+    # a bounding box, a lineage with lineage_steps geoprocessing history entries, and optionally a
+    # base64 thumbnail at the end the way ArcGIS stores it
+    process = ('<Process ToolSource="c:\\program files\\arcgis\\pro\\Resources\\ArcToolbox\\toolboxes\\'
+               'Data Management Tools.tbx\\Project" Date="20230714" Time="092635">Project '
+               f'S:\\_R_GML_Archival_AGSL\\GIS_Data\\{name}\\{name}.shp # PROJCS["NAD_1983_HARN_WISCRS"] #</Process>')
+    west, south, east, north = bounds
+    return (f'<?xml version="1.0" encoding="UTF-8"?><metadata xml:lang="en"><Esri><CreaDate>20230714</CreaDate>'
+            f'<ArcGISFormat>1.0</ArcGISFormat><DataProperties><lineage>{process * lineage_steps}</lineage>'
+            f'</DataProperties></Esri><dataIdInfo><idCitation><resTitle>{name.replace("_", " ")}</resTitle>'
+            f'<resAltTitle>{name}</resAltTitle></idCitation><idAbs>Synthetic record for {name}.</idAbs>'
+            '<idCredit>UWM Libraries</idCredit>'
+            '<searchKeys><keyword>Wisconsin</keyword><keyword>Synthetic</keyword></searchKeys>'
+            f'<resConst><LegConsts><othConsts>{rights}</othConsts></LegConsts></resConst>'
+            '<idPoC><rpOrgName>UWM Libraries</rpOrgName><displayName>American Geographical Society Library</displayName>'
+            '<rpCntInfo><cntHours>Monday - Friday: 8:00am - 4:30pm</cntHours></rpCntInfo></idPoC>'
+            f'<dataExt><geoEle><GeoBndBox esriExtentType="search"><westBL>{west}</westBL><eastBL>{east}</eastBL>'
+            f'<southBL>{south}</southBL><northBL>{north}</northBL></GeoBndBox></geoEle>'
+            '<tempEle><TempExtent><exTemp><TM_Period><tmBegin>2010-01-01T00:00:00</tmBegin>'
+            '<tmEnd>2010-12-31T00:00:00</tmEnd></TM_Period></exTemp></TempExtent></tempEle></dataExt>'
+            '</dataIdInfo>'
+            + (f'<Binary><Thumbnail><Data EsriPropertyType="PictureX">'
+               f'{base64.b64encode(random.randbytes(thumbnail_kilobytes * 768)).decode()}</Data></Thumbnail></Binary>'
+               if thumbnail_kilobytes else '')
+            + '</metadata>')
+
+def synthetic_shapefile(directory, name, kilobytes=64, rights="None.", lineage_steps=20) -> Path:
+    '''A point shapefile with valid .shp, .shx and .dbf headers, a .prj and an ArcGIS-format .shp.xml
+    - The points are random and fill about `kilobytes` of .shp
+    - Returns the .shp
+    '''
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    count = max(1, kilobytes * 1024 // 28) # 8 byte record header + 20 byte point
+    west, south, east, north = BOUNDS
+    points = [(random.uniform(west, east), random.uniform(south, north)) for _ in range(count)]
+
+    def header(length_in_bytes):
+        return (struct.pack(">7i", 9994, 0, 0, 0, 0, 0, length_in_bytes // 2) +
+                struct.pack("<2i4d4d", 1000, 1, west, south, east, north, 0, 0, 0, 0))
+
+    shp = bytearray(header(100 + 28 * count))
+    shx = bytearray(header(100 + 8 * count))
+    for number, (x, y) in enumerate(points, start=1):
+        shx += struct.pack(">2i", len(shp) // 2, 10)
+        shp += struct.pack(">2i", number, 10) + struct.pack("<i2d", 1, x, y)
+    (directory / f"{name}.shp").write_bytes(shp)
+    (directory / f"{name}.shx").write_bytes(shx)
+
+    # One numeric ID field
+    today = date.today()
+    dbf = bytearray(struct.pack("<4BIHH20x", 3, today.year - 1900, today.month, today.day, count, 32 + 32 + 1, 1 + 10))
+    dbf += struct.pack("<11sc4xBB14x", b"ID", b"N", 10, 0) + b"\r"
+    for number in range(count):
+        dbf += b" " + str(number).rjust(10).encode()
+    dbf += b"\x1a"
+    (directory / f"{name}.dbf").write_bytes(dbf)
+
+    (directory / f"{name}.prj").write_text(WGS84_PRJ)
+    (directory / f"{name}.shp.xml").write_text(arcgis_metadata_xml(name, lineage_steps, rights))
+    return directory / f"{name}.shp"
+
+def synthetic_geodatabase(directory, tables) -> Path:
+    # A dataset directory holding one .gdb with `tables` tables, a few files per table
+    directory = Path(directory)
+    gdb = directory / f"{directory.name}.gdb"
+    gdb.mkdir(parents=True)
+    for number in range(tables):
+        for suffix in (".gdbtable", ".gdbtablx", ".atx", ".freelist"):
+            (gdb / f"a{number:08x}{suffix}").touch()
+    (directory / f"{directory.name}_ISO.xml").touch()
+    return gdb
+
+def synthetic_raster(directory, megabytes, name="grid", rights="None.", lineage_steps=20) -> Path:
+    '''An ArcGRID-like folder: one big, fairly compressible .adf, a few small ones and metadata.xml, with a .jp2 preview beside it
+    - Returns the grid folder
+    '''
+    grid = Path(directory) / name
+    grid.mkdir(parents=True)
+    with open(grid / "w001001.adf", "wb") as adf:
+        for _ in range(int(megabytes * 256)):
+            adf.write(os.urandom(1024) + bytes(3072)) # roughly 4:1 compressible
+    block = os.urandom(1024) + bytes(3072)
+    for adf_name in ("hdr.adf", "dblbnd.adf", "sta.adf", "vat.adf"):
+        (grid / adf_name).write_bytes(block * 4)
+    (grid / "metadata.xml").write_text(arcgis_metadata_xml(name, lineage_steps, rights))
+    (Path(directory) / "preview.jp2").write_bytes(os.urandom(256 * 1024))
+    return grid
+
+def synthetic_archive(root, count, kinds=("shapefile", "arcgrid"), megabytes=1.0, restricted_every=0) -> list[Path]:
+    '''`count` dataset directories under root, cycling through kinds
+    - Each dataset is named after its directory, like the real archive, and holds about `megabytes` of data
+    - Every restricted_every-th dataset is restricted to the UW System (0 for none)
+    - Returns the dataset directories
+    '''
+    directories = []
+    for number in range(count):
+        kind = kinds[number % len(kinds)]
+        name = f"Synthetic_{kind.capitalize()}_{number:05d}"
+        directory = Path(root) / name
+        rights = "Restricted to UW System users." if restricted_every and number % restricted_every == 0 else "None."
+        if kind == "shapefile":
+            synthetic_shapefile(directory, name, int(megabytes * 1024), rights)
+        elif kind == "geodatabase":
+            synthetic_geodatabase(directory, max(1, int(megabytes * 16)))
+        elif kind == "arcgrid":
+            synthetic_raster(directory, megabytes, name, rights)
+        else:
+            raise Exception(f"Unknown dataset kind {kind}. Choose from {', '.join(KINDS)}")
+        directories.append(directory)
+    return directories
@@ -0,0 +1,93 @@
+"""
+Durable record of how far each dataset got through the ingest pipeline, so an interrupted batch can resume
+"""
+
+import sqlite3
+
+from datetime import datetime
+from pathlib import Path
+
+# The stages recorded for every dataset, in pipeline order
+STAGES = ["minted", "identifiers", "hours", "exported", "bound", "zipped", "verified", "metadata", "published"]
+
+# What a purge undoes. The stages before these changed the dataset's own metadata, which a purge leaves alone.
+PURGED_STAGES = ["bound", "zipped", "verified", "metadata", "published"]
+
+# Stages whose output sits in the staging directory until the dataset is published
+STAGED_STAGES = ["zipped", "verified", "metadata"]
+
+class IngestJournal:
+    '''SQLite journal of the ingest pipeline, keyed by dataset directory
+    - Remembers the arkid minted for every dataset, so a retry never mints a second one
+    - Every connection is short-lived, so worker processes can all write to the same file
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS datasets (
+                path TEXT PRIMARY KEY,
+                arkid TEXT,
+                status TEXT,
+                updated_at TEXT NOT NULL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS stages (
+                path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                completed_at TEXT NOT NULL,
+                PRIMARY KEY (path, stage))""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    def arkid(self, path) -> str:
+        with self._connect() as connection:
+            row = connection.execute("SELECT arkid FROM datasets WHERE path = ?", (str(path),)).fetchone()
+        return None if row is None else row[0]
+
+    def arkids(self) -> list[str]:
+        # Every arkid minted for a dataset in the journal
+        with self._connect() as connection:
+            rows = connection.execute("SELECT DISTINCT arkid FROM datasets WHERE arkid IS NOT NULL").fetchall()
+        return [row[0] for row in rows]
+
+    def completed(self, path) -> set[str]:
+        with self._connect() as connection:
+            rows = connection.execute("SELECT stage FROM stages WHERE path = ?", (str(path),)).fetchall()
+        completed = {row[0] for row in rows}
+        # A dataset published before a stage was added to the pipeline doesn't need that stage any more
+        return set(STAGES) if "published" in completed else completed
+
+    def record_arkid(self, path, arkid) -> None:
+        with self._connect() as connection:
+            connection.execute("""INSERT INTO datasets (path, arkid, status, updated_at) VALUES (?, ?, 'running', ?)
+                                  ON CONFLICT (path) DO UPDATE SET arkid = excluded.arkid, updated_at = excluded.updated_at""",
+                               (str(path), arkid, now()))
+            connection.execute("INSERT OR REPLACE INTO stages VALUES (?, 'minted', ?)", (str(path), now()))
+
+    def complete(self, path, stage) -> None:
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO stages VALUES (?, ?, ?)", (str(path), stage, now()))
+
+    def reset(self, path, stages=PURGED_STAGES) -> None:
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM stages WHERE path = ? AND stage = ?", [(str(path), stage) for stage in stages])
+
+    def reset_unpublished(self) -> int:
+        # Forget staged outputs that never got published, after the staging directory has been cleaned out
+        with self._connect() as connection:
+            cursor = connection.execute(f"""DELETE FROM stages WHERE stage IN ({", ".join("?" * len(STAGED_STAGES))})
+                                            AND path NOT IN (SELECT path FROM stages WHERE stage = 'published')""",
+                                        STAGED_STAGES)
+        return cursor.rowcount
+
+    def finish(self, path, status) -> None:
+        with self._connect() as connection:
+            connection.execute("""INSERT INTO datasets (path, status, updated_at) VALUES (?, ?, ?)
+                                  ON CONFLICT (path) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at""",
+                               (str(path), status, now()))
+
+    def is_done(self, path) -> bool:
+        return self.completed(path) >= set(STAGES)
+
+def now() -> str:
+    return datetime.now().replace(microsecond=0).isoformat()
@@ -1,210 +1,125 @@
+import argparse
+import asyncPipeline
+import batchIngest
+import datasetSource
+import solrFeed
 import updateMetadata
-import csv
 from pathlib import Path
 
-warnings = []
 CSV_OUTPUT = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Log.csv")
 
-# Take as an argument a directory containing a bunch of datasets (in dirs)
+# The directory of dataset directories to ingest when neither --directory nor --manifest is given
 target_directory = Path(r"S:\_R_GML_Archival_AGSL\GIS_Data\GeoBlacklight\public")
 
-### Add it to a CSV file so we have a log of all these!
-csvfile = open(CSV_OUTPUT, 'w', newline='')
-logwriter = csv.writer(csvfile)
-logwriter.writerow(["INPATH", "STATUS", "ARKID", "WARNING", "ERROR"])
+# How many datasets to process at once. Each one runs in its own process
+# because arcpy is not thread-safe. Set to 1 to process them one at a time.
+WORKERS = batchIngest.WORKERS
+
+# Mint arkids in bulk and keep the ones we haven't used yet here between runs
+ARK_POOL = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_ARK_Pool.sqlite")
+
+# Record of every dataset's progress through the pipeline. Rerunning after an interruption
+# skips the stages that already completed and reuses the arkids that were already minted.
+JOURNAL = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Journal.sqlite")
+
+# Remember which dataset is in each directory, so re-runs skip unchanged directories
+SCAN_CACHE = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Scan_Cache.sqlite")
+
+# Every stage of every dataset as a JSON line: timings, bytes, NOID latency and errors (see runLog)
+RUN_LOG = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Run_Log.jsonl")
+
+# Run the datasets through asyncPipeline instead of worker processes: NOID calls, metadata
+# and zipping of different datasets overlap, and mints and binds are batched as they queue up
+ASYNC_PIPELINE = False
+
+# "arcpy", or "xml" to edit the ArcGIS-format XML files directly without ArcGIS Pro (no file geodatabases)
+METADATA_BACKEND = "arcpy"
+
+# Ingest while NOID is unreachable: arkids come from the ARK pool's reserved blocks (reserve them beforehand with
+# `python arkPool.py reserve <pool> <count>`) and the binds wait there for `python arkPool.py reconcile <pool>`
+NOID_OFFLINE = False
+
+# The values last bound for every arkid, so re-running a dataset only sends the NOID elements that changed.
+# Reload it from NOID with `python bindCache.py refresh <cache>`.
+BIND_CACHE = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Bind_Cache.sqlite")
+
+# After the batch, send GeoDiscovery's Solr the records that changed since the last feed (see solrFeed). None to skip.
+SOLR_URL = None
+FEED_LEDGER = Path(r"C:\Users\srappel\Desktop\GeoDiscovery_Feed_Ledger.sqlite")
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingest a batch of datasets into GeoDiscovery")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--directory", type=Path, default=target_directory,
+                        help="ingest the dataset directories directly under this directory")
+    source.add_argument("--manifest", type=Path,
+                        help="ingest the datasets listed in this CSV of name, path[, id], like datalist_public.csv")
+    parser.add_argument("--rights", nargs="+", choices=updateMetadata.RIGHTS,
+                        help="only datasets under these rights directories")
+    parser.add_argument("--name", help='only datasets whose names match this pattern, e.g. "Milwaukee_*"')
+    parser.add_argument("--skip-identified", action="store_true", help="leave out manifest rows that already have an ID")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--async-pipeline", action="store_true", default=ASYNC_PIPELINE)
+    parser.add_argument("--offline", action="store_true", default=NOID_OFFLINE,
+                        help="mint from the reserved ARKs and keep the binds for `arkPool.py reconcile`")
+    return parser.parse_args()
 
 def main():
-    ### Purge BIND if status is failing:
-    def purge():
-        if status == "failing":
-            try:
-                dataset.metadata.bind(purge=True)
-            except Exception as error:
-                print(error)
-                warnings.append(error)
-            print()
-            print('###PURGE###')
-            print()
-            # Delete the zipfile:
-            try:
-                if dataset.fileserver_zip.exists():
-                    dataset.fileserver_zip.unlink()
-            except Exception as error:
-                print(error)
-                warnings.append(error)
-            # Delete the directory
-            try:
-                if dataset.fileserver_dir.exists():
-                    dataset.fileserver_dir.rmdir()
-            except Exception as error:
-                print(error)
-                warnings.append(error)
-            # Delete the metadata
-            try:
-                if dataset.fileserver_metadata.exists():
-                    dataset.fileserver_metadata.unlink()
-            except Exception as error:
-                print(error)
-                warnings.append(error)
-
-    # Loop through each directory in the parent folder 
-    def list_all_dirs(rootdir) -> list[tuple[Path,int]]:
-        rootdir = Path(rootdir)
-        all_directories = []
-        for path in sorted(rootdir.rglob("*")):
-            if path.is_dir():
-                depth = len(path.relative_to(rootdir).parts)
-                path_tuple = (path, depth)
-                all_directories.append(path_tuple)
-        return all_directories
-
-    for dataset_directory in list_all_dirs(target_directory):
-        status = "passing"
-        if dataset_directory[1] == 1: # Only children of root
-
-    # Create a updateMetadata.Dataset object by passing each dir Path
-    # to the Dataset factory Dataset(Path)
-    # This will create:
-    #   - Dataset.data (Path to the actual data)
-    #   - Dataset.datatype (Integer code)
-    #   - Dataset.metadata (A AGSLMetadata Object)
-            try:
-                dataset = updateMetadata.Dataset(Path(dataset_directory[0]))
-            except Exception as error:
-                warning = f"Failed to create Dataset object for {str(dataset_directory[0])}\n"
-                print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue # Will go to the next Dataset.
-
-    # Creating the Dataset object will create the AGSLMetadata object:
-    # This creates:
-    #   - Dataset.metadata.xml_text
-    #   - Dataset.metadata.md_object
-    #   - Dataset.metadata.rootElement
-    #   - Dataset.metadata.altTitle
-    #   - Dataset.metadata.rights
-
-    ### Now we need to run through some functions on the data:
-
-    ## Create and Write Identifiers:
-    ## Dataset.metadata.create_and_write_identifiers()
-            try:
-                dataset.metadata.create_and_write_identifiers()
-            except Exception as error:
-                warning = f"Failed to create and write identifiers for {str(dataset_directory[0])}\n"
-                print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue
-    # First, this will mint a new Identifier object.
-    # This creates:
-    #   -Dataset.metadata.identifier.arkid
-    #   -Dataset.metadata.identifier.nameAuthorityNumber
-    #   -Dataset.metadata.identifier.assignedName
-
-    # Next, it will write the infomration from the Identifier object
-    # into the correct places in the xml metadata.
-
-    # Finally, it saves the metadata object.
-
-    ## Update AGSL Hours
-    ## Dataset.metadata.update_agsl_hours() 
-            try:
-                dataset.metadata.update_agsl_hours()
-            except Exception as error:
-                warning = f"Failed to update AGSL hours for {str(dataset_directory[0])}\n"
-                print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue
-    # Updates the hours in the metadata and saves the metadata object.
-
-    ## Dual Metadata Export
-    ## Dataset.metadata.dual_metadata_export
-            try:
-                dataset.metadata.dual_metadata_export()
-            except Exception as error:
-                warning = f"Failed to export metadata for {str(dataset_directory[0])}\n"
-                print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue
-    # This exports the metadata to the parent directory for the dataset
-
-    ## Bind the ArkID using NOID
-    ## Dataset.metadata.bind()
-            try:
-                dataset.metadata.bind()
-            except Exception as error:
-                warning = f"Failed to NOID bind for {str(dataset_directory[0])}\n"
-                print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue
-    # Creates the bind parameters:
-    # who, what, when, where, meta-who, meta-when, meta-uri, rights, download
-    # Sends the bind request using the requests library
-
-    ### Now we need to "ingest" the dataset, which involves
-    # Creating a new zip archive containing the data and xml metadata
-    # The zip file will be named after the alt-title
-    # Put it in a directory named after the assignedName from the arkid
-    # Put that directory in the appropriate folder on the webserver (by rights)
-    # Create a copy of the ISO Xml (assignedName_ISO.xml) in the metadata directory on the webserver
-            try:
-                dataset.ingest()
-            except Exception as error:
-                warning = f"Failed to ingest {str(dataset_directory[0])}\n"
+    args = parse_args()
+    updateMetadata.ARK_POOL_PATH = ARK_POOL
+    updateMetadata.SCAN_CACHE_PATH = SCAN_CACHE
+    updateMetadata.METADATA_BACKEND = METADATA_BACKEND
+    updateMetadata.BIND_CACHE_PATH = BIND_CACHE
+    updateMetadata.NOID_OFFLINE = args.offline
+
+    # Datasets are read from the manifest or directory as the pipeline takes them, so it starts on the first one right away
+    rows = datasetSource.manifest_rows(args.manifest) if args.manifest else datasetSource.directory_rows(args.directory)
+    skipped = {}
+    dataset_directories = datasetSource.select(rows, args.rights, args.name, args.skip_identified, skipped)
+
+    # Every dataset goes through the same pipeline (see batchIngest.STAGES):
+    #   - updateMetadata.Dataset(Path) creates Dataset.data, Dataset.datatype and Dataset.metadata
+    #   - mint_identifier() mints an arkid, or reuses the one the journal has for the dataset
+    #   - create_and_write_identifiers() writes the arkid into the metadata
+    #   - update_agsl_hours() updates the hours in the metadata
+    #   - dual_metadata_export() exports ISO and FGDC metadata next to the dataset
+    #   - bind() binds who, what, when, where, meta-who, meta-when, meta-uri, rights, download,
+    #     or only the ones that changed since the last bind when there is a bind cache
+    #   - ingest() zips the dataset, reads the zip back to check every member's crc32 and that no file is
+    #     missing, copies the ISO xml (assignedName_ISO.xml) into a staging directory, then publishes
+    #     them with renames into <rights>/<assignedName>/ on the webserver and the metadata directory
+    # A failing dataset is purged (bind purge, staged outputs discarded) and logged.
+    # The log is appended to, so earlier runs stay in it.
+    if args.async_pipeline:
+        summary = asyncPipeline.run_pipeline(dataset_directories, CSV_OUTPUT, journal_path=JOURNAL, run_log_path=RUN_LOG)
+    else:
+        summary = batchIngest.run_batch(dataset_directories, CSV_OUTPUT, workers=args.workers, journal_path=JOURNAL,
+                                        run_log_path=RUN_LOG)
+    for reason, count in skipped.items():
+        print(f"Skipped {count} datasets ({reason})")
+
+    if summary["failing"] >= 1:
+        print(f"Finished with the following {summary['failing']} errors:")
+        if summary["failing"] > len(summary["recent_failures"]):
+            print(f"(Only the last {len(summary['recent_failures'])} are listed here. All of them are in {CSV_OUTPUT})")
+        for warnings in summary["recent_failures"]:
+            for warning in warnings:
                 print(warning)
-                print(error)
-                warnings.append(warning)
-                warnings.append(error)
-                status = "failing"
-                logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName, warning, error])
-                purge()
-                continue
-                
-    ### Testing/Logging
-            print(f"Successfully updated and ingested {str(dataset_directory[0])}!\n")
-            status = "passing"
-            logwriter.writerow([dataset_directory[0], status, dataset.metadata.identifier.assignedName,"",""])
-
-    # if it is successful:
-    # write to log the path on the webserver
-    if len(warnings) >= 1:
-        print(f"Finished with the following {str(len(warnings) / 2)} errors:")
-        for warning in warnings:
-            print(warning)
-            print()
+                print()
     else:
         print("Finished with no errors!")
+    print(f"See where the time went with `python runLog.py {RUN_LOG}`")
+    if args.offline:
+        print(f"The binds are waiting in {ARK_POOL}. Send them with `python arkPool.py reconcile {ARK_POOL} --bind-cache {BIND_CACHE}`")
 
-    csvfile.close()
+    if SOLR_URL is not None:
+        feed = solrFeed.feed(updateMetadata.FILE_SERVER_PATH, FEED_LEDGER, SOLR_URL)
+        print(f"Sent {feed['changed']} changed and {feed['deleted']} deleted records to {SOLR_URL}")
+        for name, error in feed["failed"].items():
+            print(f"Not fed: {name}: {error}")
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt as error:
-        csvfile.close()
         print(error)
@@ -0,0 +1,234 @@
+"""
+Metadata backends for Dataset/AGSLMetadata: arcpy, or the ArcGIS-format XML files read directly
+"""
+
+import metadataFields
+import os
+import tempfile
+
+import xml.etree.ElementTree as ET
+
+from datasetScan import FILE_GEODATABASE
+from datetime import datetime
+from pathlib import Path
+
+BLANK_METADATA = '<?xml version="1.0" encoding="UTF-8"?><metadata xml:lang="en"></metadata>'
+
+class MetadataBackend:
+    '''What Dataset and AGSLMetadata need from a metadata implementation
+    - resolve_dataset() turns what datasetScan found (.shp, .gdb, ArcGRID folder) into the dataset itself
+    - open_metadata() returns an object that behaves like arcpy.metadata.Metadata:
+      xml, title, credits, uri, isReadOnly, save() and exportMetadata()
+    '''
+    name = None
+
+    def resolve_dataset(self, found, dataset_type) -> Path:
+        raise NotImplementedError
+
+    def open_metadata(self, dataset):
+        raise NotImplementedError
+
+class ArcpyBackend(MetadataBackend):
+    # arcpy takes seconds to import, so it is only imported once this backend is picked
+    name = "arcpy"
+
+    def __init__(self):
+        import arcpy
+        self.arcpy = arcpy
+
+    def resolve_dataset(self, found, dataset_type) -> Path:
+        if dataset_type == FILE_GEODATABASE:
+            self.arcpy.env.workspace = str(found) # This can't be a Path, it has to be a path as string.
+            feature_dataset_list = self.arcpy.ListDatasets("*","feature")
+            if not len(feature_dataset_list) > 1:
+                return Path(found) / feature_dataset_list[0]
+            else:
+                return
+        return Path(found)
+
+    def open_metadata(self, dataset):
+        return self.arcpy.metadata.Metadata(str(dataset))
+
+class XmlBackend(MetadataBackend):
+    '''Reads and writes the ArcGIS-format XML that sits next to the data, no arcpy needed
+    - Shapefiles: <name>.shp.xml
+    - ArcGRID rasters: metadata.xml inside the grid folder
+    - File geodatabases keep their metadata inside the .gdb, so they need the arcpy backend
+    '''
+    name = "xml"
+
+    def resolve_dataset(self, found, dataset_type) -> Path:
+        if dataset_type == FILE_GEODATABASE:
+            raise Exception("File geodatabase metadata can only be read with the arcpy metadata backend")
+        return Path(found)
+
+    def open_metadata(self, dataset):
+        return SidecarMetadata(dataset)
+
+# What SidecarMetadata.title and .credits read, the way arcpy's Metadata has them
+SIDECAR_FIELDS = {"title": ".//dataIdInfo/idCitation/resTitle", "credits": ".//dataIdInfo/idCredit"}
+
+def sidecar_path(dataset) -> Path:
+    dataset = Path(dataset)
+    if dataset.is_dir(): # ArcGRID
+        return dataset / "metadata.xml"
+    return dataset.with_name(dataset.name + ".xml")
+
+class SidecarMetadata:
+    '''A stand-in for arcpy.metadata.Metadata backed by the dataset's XML sidecar
+    - A dataset without a sidecar gets blank metadata, like arcpy gives it
+    - save() replaces the sidecar atomically
+    - exportMetadata() writes a basic ISO 19139 or FGDC record from the ArcGIS fields
+    '''
+
+    def __init__(self, dataset):
+        self.uri = str(dataset)
+        self.path = sidecar_path(dataset)
+        self.isReadOnly = False
+        self.xml = self.path.read_text(encoding="utf-8") if self.path.exists() else BLANK_METADATA
+        self._fields_of = None
+
+    def _root(self) -> ET.Element:
+        return ET.fromstring(self.xml)
+
+    def _fields(self) -> dict[str, list[str]]:
+        # title and credits, streamed out of the xml in one pass and kept until the xml changes
+        if self._fields_of is not self.xml:
+            self._field_values = metadataFields.extract(self.xml, SIDECAR_FIELDS)
+            self._fields_of = self.xml
+        return self._field_values
+
+    @property
+    def title(self) -> str:
+        titles = self._fields()["title"]
+        return titles[0] if titles else None
+
+    @property
+    def credits(self) -> str:
+        credits = self._fields()["credits"]
+        return credits[0] if credits else None
+
+    def save(self) -> None:
+        if isinstance(self.xml, bytes):
+            self.xml = self.xml.decode("utf-8")
+        _atomic_write(self.path, self.xml)
+
+    def exportMetadata(self, outputPath, metadata_export_option, metadata_removal_option=None) -> None:
+        # The ArcGIS record is our own, so there is no sensitive information to remove
+        root = self._root()
+        if metadata_export_option.startswith("ISO19139"):
+            exported = iso_record(root)
+        elif metadata_export_option == "FGDC_CSDGM":
+            exported = fgdc_record(root)
+        else:
+            raise Exception(f"The xml metadata backend can't export {metadata_export_option}")
+        ET.indent(exported)
+        _atomic_write(Path(outputPath), '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(exported, encoding="unicode"))
+
+def _text(root, path) -> str:
+    found = root.find(path)
+    return None if found is None else found.text
+
+def _atomic_write(path, text) -> None:
+    handle, temporary = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(handle, "w", encoding="utf-8") as output:
+            output.write(text)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+# ISO 19139 namespaces
+GMD = "http://www.isotc211.org/2005/gmd"
+GCO = "http://www.isotc211.org/2005/gco"
+GML = "http://www.opengis.net/gml/3.2"
+for prefix, uri in (("gmd", GMD), ("gco", GCO), ("gml", GML)):
+    ET.register_namespace(prefix, uri)
+
+def _iso(parent, path, text=None, value_type="CharacterString") -> ET.Element:
+    # Build a gmd path like "identificationInfo/MD_DataIdentification" under parent, optionally with a gco value
+    element = parent
+    for tag in path.split("/"):
+        element = ET.SubElement(element, f"{{{GMD}}}{tag}")
+    if text is not None:
+        ET.SubElement(element, f"{{{GCO}}}{value_type}").text = text
+    return element
+
+def iso_record(root) -> ET.Element:
+    # A basic ISO 19139 record with the fields GeoDiscovery uses
+    record = ET.Element(f"{{{GMD}}}MD_Metadata")
+    _iso(record, "fileIdentifier", _text(root, ".//mdFileID") or "")
+    _iso(record, "language", "eng")
+    _iso(record, "dateStamp", datetime.now().date().isoformat(), "Date")
+    if _text(root, ".//dataSetURI"):
+        _iso(record, "dataSetURI", _text(root, ".//dataSetURI"))
+
+    identification = _iso(record, "identificationInfo/MD_DataIdentification")
+    citation = _iso(identification, "citation/CI_Citation")
+    _iso(citation, "title", _text(root, ".//idCitation/resTitle") or "")
+    if _text(root, ".//idCitation/resAltTitle"):
+        _iso(citation, "alternateTitle", _text(root, ".//idCitation/resAltTitle"))
+    if _text(root, ".//citId/identCode"):
+        _iso(citation, "identifier/MD_Identifier/code", _text(root, ".//citId/identCode"))
+    _iso(identification, "abstract", _text(root, ".//dataIdInfo/idAbs") or "")
+    if _text(root, ".//dataIdInfo/idCredit"):
+        _iso(identification, "credit", _text(root, ".//dataIdInfo/idCredit"))
+    for keyword in root.iterfind(".//dataIdInfo/*/keyword"):
+        _iso(identification, "descriptiveKeywords/MD_Keywords/keyword", keyword.text)
+    for constraint in root.iterfind(".//othConsts"):
+        _iso(identification, "resourceConstraints/MD_LegalConstraints/otherConstraints", constraint.text)
+
+    extent = _iso(identification, "extent/EX_Extent")
+    box = root.find(".//dataExt/geoEle/GeoBndBox")
+    if box is not None:
+        bounding = _iso(extent, "geographicElement/EX_GeographicBoundingBox")
+        for iso_tag, arcgis_tag in (("westBoundLongitude", "westBL"), ("eastBoundLongitude", "eastBL"),
+                                    ("southBoundLatitude", "southBL"), ("northBoundLatitude", "northBL")):
+            _iso(bounding, iso_tag, _text(box, arcgis_tag), "Decimal")
+    begin, end = _text(root, ".//tmBegin"), _text(root, ".//tmEnd")
+    position = _text(root, ".//tmPosition")
+    if begin or position:
+        temporal = _iso(extent, "temporalElement/EX_TemporalExtent/extent")
+        if begin:
+            period = ET.SubElement(temporal, f"{{{GML}}}TimePeriod", {f"{{{GML}}}id": "period"})
+            ET.SubElement(period, f"{{{GML}}}beginPosition").text = begin
+            ET.SubElement(period, f"{{{GML}}}endPosition").text = end
+        else:
+            instant = ET.SubElement(temporal, f"{{{GML}}}TimeInstant", {f"{{{GML}}}id": "instant"})
+            ET.SubElement(instant, f"{{{GML}}}timePosition").text = position
+    return record
+
+def fgdc_record(root) -> ET.Element:
+    # A basic FGDC CSDGM record with the same fields
+    record = ET.Element("metadata")
+    idinfo = ET.SubElement(record, "idinfo")
+    citeinfo = ET.SubElement(ET.SubElement(idinfo, "citation"), "citeinfo")
+    ET.SubElement(citeinfo, "origin").text = _text(root, ".//dataIdInfo/idCredit") or ""
+    ET.SubElement(citeinfo, "title").text = _text(root, ".//idCitation/resTitle") or ""
+    if _text(root, ".//dataSetURI"):
+        ET.SubElement(citeinfo, "onlink").text = _text(root, ".//dataSetURI")
+    descript = ET.SubElement(idinfo, "descript")
+    ET.SubElement(descript, "abstract").text = _text(root, ".//dataIdInfo/idAbs") or ""
+    timeinfo = ET.SubElement(ET.SubElement(idinfo, "timeperd"), "timeinfo")
+    if _text(root, ".//tmBegin"):
+        rngdates = ET.SubElement(timeinfo, "rngdates")
+        ET.SubElement(rngdates, "begdate").text = _text(root, ".//tmBegin")
+        ET.SubElement(rngdates, "enddate").text = _text(root, ".//tmEnd")
+    else:
+        ET.SubElement(ET.SubElement(timeinfo, "sngdate"), "caldate").text = _text(root, ".//tmPosition") or "unknown"
+    ET.SubElement(idinfo, "useconst").text = _text(root, ".//othConsts") or "None."
+    ET.SubElement(ET.SubElement(record, "metainfo"), "metd").text = datetime.now().strftime("%Y%m%d")
+    return record
+
+BACKENDS = {backend.name: backend for backend in (ArcpyBackend, XmlBackend)}
+
+_backends: dict[str, MetadataBackend] = {}
+
+def get_backend(name) -> MetadataBackend:
+    # One instance per backend per process
+    if name not in _backends:
+        if name not in BACKENDS:
+            raise Exception(f"Unknown metadata backend {name}. Choose from {', '.join(BACKENDS)}")
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
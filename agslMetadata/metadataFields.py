@@ -0,0 +1,139 @@
+"""
+Read a few fields out of a metadata record without keeping its tree.
+Records can carry megabytes of geoprocessing history and base64 thumbnails that nothing reads, so the
+record is streamed with XMLPullParser (what iterparse is built on), every element is dropped once it is read,
+known-heavy subtrees are passed over, and reading stops once every field is found.
+"""
+
+import functools
+import itertools
+
+import xml.etree.ElementTree as ET
+
+# Subtrees that are big and never read, by local name: ArcGIS thumbnails and enclosures (Binary), and
+# the geoprocessing history of ArcGIS records and the process steps of ISO records (lineage)
+HEAVY_ELEMENTS = {"Binary", "lineage"}
+
+# Bytes fed to the parser at a time
+CHUNK_SIZE = 64 * 1024
+
+def local_name(tag) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+@functools.lru_cache(maxsize=None)
+def compile_path(path) -> tuple[bool, list[str]]:
+    '''A field path as (anywhere, steps)
+    - The paths are the simple ElementPath ones the other modules use: steps separated by /, an optional leading .//
+      to match at any depth, and steps that are a tag, {namespace}tag, {*}tag for any namespace, or * for any tag
+    '''
+    anywhere = path.startswith(".//")
+    steps = path.removeprefix(".//").removeprefix("./").split("/")
+    for step in steps:
+        if not step or step in (".", "..") or "[" in step or "@" in step:
+            raise Exception(f"metadataFields can't stream the path {path!r}")
+    return anywhere, steps
+
+def step_matches(step, tag) -> bool:
+    if step == "*" or step == tag:
+        return True
+    return step.startswith("{*}") and local_name(tag) == step[3:]
+
+def chunks(source):
+    # The record in CHUNK_SIZE pieces, read as they are needed
+    if isinstance(source, bytes) or (isinstance(source, str) and source.lstrip().startswith("<")):
+        for start in range(0, len(source), CHUNK_SIZE):
+            yield source[start:start + CHUNK_SIZE]
+    else:
+        with open(source, "rb") as record:
+            while chunk := record.read(CHUNK_SIZE):
+                yield chunk
+
+def extract(source, paths, multiple=(), skip=HEAVY_ELEMENTS) -> dict[str, list[str]]:
+    '''Stream a record and return {field: [text, ...]} for the fields in paths ({field: path})
+    - source is the path of an XML file, or the record as a str or bytes
+    - Fields in multiple get every value, in document order; the rest get their first value, or none
+    - Elements whose local name is in skip are passed over with everything in them, even by .// paths, unless a path
+      names them
+    - Every element is dropped once it has been read, and reading stops as soon as every field has its value,
+      unless some fields take multiple values
+    - A record smaller than CHUNK_SIZE is parsed whole instead, which is quicker at that size, and its skipped
+      subtrees are cut out before the paths are searched, so the same record matches the same way at any size
+    - Texts are stripped, and empty ones left out
+    '''
+    values = {field: [] for field in paths}
+    multiple = set(multiple)
+    skip = set(skip) - {local_name(step) for path in paths.values() for step in compile_path(path)[1]}
+    pieces = chunks(source)
+    head = next(pieces, b"")
+    if len(head) < CHUNK_SIZE:
+        # The whole record is in one chunk. A record that small parses faster whole, in C, than streamed.
+        root = ET.fromstring(head)
+        if skip:
+            # Skipped subtrees are cut out first, so what matches doesn't depend on the record's size
+            namespaced = tuple("}" + name for name in skip)
+            for parent, child in [(parent, child) for parent in root.iter() for child in parent
+                                  if child.tag in skip or child.tag.endswith(namespaced)]:
+                parent.remove(child)
+        for field, path in paths.items():
+            texts = [element.text.strip() for element in root.iterfind(path) if element.text and element.text.strip()]
+            values[field] = texts if field in multiple else texts[:1]
+        return values
+
+    pending = set(paths) - multiple # Single-valued fields without a value yet
+    # Fields by the local name of their last step, so an element is only checked against the fields it could be
+    candidates, wildcards = {}, []
+    for field, path in paths.items():
+        anywhere, steps = compile_path(path)
+        if steps[-1] == "*":
+            wildcards.append((field, anywhere, steps))
+        else:
+            candidates.setdefault(local_name(steps[-1]), []).append((field, anywhere, steps))
+    for name in candidates:
+        candidates[name].extend(wildcards)
+
+    parser = ET.XMLPullParser(("start", "end"))
+    stack = [] # The open elements, the root first
+    skipping = 0 # Depth inside a skipped subtree
+    for chunk in itertools.chain([head], pieces):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if skipping:
+                # Inside a skipped subtree nothing is matched, and every element is emptied as it ends
+                if event == "start":
+                    skipping += 1
+                else:
+                    skipping -= 1
+                    element.clear()
+                    if not skipping:
+                        del stack[-1][-1]
+                continue
+            if event == "start":
+                if stack and local_name(element.tag) in skip:
+                    skipping = 1
+                else:
+                    stack.append(element)
+                continue
+
+            stack.pop()
+            for field, anywhere, steps in candidates.get(local_name(element.tag), wildcards):
+                if field not in pending and field not in multiple:
+                    continue
+                depth = len(stack) # Steps below the root, counting this element
+                if depth < len(steps) or (not anywhere and depth != len(steps)):
+                    continue
+                tags = [ancestor.tag for ancestor in stack[len(stack) - len(steps) + 1:]] + [element.tag]
+                if all(step_matches(step, tag) for step, tag in zip(steps, tags)):
+                    text = (element.text or "").strip()
+                    if text:
+                        values[field].append(text)
+                        pending.discard(field)
+            if stack:
+                del stack[-1][-1] # Drop the element from its parent, which has nothing else after it yet
+            if not pending and not multiple:
+                return values # The rest of the record is never read
+    return values
+
+def first(source, path, skip=HEAVY_ELEMENTS) -> str:
+    # The first non-empty text at path, or None
+    values = extract(source, {"value": path}, skip=skip)["value"]
+    return values[0] if values else None
@@ -0,0 +1,156 @@
+"""
+Metadata migrations: catalog-wide edits written as find/replace rules instead of another full run of the pipeline.
+Run `python migrations.py agsl-hours --directory <archive> --dry-run` to see what would change, then again without --dry-run.
+
+A migration is a list of rules, each a dict (or a JSON object in a --rules file):
+- match: ElementPath of the elements the rule works in, e.g. ".//rpCntInfo/cntHours/../.." (default ".", the whole record)
+- where: {path: text}, only the matched elements where the element at path contains text
+- set: {path: text}, the new text of every element at path
+- replace: {path: [pattern, replacement]}, a regular expression substitution in the text of every element at path
+Paths in where, set and replace are relative to the matched element.
+"""
+
+import argparse
+import datasetScan
+import datasetSource
+import json
+import metadataBackend
+import os
+import poolMap
+import re
+import time
+import updateMetadata
+
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+# What update_agsl_hours() does during ingest, as a migration
+AGSL_HOURS = [
+    {
+        "match": ".//rpCntInfo/cntHours/../..", # Contacts that have hours listed
+        "where": {"./displayName": "American Geographical"},
+        "set": {".//cntHours": "Monday – Friday: 9:00am – 4:30pm"},
+    },
+]
+
+MIGRATIONS = {
+    "agsl-hours": AGSL_HOURS,
+}
+
+WORKERS = os.cpu_count() or 1
+
+def apply(root, rules) -> list[tuple[str, str, str]]:
+    '''Apply rules, in order, to one parsed record
+    - Every rule edits the same tree, so a record is parsed and serialized once however many rules there are
+    - Returns (where, old text, new text) for every element whose text changed; nothing means the record is unchanged
+    '''
+    changes = []
+
+    def edit(element, where, new_text):
+        if element.text != new_text:
+            changes.append((where, element.text, new_text))
+            element.text = new_text
+
+    for rule in rules:
+        match = rule.get("match", ".")
+        for scope in ([root] if match == "." else root.findall(match)):
+            if not all(text in (scope.findtext(path) or "") for path, text in rule.get("where", {}).items()):
+                continue
+            for path, text in rule.get("set", {}).items():
+                for element in scope.findall(path):
+                    edit(element, f"{match} {path}", text)
+            for path, (pattern, replacement) in rule.get("replace", {}).items():
+                for element in scope.findall(path):
+                    if element.text is not None:
+                        edit(element, f"{match} {path}", re.sub(pattern, replacement, element.text))
+    return changes
+
+def load_rules(names, rules_paths) -> list[dict]:
+    # The rules of the named built-in migrations, then those of every JSON rules file, in order
+    rules = []
+    for name in names:
+        if name not in MIGRATIONS:
+            raise Exception(f"Unknown migration {name}. Choose from {', '.join(MIGRATIONS)}")
+        rules.extend(MIGRATIONS[name])
+    for rules_path in rules_paths:
+        with open(rules_path, encoding="utf-8") as rules_file:
+            rules.extend(json.load(rules_file))
+    return rules
+
+def migrate(dataset_directory, rules, dry_run=False, backend_name="xml", scan_cache_path=None) -> dict:
+    '''Apply rules to the metadata of one dataset directory. Runs in the worker processes.
+    - The metadata is opened and saved through the metadata backend, the same as during ingest
+    - It is only saved if a rule changed something, and never with dry_run
+    - Returns the dataset, its changes and any error
+    '''
+    result = {"dataset": str(dataset_directory), "changes": [], "error": None}
+    try:
+        dataset_type, found = datasetScan.classify(dataset_directory, scan_cache_path)
+        if dataset_type in (datasetScan.ERROR, datasetScan.MULTIPLE):
+            raise Exception("No single dataset in the directory")
+        backend = metadataBackend.get_backend(backend_name)
+        metadata = backend.open_metadata(backend.resolve_dataset(found, dataset_type))
+        root = ET.fromstring(metadata.xml)
+        result["changes"] = apply(root, rules)
+        if result["changes"] and not dry_run:
+            metadata.xml = ET.tostring(root, encoding="unicode")
+            metadata.save()
+    except Exception as error:
+        result["error"] = f"{type(error).__name__}: {error}"
+    return result
+
+def run(dataset_directories, rules, dry_run=False, workers=WORKERS):
+    '''migrate() every dataset directory on a pool of worker processes, yielding the results in order
+    - dataset_directories can be any iterable, like a datasetSource generator; it is read as the workers need more
+    '''
+    migrate_one = partial(migrate, rules=rules, dry_run=dry_run, backend_name=updateMetadata.METADATA_BACKEND,
+                          scan_cache_path=updateMetadata.SCAN_CACHE_PATH)
+    if workers <= 1:
+        yield from map(migrate_one, dataset_directories)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        yield from poolMap.bounded_map(executor, migrate_one, dataset_directories, 4 * workers)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply metadata migrations to every dataset in an archive directory or manifest")
+    parser.add_argument("migrations", nargs="*", help=f"built-in migrations to apply: {', '.join(MIGRATIONS)}")
+    parser.add_argument("--rules", type=Path, action="append", default=[], help="a JSON file with a list of rules")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--directory", type=Path, help="apply to every dataset directory in this directory")
+    source.add_argument("--manifest", type=Path, help="apply to every dataset in this manifest CSV")
+    parser.add_argument("--rights", nargs="+", choices=updateMetadata.RIGHTS, help="only datasets with these rights")
+    parser.add_argument("--name", help="only datasets whose name matches this glob")
+    parser.add_argument("--dry-run", action="store_true", help="print what would change without saving anything")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--backend", choices=list(metadataBackend.BACKENDS), default=updateMetadata.METADATA_BACKEND,
+                        help="metadata backend (geodatabases need arcpy)")
+    args = parser.parse_args()
+    updateMetadata.METADATA_BACKEND = args.backend
+
+    rules = load_rules(args.migrations, args.rules)
+    if not rules:
+        parser.error("Name a migration or give a --rules file")
+    rows = datasetSource.manifest_rows(args.manifest) if args.manifest else datasetSource.directory_rows(args.directory)
+    dataset_directories = datasetSource.select(rows, args.rights, args.name)
+
+    start = time.perf_counter()
+    summary = {"datasets": 0, "changed": 0, "failed": 0}
+    for result in run(dataset_directories, rules, args.dry_run, args.workers):
+        summary["datasets"] += 1
+        if result["error"] is not None:
+            summary["failed"] += 1
+            print(f"Failed: {result['dataset']}: {result['error']}")
+        elif result["changes"]:
+            summary["changed"] += 1
+            if args.dry_run:
+                print(f"--- {result['dataset']}")
+                for where, old, new in result["changes"]:
+                    print(f"@@ {where} @@\n-{old}\n+{new}")
+    print(f"{summary['datasets']} datasets in {time.perf_counter() - start:.2f} s: {summary['changed']} "
+          f"{'would change' if args.dry_run else 'changed'}, {summary['failed']} failed")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,204 @@
-from pathlib import Path
+"""
+Move the dataset directories listed in move.csv, e.g. into redo/. Run `python moveFiles.py [move.csv]`
+- Each row is a source path and optionally a destination; without one it is <source>/../../redo/<source name>
+- Every move is checked before anything moves: missing sources or drives, collisions, moves into themselves and cycles
+- Moves within a volume are renames. Moves across volumes are copied in parallel, verified, and only then deleted.
+- Every finished move goes in an undo log, which `python moveFiles.py --undo <log>` plays back
+"""
+
+import argparse
 import csv
+import hashlib
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 movecsv_path = Path(r"C:\Users\srappel\Desktop\move.csv")
-movecsv = open(movecsv_path, "r")
-reader = csv.reader(movecsv)
 
-for row in reader:
-    dirpath = Path(row[0])
-    destpath = dirpath.parent.parent / "redo" / dirpath.stem
-    dirpath.rename(destpath)
+# Cross-volume moves copied at once. They are bound by the network share, not the CPU.
+WORKERS = 8
+
+# Bytes read and written at a time when copying across volumes
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def default_destination(source) -> Path:
+    return source.parent.parent / "redo" / source.stem
+
+def read_moves(csv_path) -> list[tuple[Path, Path]]:
+    # (source, destination) for every row of the CSV, read in one pass
+    with open(csv_path, newline="") as movecsv:
+        return [(Path(row[0].strip()), Path(row[1].strip()) if len(row) > 1 and row[1].strip() else default_destination(Path(row[0].strip())))
+                for row in csv.reader(movecsv, skipinitialspace=True) if row and row[0].strip()]
+
+def key(path) -> str:
+    # Paths compared the way the file system compares them
+    return os.path.normcase(os.path.abspath(path))
+
+def plan(moves) -> tuple[list[list[tuple[Path, Path]]], list[str]]:
+    '''Check every move and order them into waves
+    - A move whose destination is another move's source waits for that move, so chains like A -> B, B -> C work
+    - Returns the waves, to run one after the other, and the problems; a move with a problem is left out
+    '''
+    problems = []
+    sources, destinations = {}, {}
+    for source, destination in moves:
+        if key(source) in sources:
+            problems.append(f"{source} is listed more than once")
+        elif not source.exists():
+            problems.append(f"{source} does not exist")
+        elif key(destination) in destinations:
+            problems.append(f"{source} and {destinations[key(destination)][0]} would both move to {destination}")
+        elif key(destination) == key(source) or key(destination).startswith(key(source) + os.sep):
+            problems.append(f"{source} can't move into itself ({destination})")
+        elif existing_ancestor(destination) is None:
+            problems.append(f"{source} can't move to {destination}: its drive or share does not exist")
+        else:
+            sources[key(source)] = (source, destination)
+            destinations[key(destination)] = (source, destination)
+
+    # Moves that need another move to vacate their destination first, and how far down the chain they are
+    waves = {}
+    for move_key, (source, destination) in sources.items():
+        chain = [move_key]
+        while key(sources[chain[-1]][1]) in sources:
+            next_key = key(sources[chain[-1]][1])
+            if next_key in chain:
+                cycle = chain[chain.index(next_key):] + [next_key]
+                problems.append(f"{source} is in a cycle of moves: {' -> '.join(str(sources[k][0]) for k in cycle)}")
+                break
+            chain.append(next_key)
+        else:
+            last_destination = sources[chain[-1]][1]
+            if last_destination.exists():
+                problems.append(f"{source} can't move to {destination}: {last_destination} already exists")
+            else:
+                waves.setdefault(len(chain) - 1, []).append((source, destination))
+    return [waves[depth] for depth in sorted(waves)], problems
+
+def existing_ancestor(path):
+    # The nearest ancestor of path that exists, or None when not even its drive or share does
+    parent = Path(os.path.abspath(path)).parent
+    while not os.path.exists(parent):
+        if parent == parent.parent:
+            return None
+        parent = parent.parent
+    return parent
+
+def same_volume(source, destination) -> bool:
+    # The destination's nearest existing ancestor is on the same device as the source
+    parent = existing_ancestor(destination)
+    if parent is None:
+        raise Exception(f"Nothing above {destination} exists, not even its drive")
+    return os.stat(source).st_dev == os.stat(parent).st_dev
+
+def copy_verified(source, destination) -> None:
+    # Copy one file in chunks, then read the copy back and compare SHA-256 digests
+    written = hashlib.sha256()
+    with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+        while chunk := source_file.read(CHUNK_SIZE):
+            written.update(chunk)
+            destination_file.write(chunk)
+    copied = hashlib.sha256()
+    with open(destination, "rb") as destination_file:
+        while chunk := destination_file.read(CHUNK_SIZE):
+            copied.update(chunk)
+    if copied.digest() != written.digest():
+        raise Exception(f"The copy of {source} at {destination} does not match")
+    shutil.copystat(source, destination)
+
+def copy_move(source, destination) -> None:
+    '''Move across volumes: copy into <destination>.partial, verify every file, rename it into place, then delete the source
+    - A failed copy is removed and the source is left as it was
+    '''
+    partial = destination.with_name(destination.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        if source.is_dir():
+            for directory, _, files in os.walk(source):
+                target = partial / os.path.relpath(directory, source)
+                target.mkdir(parents=True, exist_ok=True)
+                for name in files:
+                    copy_verified(Path(directory) / name, target / name)
+        else:
+            copy_verified(source, partial)
+        os.rename(partial, destination)
+    except BaseException:
+        if partial.is_dir():
+            shutil.rmtree(partial, ignore_errors=True)
+        elif partial.exists():
+            partial.unlink()
+        raise
+    if source.is_dir():
+        shutil.rmtree(source)
+    else:
+        source.unlink()
+
+def move(source, destination) -> None:
+    if destination.exists():
+        raise Exception(f"{destination} already exists")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if same_volume(source, destination):
+        os.rename(source, destination)
+    else:
+        copy_move(source, destination)
+
+def execute(waves, undo_log_path, workers=WORKERS) -> dict:
+    '''Run the waves of moves, the moves of a wave in parallel
+    - Every move that finishes goes in the undo log straight away, as its destination and source
+    - A failed move is reported and the rest carry on
+    '''
+    summary = {"moved": 0, "failed": {}}
+    with open(undo_log_path, "a", newline="") as undo_log, ThreadPoolExecutor(workers) as executor:
+        undo_writer = csv.writer(undo_log)
+        for wave in waves:
+            futures = {executor.submit(move, source, destination): (source, destination) for source, destination in wave}
+            for future in as_completed(futures):
+                source, destination = futures[future]
+                try:
+                    future.result()
+                except Exception as error:
+                    summary["failed"][str(source)] = f"{type(error).__name__}: {error}"
+                    print(f"Failed to move {source} to {destination}: {error}")
+                    continue
+                undo_writer.writerow([destination, source])
+                undo_log.flush()
+                summary["moved"] += 1
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move the directories listed in a CSV, checking every move first")
+    parser.add_argument("csv", type=Path, nargs="?", default=movecsv_path, help="rows of source[, destination]")
+    parser.add_argument("--undo", type=Path, help="move everything in this undo log back where it came from")
+    parser.add_argument("--undo-log", type=Path, help="where to log finished moves (default: next to the CSV)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="check and print the moves without moving anything")
+    parser.add_argument("--skip-invalid", action="store_true", help="make the valid moves even if others have problems")
+    args = parser.parse_args()
+
+    if args.undo is not None:
+        # The undo log is already destination, source; the last move is undone first
+        moves = list(reversed(read_moves(args.undo)))
+        undo_log_path = args.undo_log or args.undo.with_name(f"{args.undo.stem}_redo.csv")
+    else:
+        moves = read_moves(args.csv)
+        undo_log_path = args.undo_log or args.csv.with_name(f"{args.csv.stem}_undo.csv")
+
+    waves, problems = plan(moves)
+    for problem in problems:
+        print(f"Problem: {problem}")
+    if problems and not args.skip_invalid:
+        print(f"Nothing was moved. Fix the {len(problems)} problems or use --skip-invalid")
+        return
+    if args.dry_run:
+        for number, wave in enumerate(waves, 1):
+            for source, destination in wave:
+                print(f"{number}: {source} -> {destination}")
+        return
+
+    summary = execute(waves, undo_log_path, args.workers)
+    print(f"Moved {summary['moved']}, {len(summary['failed'])} failed. Undo with `python moveFiles.py --undo {undo_log_path}`")
+
+if __name__ == "__main__":
+    main()
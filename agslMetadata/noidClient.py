@@ -0,0 +1,201 @@
+"""
+Client for the UWM NOID service: minting, binding and fetching over one pooled connection
+"""
+
+import re
+import requests
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+
+ARK_REGEX = r"(\d{5})\/(\w{11})"
+
+# Status codes worth retrying. Everything else is treated as a real answer.
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# The NOID round-trips made by each thread: how many, and the seconds spent waiting on them (see runLog)
+_http_stats = threading.local()
+
+class NoidError(Exception):
+    pass
+
+class NoidClient:
+    '''Talks to one NOID service, e.g. 'https://digilib-admin.uwm.edu/noidu_gmgs?'
+    - Keeps one requests.Session, so every call reuses pooled keep-alive connections
+    - Retries connection errors and 5xx/429 answers with exponential backoff
+    '''
+
+    offline = False # See arkPool.OfflineNoidClient
+
+    def __init__(self, noid_url, retries=4, backoff=0.5, timeout=60):
+        self.noid_url = noid_url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, query, data=None) -> requests.models.Response:
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.noid_url + query, data=data, timeout=self.timeout)
+                if response.status_code not in RETRY_STATUS:
+                    break
+                problem = f"status code {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as error:
+                response = None
+                problem = error
+            finally:
+                record_request(time.perf_counter() - start)
+            if attempt == self.retries:
+                raise NoidError(f"NOID request `{query}` failed after {self.retries + 1} attempts: {problem}")
+            print(f"NOID request `{query}` failed ({problem}), retrying...")
+            time.sleep(self.backoff * 2 ** attempt)
+        if response.status_code != 200:
+            raise NoidError(f"NOID request `{query}` returned status code {response.status_code}")
+        return response
+
+    def mint(self, count=1) -> list[str]:
+        # One `mint+N` request. Returns the arkids in the order NOID minted them.
+        return minted_arkids(self.request("GET", f"mint+{count}").text)
+
+    def run_commands(self, commands) -> requests.models.Response:
+        # POST a newline separated NOID command script to `?-`
+        return self.request("POST", "-", data="".join(command + "\n" for command in commands))
+
+    def bind(self, arkid, bind_params) -> str:
+        # Sends every `bind set` for one arkid in a single POST and returns its status
+        response = self.run_commands(bind_commands(arkid, bind_params))
+        return ark_statuses([arkid], response.text)[arkid]
+
+    def fetch(self, arkids) -> dict[str, dict[str, str]]:
+        '''Fetch the bindings of many arkids with a single POST
+        - Returns {arkid: {element: value}}
+        '''
+        response = self.run_commands([f"fetch {arkid}" for arkid in arkids])
+        bindings = {arkid: {} for arkid in arkids}
+        current = None
+        for line in response.text.splitlines():
+            key, _, value = line.partition(":")
+            if key == "id":
+                current = bindings.setdefault(value.strip(), {})
+            elif current is not None and value:
+                current[key.strip()] = value.strip()
+        return bindings
+
+class BindBatch:
+    '''Collects bind and purge commands for many arkids and sends them as one POST per batch
+    - The batch is flushed once it holds max_commands commands or its oldest command is max_wait seconds old
+    - flush() returns the status of every arkid in the batch: "ok" or the error text
+    - statuses keeps the status of every arkid flushed so far, until it is popped; take_purged() pops the purges
+    '''
+
+    def __init__(self, client, max_commands=500, max_wait=30.0):
+        self.client = client
+        self.max_commands = max_commands
+        self.max_wait = max_wait
+        self.commands: list[str] = []
+        self.arkids: list[str] = []
+        self.started = None
+        self.statuses: dict[str, str] = {}
+        self.purging: set[str] = set() # Purged arkids whose statuses haven't been taken yet
+
+    def set(self, arkid, bind_params) -> dict[str, str]:
+        return self.add(arkid, bind_commands(arkid, bind_params))
+
+    def purge(self, arkid, elements) -> dict[str, str]:
+        self.purging.add(arkid)
+        return self.add(arkid, bind_commands(arkid, dict.fromkeys(elements), purge=True))
+
+    def add(self, arkid, commands) -> dict[str, str]:
+        # Returns the statuses of a batch if adding these commands flushed one, otherwise {}
+        if len(commands) == 0:
+            # Nothing to send is bound already
+            self.statuses[arkid] = "ok"
+            return {}
+        if self.started is None:
+            self.started = time.monotonic()
+        self.commands.extend(commands)
+        if arkid not in self.arkids:
+            self.arkids.append(arkid)
+        if self.due():
+            return self.flush()
+        return {}
+
+    def take_purged(self) -> dict[str, str]:
+        # Pop the statuses of the purges flushed so far, so a long-lived batch doesn't keep them
+        purged = {arkid: self.statuses.pop(arkid) for arkid in self.purging if arkid in self.statuses}
+        self.purging.difference_update(purged)
+        return purged
+
+    def due(self) -> bool:
+        if len(self.commands) == 0:
+            return False
+        return len(self.commands) >= self.max_commands or time.monotonic() - self.started >= self.max_wait
+
+    def flush(self) -> dict[str, str]:
+        if len(self.commands) == 0:
+            return {}
+        commands, arkids = self.commands, self.arkids
+        self.commands, self.arkids, self.started = [], [], None
+        try:
+            statuses = ark_statuses(arkids, self.client.run_commands(commands).text)
+        except NoidError as error:
+            statuses = {arkid: str(error) for arkid in arkids}
+        self.statuses.update(statuses)
+        return statuses
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+def http_stats() -> tuple[int, float]:
+    # NOID requests made by the current thread so far, and the seconds spent on them
+    return getattr(_http_stats, "requests", 0), getattr(_http_stats, "seconds", 0.0)
+
+def record_request(seconds) -> None:
+    requests_made, seconds_waited = http_stats()
+    _http_stats.requests = requests_made + 1
+    _http_stats.seconds = seconds_waited + seconds
+
+def minted_arkids(text) -> list[str]:
+    # The arkids in the answer to a `mint+N`, in the order NOID minted them
+    arkids = list(dict.fromkeys(match[0] for match in re.finditer(ARK_REGEX, text)))
+    if len(arkids) == 0:
+        raise NoidError("Failed to mint an arkid!")
+    return arkids
+
+def bind_commands(arkid, bind_params, purge=False) -> list[str]:
+    if purge:
+        return [f'bind purge {arkid} {key}' for key in bind_params]
+    return [f'bind set {arkid} {key} "{value}"' for key, value in bind_params.items()]
+
+def ark_statuses(arkids, response_text) -> dict[str, str]:
+    '''Work out which arkids in a command script failed
+    - NOID reports problems on lines starting with "error"
+    - An error line naming an arkid fails that arkid; one that names none fails them all
+    '''
+    statuses = {arkid: "ok" for arkid in arkids}
+    for line in response_text.splitlines():
+        if not line.lower().startswith("error"):
+            continue
+        match = re.search(ARK_REGEX, line)
+        failed = [match[0]] if match is not None and match[0] in statuses else arkids
+        for arkid in failed:
+            if statuses[arkid] == "ok":
+                statuses[arkid] = line.strip()
+    return statuses
+
+_clients: dict[str, NoidClient] = {}
+
+def get_client(noid_url) -> NoidClient:
+    # One shared client per NOID service per process, so its connections get reused
+    if noid_url not in _clients:
+        _clients[noid_url] = NoidClient(noid_url)
+    return _clients[noid_url]
@@ -0,0 +1,17 @@
+"""
+Streaming executor.map() for the tools that run over a whole archive
+"""
+
+from collections import deque
+
+def bounded_map(executor, function, items, window):
+    '''executor.map() without taking every item up front: at most window submitted ahead of the results taken
+    - Results come back in the order of items, and items can be any iterable, like a datasetSource generator
+    '''
+    futures = deque()
+    for item in items:
+        futures.append(executor.submit(function, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
@@ -0,0 +1,146 @@
+"""
+Structured JSONL event log of ingest runs, and a summary of where the time went. Run `python runLog.py <log>`
+"""
+
+import argparse
+import contextlib
+import heapq
+import json
+import noidClient
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+# Failures kept in memory for the end-of-run report. Every failure is in the run log and the CSV either way.
+RECENT_FAILURES = 20
+
+def timestamp() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+@contextlib.contextmanager
+def stage(events, dataset, stage_name):
+    '''Time one stage of one dataset and append its event to events
+    - Yields a dict the stage can add measures to, like bytes_read and bytes_written
+    - Records the NOID requests the current thread made during the stage and the seconds spent waiting on them
+    - An exception is recorded in the event and raised again
+    '''
+    measures = {}
+    event = {"dataset": str(dataset), "stage": stage_name, "start": timestamp()}
+    http_requests, http_seconds = noidClient.http_stats()
+    start = time.perf_counter()
+    try:
+        yield measures
+        event["status"] = "ok"
+    except Exception as error:
+        event["status"] = "failed"
+        event["error"] = f"{type(error).__name__}: {error}"
+        raise
+    finally:
+        event["end"] = timestamp()
+        event["seconds"] = round(time.perf_counter() - start, 6)
+        requests_made, seconds_waited = noidClient.http_stats()
+        if requests_made > http_requests:
+            event["http_requests"] = requests_made - http_requests
+            event["http_seconds"] = round(seconds_waited - http_seconds, 6)
+        event.update(measures)
+        events.append(event)
+
+class RunLog:
+    '''Appends events to a JSONL file, one JSON object per line
+    - Only the process running the batch writes; workers hand their events back with their results
+    - Every event is tagged with the run it belongs to
+    '''
+
+    def __init__(self, path, run=None):
+        self.path = Path(path)
+        self.run = run or timestamp()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, events) -> None:
+        for event in events:
+            self.file.write(json.dumps({"run": self.run, **event}) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_events(path, run=None):
+    # Stream the events of one run (or every run) from a run log
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            if line.strip():
+                event = json.loads(line)
+                if run is None or event.get("run") == run:
+                    yield event
+
+def last_run(path) -> str:
+    run = None
+    for event in read_events(path):
+        run = event.get("run", run)
+    return run
+
+def percentile(values, fraction) -> float:
+    # Nearest-rank percentile of sorted values
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+def summarize(path, run=None, slowest=10) -> dict:
+    '''Per-stage percentiles, NOID and I/O totals, failures and the slowest datasets of one run
+    - Streams the log once; keeps one duration per event and one total per dataset
+    '''
+    stages = {}
+    dataset_seconds = {}
+    failures = 0
+    for event in read_events(path, run):
+        summary = stages.setdefault(event["stage"], {"seconds": [], "http_seconds": 0.0, "http_requests": 0,
+                                                     "bytes_read": 0, "bytes_written": 0, "failed": 0})
+        summary["seconds"].append(event["seconds"])
+        for measure in ("http_seconds", "http_requests", "bytes_read", "bytes_written"):
+            summary[measure] += event.get(measure, 0)
+        if event["status"] == "failed":
+            summary["failed"] += 1
+            failures += 1
+        if event.get("dataset"):
+            dataset_seconds[event["dataset"]] = dataset_seconds.get(event["dataset"], 0.0) + event["seconds"]
+
+    for summary in stages.values():
+        seconds = sorted(summary.pop("seconds"))
+        summary.update(count=len(seconds), total=sum(seconds), p50=percentile(seconds, 0.5),
+                       p90=percentile(seconds, 0.9), p99=percentile(seconds, 0.99), max=seconds[-1])
+    return {"stages": stages, "datasets": len(dataset_seconds), "failures": failures,
+            "slowest": heapq.nlargest(slowest, dataset_seconds.items(), key=lambda item: item[1])}
+
+def print_summary(summary) -> None:
+    print(f"{summary['datasets']} datasets, {summary['failures']} failed stages\n")
+    print("%-14s %6s %9s %9s %9s %9s %10s %10s %10s" % ("Stage", "Count", "p50 s", "p90 s", "p99 s", "Max s",
+                                                        "Total s", "NOID s", "MB"))
+    for name, stage_summary in summary["stages"].items():
+        megabytes = (stage_summary["bytes_read"] + stage_summary["bytes_written"]) / 1024 / 1024
+        print("%-14s %6d %9.3f %9.3f %9.3f %9.3f %10.1f %10.1f %10.1f" % (
+            name, stage_summary["count"], stage_summary["p50"], stage_summary["p90"], stage_summary["p99"],
+            stage_summary["max"], stage_summary["total"], stage_summary["http_seconds"], megabytes))
+    print("\nSlowest datasets:")
+    for dataset, seconds in summary["slowest"]:
+        print(f"{seconds:10.3f} s  {dataset}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarize an ingest run log")
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--run", help="the run to summarize (default: the last one in the log)")
+    parser.add_argument("--all-runs", action="store_true")
+    parser.add_argument("--slowest", type=int, default=10, help="how many of the slowest datasets to list")
+    args = parser.parse_args()
+
+    run = None if args.all_runs else args.run or last_run(args.log)
+    if run is not None:
+        print(f"Run {run}")
+    print_summary(summarize(args.log, run, args.slowest))
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,108 @@
 # Make sure that every dataset has a matching metadata record and vice versa:
 
+import argparse
+import json
+import os
+import re
+import sys
+
+from datetime import datetime
 from pathlib import Path
+from updateMetadata import FILE_SERVER_PATH, RIGHTS
 
-FILE_SERVER_PATH = Path(r"S:\GeoBlacklight\web")
-
-metadata_path = FILE_SERVER_PATH / "metadata"
-public_path = FILE_SERVER_PATH / "public"
-restricted_uw_system_path = FILE_SERVER_PATH / "restricted-uw-system"
-
-# Check to make sure a folder exists for each metdata record in the metadata directory
-for file in metadata_path.iterdir():
-    arkid = file.name[:11] # would be more accurate with regex
-    check_public_path = public_path / arkid
-    check_restricted_uw_system_path = restricted_uw_system_path / arkid
-    if check_public_path.exists() and check_public_path.is_dir():
-        continue
-    elif check_restricted_uw_system_path.exists() and check_restricted_uw_system_path.is_dir():
-        continue
-    else:
-        print(f'{arkid} was not found in public or restricted directories')
+# Dataset directories are named by the arkid's assigned name, metadata records are <assigned name>_ISO.xml
+DATASET_REGEX = re.compile(r"^(\w{11})$")
+METADATA_REGEX = re.compile(r"^(\w{11})_ISO\.xml$")
 
-# Check to make sure that all directories in public have corresponding metadata:
-for data_dir in public_path.iterdir():
-    if data_dir.is_dir():
-        arkid = data_dir.name
-    else:
-        print(f'{data_dir} is not a directory!')
+def list_directory(directory, name_regex) -> tuple[dict[str, bool], list[str]]:
+    '''List a directory once with os.scandir
+    - Returns the assigned names found, each with whether it is a directory, and the entries that don't look like one
+    '''
+    names = {}
+    unrecognized = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = name_regex.match(entry.name)
+            if match is None:
+                unrecognized.append(entry.name)
+            else:
+                names[match[1]] = entry.is_dir() # No extra stat: scandir already knows the entry type
+    return names, sorted(unrecognized)
 
-    check_metadata_path = metadata_path / f'{arkid}_ISO.xml'
-    if check_metadata_path.exists():
-        continue
-    else:
-        print(f"No metadata for {arkid} from public directory")
+def list_if_present(directory, name_regex, report) -> tuple[dict[str, bool], list[str]]:
+    # A missing directory lists as empty and goes in the report
+    try:
+        return list_directory(directory, name_regex)
+    except FileNotFoundError:
+        report["missing_directories"].append(directory.name)
+        return {}, []
 
-# Check to make sure that all directories in restricted have corresponding metadata:
-for data_dir in restricted_uw_system_path.iterdir():
-    if data_dir.is_dir():
-        arkid = data_dir.name
-    else:
-        print(f'{data_dir} is not a directory!')
+def check(file_server_path=FILE_SERVER_PATH, rights=RIGHTS) -> dict:
+    '''Reconcile the metadata directory with every rights directory using one listing of each
+    - orphaned_metadata: metadata records without a dataset directory in any rights directory
+    - missing_metadata: dataset directories without a metadata record, by rights directory
+    - not_directories: entries of a rights directory that are files, by rights directory
+    - duplicates: assigned names found in more than one rights directory
+    - unrecognized: entries whose names aren't an assigned name (or <assigned name>_ISO.xml)
+    - missing_directories: the metadata or rights directories that don't exist
+    '''
+    file_server_path = Path(file_server_path)
+    report = {"checked_at": datetime.now().replace(microsecond=0).isoformat(),
+              "file_server_path": str(file_server_path),
+              "counts": {},
+              "orphaned_metadata": [],
+              "missing_metadata": {},
+              "not_directories": {},
+              "duplicates": {},
+              "unrecognized": {},
+              "missing_directories": []}
+
+    metadata, report["unrecognized"]["metadata"] = list_if_present(file_server_path / "metadata", METADATA_REGEX, report)
+    metadata = set(metadata)
+    report["counts"]["metadata"] = len(metadata)
 
-    check_metadata_path = metadata_path / f'{arkid}_ISO.xml'
-    if check_metadata_path.exists():
-        continue
+    datasets = {} # assigned name -> rights directories holding it as a directory
+    for rights_name in rights:
+        names, unrecognized = list_if_present(file_server_path / rights_name, DATASET_REGEX, report)
+        directories = {name for name, is_dir in names.items() if is_dir}
+        for name in directories:
+            datasets.setdefault(name, []).append(rights_name)
+        report["counts"][rights_name] = len(directories)
+        report["missing_metadata"][rights_name] = sorted(directories - metadata)
+        report["not_directories"][rights_name] = sorted(set(names) - directories)
+        report["unrecognized"][rights_name] = unrecognized
+
+    report["counts"]["datasets"] = len(datasets)
+    report["orphaned_metadata"] = sorted(metadata - datasets.keys())
+    report["duplicates"] = {name: found for name, found in sorted(datasets.items()) if len(found) > 1}
+    return report
+
+def summarize(report) -> None:
+    print(f'There are {report["counts"]["metadata"]} metadata records')
+    print(f'There are {report["counts"]["datasets"]} datasets')
+    print(f'{len(report["orphaned_metadata"])} metadata records have no dataset directory')
+    for rights_name, missing in report["missing_metadata"].items():
+        print(f"{len(missing)} datasets in {rights_name} have no metadata")
+    for rights_name, files in report["not_directories"].items():
+        if files:
+            print(f"{len(files)} entries in {rights_name} are not directories")
+    print(f'{len(report["duplicates"])} datasets are in more than one rights directory')
+    for directory in report["missing_directories"]:
+        print(f"{directory} does not exist")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that every dataset on the fileserver has metadata and vice versa")
+    parser.add_argument("--file-server-path", type=Path, default=FILE_SERVER_PATH)
+    parser.add_argument("--report", type=Path, help="write the JSON report here instead of to stdout")
+    args = parser.parse_args()
+
+    report = check(args.file_server_path)
+    if args.report is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
     else:
-        print(f"No metadata for {arkid} from restricted directory")
-
-# Do some math:
-metadata_sum = sum(1 for _ in metadata_path.iterdir())
-public_sum = sum(1 for _ in public_path.iterdir())
-restricted_uw_system_sum = sum(1 for _ in restricted_uw_system_path.iterdir())
-total = public_sum + restricted_uw_system_sum
-print(f'There are {str(metadata_sum)} metadata records')
-print(f'There are {str(total)} datasets')
+        args.report.write_text(json.dumps(report, indent=2))
+        summarize(report)
+
+if __name__ == "__main__":
+    main()
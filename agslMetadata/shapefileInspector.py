@@ -0,0 +1,274 @@
+"""
+Shapefile facts without arcpy: geometry type, bounding box, feature count, fields and coordinate system, read from
+the headers of the .shp, .shx, .dbf and .prj. The files are memory-mapped and only their headers are touched,
+so a shapefile of any size costs a few page reads. Run `python shapefileInspector.py --directory <archive>` to
+check every shapefile in an archive directory against its metadata.
+"""
+
+import argparse
+import csv
+import datasetScan
+import math
+import metadataBackend
+import metadataFields
+import mmap
+import os
+import poolMap
+import re
+import struct
+import sys
+import time
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SHAPE_TYPES = {0: "Null", 1: "Point", 3: "PolyLine", 5: "Polygon", 8: "MultiPoint", 11: "PointZ", 13: "PolyLineZ",
+               15: "PolygonZ", 18: "MultiPointZ", 21: "PointM", 23: "PolyLineM", 25: "PolygonM", 28: "MultiPointM",
+               31: "MultiPatch"}
+
+SHP_HEADER_SIZE = 100
+DBF_HEADER_SIZE = 32
+DBF_FIELD_SIZE = 32
+
+# The bounding box in the ArcGIS metadata, to compare with the data's
+METADATA_BOUNDS = {"west": ".//GeoBndBox/westBL", "south": ".//GeoBndBox/southBL",
+                   "east": ".//GeoBndBox/eastBL", "north": ".//GeoBndBox/northBL"}
+
+# Degrees the metadata's bounding box can be short of the data's before it is reported
+BOUNDS_TOLERANCE = 0.001
+
+# Shapefiles inspected at once. Reading headers off the archive share is all waiting, so threads do.
+WORKERS = 16
+
+CRS_REGEX = re.compile(r'^\s*(PROJCS|GEOGCS)\s*\[\s*"([^"]*)"')
+
+def shp_header(data) -> dict:
+    # The 100-byte header .shp and .shx files share: big-endian file code and length, then little-endian the rest
+    file_code, *_, length_in_words = struct.unpack(">7i", data[:28])
+    version, shape_type = struct.unpack("<2i", data[28:36])
+    west, south, east, north = struct.unpack("<4d", data[36:68])
+    return {"file_code": file_code, "length": length_in_words * 2, "version": version, "shape_type": shape_type,
+            "bounds": (west, south, east, north)}
+
+def dbf_header(data) -> dict:
+    '''The dBASE header: record count and sizes, and every field as (name, type, length, decimals)
+    - data has to run at least to the end of the field descriptors, header_length bytes
+    '''
+    records, header_length, record_length = struct.unpack("<IHH", data[4:12])
+    fields = []
+    for offset in range(DBF_HEADER_SIZE, header_length - 1, DBF_FIELD_SIZE):
+        if data[offset] == 0x0D: # Field descriptors end
+            break
+        name, field_type, length, decimals = struct.unpack("<11sc4xBB", data[offset:offset + 18])
+        fields.append((name.split(b"\0", 1)[0].decode("latin-1"), field_type.decode("latin-1"), length, decimals))
+    return {"records": records, "header_length": header_length, "record_length": record_length, "fields": fields}
+
+def coordinate_system(prj_text) -> tuple[str, str]:
+    # ("geographic" or "projected", name) from the WKT in a .prj, or (None, None) if it can't be read
+    match = CRS_REGEX.match(prj_text)
+    if match is None:
+        return None, None
+    return "geographic" if match[1] == "GEOGCS" else "projected", match[2]
+
+def mapped(path):
+    # A read-only memory map of a whole file. Pages are only read once they are touched.
+    with open(path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def sidecars(shp_path) -> dict[str, Path]:
+    # The .shx, .dbf and .prj next to a .shp, found case-insensitively from one listing of its directory
+    shp_path = Path(shp_path)
+    wanted = {f"{shp_path.stem}{suffix}".lower(): suffix for suffix in (".shx", ".dbf", ".prj")}
+    with os.scandir(shp_path.parent) as entries:
+        return {wanted[entry.name.lower()]: Path(entry.path) for entry in entries if entry.name.lower() in wanted}
+
+def bounds_problem(bounds, kind) -> str:
+    west, south, east, north = bounds
+    if any(math.isnan(value) for value in bounds) or west > east or south > north:
+        return f"the bounding box {bounds} is not a box"
+    if kind == "geographic" and not (-180 <= west and east <= 180 and -90 <= south and north <= 90):
+        return f"the bounding box {bounds} is outside longitude -180 to 180 and latitude -90 to 90"
+    return None
+
+def inspect(shp_path) -> dict:
+    '''Everything the headers of a shapefile say, and what is wrong with them
+    - errors: the shapefile is unreadable or its headers disagree, e.g. a missing .shx or a .dbf with another count
+    - warnings: things GeoDiscovery can live without, like a missing .prj, no features, or a file whose size
+      doesn't match its header (often just padding some other software wrote)
+    '''
+    shp_path = Path(shp_path)
+    facts = {"path": str(shp_path), "shape_type": None, "features": None, "bounds": None, "fields": [],
+             "crs_kind": None, "crs": None, "errors": [], "warnings": []}
+    errors, warnings = facts["errors"], facts["warnings"]
+    parts = sidecars(shp_path)
+
+    try:
+        with mapped(shp_path) as shp:
+            if len(shp) < SHP_HEADER_SIZE:
+                errors.append(f".shp is {len(shp)} bytes, shorter than its header")
+                return facts
+            header = shp_header(shp[:SHP_HEADER_SIZE])
+            if header["file_code"] != 9994 or header["version"] != 1000:
+                errors.append(".shp does not start with a shapefile header")
+                return facts
+            if header["length"] < SHP_HEADER_SIZE:
+                errors.append(f".shp header says it is {header['length']} bytes, shorter than the header")
+                return facts
+            if header["length"] != len(shp):
+                warnings.append(f".shp is {len(shp)} bytes, its header says {header['length']}")
+    except (OSError, ValueError) as error: # mmap raises ValueError on an empty file
+        errors.append(f"Can't read the .shp: {error}")
+        return facts
+    facts["shape_type"] = SHAPE_TYPES.get(header["shape_type"])
+    if facts["shape_type"] is None:
+        errors.append(f"Unknown shape type {header['shape_type']}")
+
+    if ".shx" not in parts:
+        errors.append("No .shx")
+    else:
+        try:
+            with mapped(parts[".shx"]) as shx:
+                shx_header = shp_header(shx[:SHP_HEADER_SIZE])
+                if shx_header["length"] < SHP_HEADER_SIZE or (shx_header["length"] - SHP_HEADER_SIZE) % 8:
+                    errors.append(f".shx header says it is {shx_header['length']} bytes, which isn't a whole index")
+                else:
+                    # One 8-byte record per shape after the header
+                    facts["features"] = (shx_header["length"] - SHP_HEADER_SIZE) // 8
+                    if shx_header["length"] != len(shx):
+                        warnings.append(f".shx is {len(shx)} bytes, its header says {shx_header['length']}")
+        except (OSError, ValueError, struct.error) as error:
+            errors.append(f"Can't read the .shx: {error}")
+
+    if ".dbf" not in parts:
+        errors.append("No .dbf")
+    else:
+        try:
+            with mapped(parts[".dbf"]) as dbf:
+                header_length = struct.unpack("<H", dbf[8:10])[0]
+                table = dbf_header(dbf[:header_length])
+                facts["fields"] = table["fields"]
+                expected = table["header_length"] + table["records"] * table["record_length"]
+                if len(dbf) not in (expected, expected + 1): # Usually followed by an end-of-file byte
+                    warnings.append(f".dbf is {len(dbf)} bytes, its header says {expected}")
+                if facts["features"] is None:
+                    facts["features"] = table["records"]
+                elif table["records"] != facts["features"]:
+                    errors.append(f".dbf has {table['records']} records and .shx {facts['features']} shapes")
+        except (OSError, ValueError, struct.error) as error:
+            errors.append(f"Can't read the .dbf: {error}")
+
+    if ".prj" not in parts:
+        warnings.append("No .prj, so the coordinate system is unknown")
+    else:
+        facts["crs_kind"], facts["crs"] = coordinate_system(parts[".prj"].read_text(encoding="latin-1"))
+        if facts["crs_kind"] is None:
+            warnings.append(".prj is not a WKT coordinate system")
+
+    if facts["features"] == 0:
+        warnings.append("No features")
+    else:
+        facts["bounds"] = header["bounds"]
+        problem = bounds_problem(header["bounds"], facts["crs_kind"])
+        if problem is not None:
+            warnings.append(problem)
+    return facts
+
+def validate(shp_path) -> dict:
+    # inspect() for Dataset: errors fail the dataset, warnings are printed
+    facts = inspect(shp_path)
+    for warning in facts["warnings"]:
+        print(f"Warning: {Path(shp_path).name}: {warning}")
+    if facts["errors"]:
+        raise Exception(f"{shp_path} is not a valid shapefile: " + "; ".join(facts["errors"]))
+    return facts
+
+def metadata_problems(facts, metadata_path) -> list[str]:
+    '''Compare the data's extent with the bounding box in the ArcGIS metadata, when the data is in degrees
+    - The metadata is streamed with metadataFields, so big lineages and thumbnails cost nothing
+    '''
+    if facts["bounds"] is None or facts["crs_kind"] != "geographic" or not Path(metadata_path).exists():
+        return []
+    values = metadataFields.extract(metadata_path, METADATA_BOUNDS)
+    if not all(values.values()):
+        west, south, east, north = facts["bounds"]
+        return [f"The metadata has no bounding box; the data's is {west}, {south}, {east}, {north}"]
+    try:
+        metadata = [float(values[side][0]) for side in ("west", "south", "east", "north")]
+    except ValueError:
+        return ["The metadata's bounding box isn't numbers"]
+    west, south, east, north = facts["bounds"]
+    if (metadata[0] - west > BOUNDS_TOLERANCE or metadata[1] - south > BOUNDS_TOLERANCE
+            or east - metadata[2] > BOUNDS_TOLERANCE or north - metadata[3] > BOUNDS_TOLERANCE):
+        return [f"The metadata's bounding box {tuple(metadata)} doesn't cover the data's {facts['bounds']}"]
+    return []
+
+def zip_extent(zip_path) -> tuple[float, float, float, float]:
+    '''(west, south, east, north) in degrees of the shapefile in a deliverable zip, read from the member headers
+    - None unless the zip reads and holds one shapefile with features and a geographic .prj; projected bounds would need reprojecting
+    '''
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            names = {name.lower(): name for name in archive.namelist()}
+            shapefiles = [name for lower, name in names.items() if lower.endswith(".shp")]
+            if len(shapefiles) != 1:
+                return None
+            with archive.open(shapefiles[0]) as shp:
+                data = shp.read(SHP_HEADER_SIZE)
+            prj = names.get(shapefiles[0][:-4].lower() + ".prj")
+            kind = None if prj is None else coordinate_system(archive.read(prj).decode("latin-1"))[0]
+    except (OSError, zipfile.BadZipFile):
+        return None
+    if len(data) < SHP_HEADER_SIZE or kind != "geographic":
+        return None
+    header = shp_header(data)
+    if header["file_code"] != 9994 or header["length"] <= SHP_HEADER_SIZE or bounds_problem(header["bounds"], kind):
+        return None
+    return header["bounds"]
+
+def inspect_dataset(dataset_directory) -> dict:
+    # inspect() and metadata_problems() for one dataset directory; None if its dataset isn't a shapefile
+    dataset_type, found = datasetScan.classify(dataset_directory)
+    if dataset_type != datasetScan.SHAPEFILE:
+        return None
+    facts = inspect(found)
+    facts["warnings"].extend(metadata_problems(facts, metadataBackend.sidecar_path(found)))
+    return facts
+
+def main() -> None:
+    # Imported here: datasetSource brings in updateMetadata and the rest of ingest, which inspecting never needs
+    import datasetSource
+
+    parser = argparse.ArgumentParser(description="Read the extent and schema of every shapefile in an archive directory or manifest")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--directory", type=Path, help="every dataset directory in this directory")
+    source.add_argument("--manifest", type=Path, help="every dataset in this manifest CSV")
+    parser.add_argument("--csv", type=Path, help="write the facts of every shapefile here (default: stdout)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    rows = datasetSource.manifest_rows(args.manifest) if args.manifest else datasetSource.directory_rows(args.directory)
+    output = open(args.csv, "w", newline="", encoding="utf-8") if args.csv else sys.stdout
+    start = time.perf_counter()
+    summary = {"shapefiles": 0, "with errors": 0, "with warnings": 0}
+    try:
+        writer = csv.writer(output)
+        writer.writerow(["PATH", "SHAPE_TYPE", "FEATURES", "WEST", "SOUTH", "EAST", "NORTH", "CRS", "FIELDS", "ERRORS", "WARNINGS"])
+        with ThreadPoolExecutor(args.workers) as executor:
+            for facts in poolMap.bounded_map(executor, inspect_dataset, datasetSource.select(rows), 4 * args.workers):
+                if facts is None:
+                    continue
+                summary["shapefiles"] += 1
+                summary["with errors"] += bool(facts["errors"])
+                summary["with warnings"] += bool(facts["warnings"])
+                writer.writerow([facts["path"], facts["shape_type"], facts["features"], *(facts["bounds"] or [""] * 4),
+                                 facts["crs"], " ".join(f"{name}:{field_type}" for name, field_type, *_ in facts["fields"]),
+                                 "; ".join(facts["errors"]), "; ".join(facts["warnings"])])
+    finally:
+        if args.csv:
+            output.close()
+    print(f"{summary['shapefiles']} shapefiles in {time.perf_counter() - start:.2f} s, {summary['with errors']} with errors, "
+          f"{summary['with warnings']} with warnings", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
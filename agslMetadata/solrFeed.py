@@ -0,0 +1,198 @@
+"""
+Incremental GeoDiscovery index feed: Aardvark records for the ISO records that changed since the last feed, in Solr update batches.
+Run `python solrFeed.py --ledger <ledger.sqlite> (--solr-url <core url> | --output <directory>)`
+"""
+
+import aardvark
+import argparse
+import hashlib
+import json
+import os
+import requests
+import sqlite3
+import time
+
+from datetime import datetime
+from pathlib import Path
+from updateMetadata import FILE_SERVER_PATH
+
+# GeoDiscovery's Solr core, e.g. 'https://geodiscovery.uwm.edu/solr/blacklight-core'. Updates are POSTed to <core>/update
+SOLR_URL = None
+
+# What was fed last time, so the next feed only sends what changed
+FEED_LEDGER_PATH = None
+
+# Documents (or deletes) per Solr update request
+BATCH_SIZE = 500
+
+class FeedLedger:
+    '''The ISO records fed to Solr: their size, mtime and SHA-256, the rights directory and the Solr id
+    - A record whose size and mtime haven't changed is not read again
+    - Kept in SQLite, like the scan cache and the journal
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        with self._connect() as connection:
+            connection.execute("""CREATE TABLE IF NOT EXISTS records (
+                name TEXT PRIMARY KEY,
+                id TEXT NOT NULL,
+                rights TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                fed_at TEXT NOT NULL)""")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    def entries(self) -> dict[str, tuple]:
+        # {assigned name: (id, rights, size, mtime_ns, sha256)}
+        with self._connect() as connection:
+            rows = connection.execute("SELECT name, id, rights, size, mtime_ns, sha256 FROM records").fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def record(self, rows) -> None:
+        # rows of (name, id, rights, size, mtime_ns, sha256)
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   [(*row, now()) for row in rows])
+
+    def forget(self, names) -> None:
+        with self._connect() as connection:
+            connection.executemany("DELETE FROM records WHERE name = ?", [(name,) for name in names])
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def sha256(path) -> str:
+    with open(path, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+def plan(file_server_path, entries, full=False) -> dict:
+    '''Sort the published ISO records against the ledger entries
+    - changed: aardvark tasks, each with its (size, mtime_ns, sha256), for records that are new, edited or moved to other rights
+    - touched: ledger rows for records whose mtime changed but whose content and rights didn't
+    - deleted: {assigned name: Solr id} for records in the ledger that are no longer published
+    - full feeds every published record whatever the ledger says
+    '''
+    work, unpublished = aardvark.tasks(file_server_path, per_ark=False)
+    result = {"changed": [], "touched": [], "unchanged": 0, "unpublished": unpublished}
+    published = set()
+    for task in work:
+        iso_path, rights, *_ = task
+        name = Path(iso_path).name.removesuffix("_ISO.xml")
+        published.add(name)
+        stat = os.stat(iso_path)
+        entry = None if full else entries.get(name)
+        if entry is not None and entry[1:4] == (rights, stat.st_size, stat.st_mtime_ns):
+            result["unchanged"] += 1
+            continue
+        digest = sha256(iso_path)
+        if entry is not None and entry[1] == rights and entry[4] == digest:
+            result["touched"].append((name, entry[0], rights, stat.st_size, stat.st_mtime_ns, digest))
+            continue
+        result["changed"].append((task, (stat.st_size, stat.st_mtime_ns, digest)))
+    result["deleted"] = {name: entry[0] for name, entry in entries.items() if name not in published}
+    return result
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class UpdateWriter:
+    '''Where the Solr updates go: POSTed to a Solr core, written to numbered JSON files, or both
+    - Every request is a complete Solr JSON update: an array of documents, {"delete": [ids]} or {"commit": {}}
+    '''
+
+    def __init__(self, solr_url=None, output_dir=None, timeout=120):
+        if solr_url is None and output_dir is None:
+            raise Exception("Give a Solr URL, an output directory or both")
+        self.solr_url = solr_url.rstrip("/") if solr_url else None
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.sent = 0
+        if self.output_dir is not None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.prefix = datetime.now().strftime("%Y%m%dT%H%M%S")
+
+    def send(self, update) -> None:
+        body = json.dumps(update)
+        self.sent += 1
+        if self.output_dir is not None:
+            (self.output_dir / f"update-{self.prefix}-{self.sent:05d}.json").write_text(body, encoding="utf-8")
+        if self.solr_url is not None:
+            response = self.session.post(f"{self.solr_url}/update", data=body.encode(), timeout=self.timeout,
+                                         headers={"Content-Type": "application/json"})
+            if response.status_code != 200:
+                raise Exception(f"Solr update {self.sent} returned status code {response.status_code}: {response.text[:500]}")
+
+def feed(file_server_path=FILE_SERVER_PATH, ledger_path=FEED_LEDGER_PATH, solr_url=SOLR_URL, output_dir=None,
+         batch_size=BATCH_SIZE, workers=aardvark.WORKERS, full=False) -> dict:
+    '''Send Solr updates for the ISO records that changed since the last feed, and deletes for the ones that are gone
+    - Only changed records are read, hashed and converted, so a nightly feed costs one listing plus the changes
+    - The ledger is updated after each batch is accepted, so a failed feed resumes where it stopped
+    - Ends with one commit if anything was sent
+    '''
+    ledger = FeedLedger(ledger_path)
+    writer = UpdateWriter(solr_url, output_dir)
+    work = plan(file_server_path, ledger.entries(), full)
+    summary = {"changed": 0, "touched": len(work["touched"]), "unchanged": work["unchanged"], "deleted": 0,
+               "failed": {}, "unpublished": work["unpublished"]}
+    ledger.record(work["touched"])
+
+    # (rights, size, mtime_ns, sha256) of each changed record, for its ledger row
+    fingerprints = {Path(task[0]).name.removesuffix("_ISO.xml"): (task[1], *fingerprint) for task, fingerprint in work["changed"]}
+    records = converted(aardvark.convert_all([task for task, _ in work["changed"]], workers), summary)
+    for batch in batches(records, batch_size):
+        writer.send([record for _, record in batch])
+        ledger.record([(name, record["id"], *fingerprints[name]) for name, record in batch])
+        summary["changed"] += len(batch)
+
+    for batch in batches(sorted(work["deleted"].items()), batch_size):
+        writer.send({"delete": [solr_id for _, solr_id in batch]})
+        ledger.forget([name for name, _ in batch])
+        summary["deleted"] += len(batch)
+
+    if writer.sent:
+        writer.send({"commit": {}})
+    summary["requests"] = writer.sent
+    return summary
+
+def converted(results, summary):
+    # The (name, record) of every converted record. Failures go in the summary and are tried again next feed.
+    for name, record, error in results:
+        if error is None:
+            yield name, record
+        else:
+            summary["failed"][name] = error
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Feed the ISO records that changed since the last feed to GeoDiscovery's Solr")
+    parser.add_argument("--file-server-path", type=Path, default=FILE_SERVER_PATH)
+    parser.add_argument("--ledger", type=Path, default=FEED_LEDGER_PATH, required=FEED_LEDGER_PATH is None)
+    parser.add_argument("--solr-url", default=SOLR_URL, help="the Solr core to POST updates to")
+    parser.add_argument("--output", type=Path, help="also write every update request to this directory")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=aardvark.WORKERS)
+    parser.add_argument("--full", action="store_true", help="feed every record, not only the changed ones")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = feed(args.file_server_path, args.ledger, args.solr_url, args.output, args.batch_size, args.workers, args.full)
+    print(f"{summary['changed']} changed, {summary['deleted']} deleted, {summary['unchanged'] + summary['touched']} unchanged "
+          f"in {summary['requests']} requests, {time.perf_counter() - start:.2f} s")
+    for name in summary["unpublished"]:
+        print(f"Warning: {name}_ISO.xml has no dataset directory")
+    for name, error in summary["failed"].items():
+        print(f"Failed: {name}: {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Local stand-ins for the UWM NOID service and GeoDiscovery's Solr, for exercising the minting, binding and feed code off the network
+"""
+
+import abc
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus
+
+NAAN = "77981"
+SHOULDER = "gmgs"
+
+# NOID "extended digits" used by the eedeedk template and the NCDA check character
+XDIGITS = "0123456789bcdfghjkmnpqrstvwxz"
+
+def check_character(arkid) -> str:
+    # NOID Check Digit Algorithm: characters outside XDIGITS (like the '/') count as 0
+    total = sum(position * XDIGITS.find(char) for position, char in enumerate(arkid, 1) if char in XDIGITS)
+    return XDIGITS[total % len(XDIGITS)]
+
+def template_name(number) -> str:
+    '''Turn a sequence number into an assigned name
+    - Uses our template: the shoulder, then eedeed, then a check character
+    '''
+    chars = []
+    for radix in (10, 29, 29, 10, 29, 29): # eedeed, least significant last
+        number, remainder = divmod(number, radix)
+        chars.append(XDIGITS[remainder])
+    name = SHOULDER + "".join(reversed(chars))
+    return name + check_character(f"{NAAN}/{name}")
+
+class StandInServer(abc.ABC):
+    # Serves a handler on a localhost port from a daemon thread, as a context manager
+
+    def __init__(self, port=0):
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @abc.abstractmethod
+    def _handler(self):
+        # The BaseHTTPRequestHandler subclass to serve, closed over this server
+        ...
+
+class StandInNoidServer(StandInServer):
+    '''A tiny NOID look-alike on localhost
+    - Answers `mint+N`, `get+<arkid>` and POSTed `-` command scripts (bind set/purge, fetch/get)
+    - Keeps bindings in memory and counts requests so benchmarks can report round-trips
+    - latency adds a delay to every request to imitate the real service
+    '''
+
+    def __init__(self, latency=0.0, port=0):
+        self.latency = latency
+        self.bindings: dict[str, dict[str, str]] = {}
+        self.request_count = 0
+        self.minted = 0
+        self.fail_next = 0 # Answer the next N requests with a 503
+        super().__init__(port)
+
+    @property
+    def url(self) -> str:
+        # Same shape as updateMetadata.NOID_URL
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/noidu_gmgs?"
+
+    def mint(self, count) -> list[str]:
+        with self.lock:
+            start = self.minted
+            self.minted += count
+        return [f"{NAAN}/{template_name(number)}" for number in range(start, start + count)]
+
+    def run_command(self, command) -> str:
+        words = command.split(" ", 4)
+        if words[0] == "mint" and len(words) == 2:
+            return "".join(f"id: {arkid}\n" for arkid in self.mint(int(words[1])))
+        if words[0] in ("get", "fetch") and len(words) >= 2:
+            arkid = words[1]
+            elements = self.bindings.get(arkid, {})
+            if len(words) >= 3:
+                elements = {key: value for key, value in elements.items() if key in words[2:]}
+            lines = [f"id: {arkid}"] + [f"{key}: {value}" for key, value in elements.items()]
+            return "\n".join(lines) + "\n\n"
+        if words[0] == "bind" and len(words) >= 4:
+            how, arkid, element = words[1], words[2], words[3]
+            if how == "set" and len(words) == 5:
+                with self.lock:
+                    self.bindings.setdefault(arkid, {})[element] = words[4].strip('"')
+            elif how == "purge":
+                with self.lock:
+                    self.bindings.get(arkid, {}).pop(element, None)
+            else:
+                return f"error: unknown bind command for {arkid}: {command}\n"
+            return f"id: {arkid}\nelement: {element}\nbind: {how}\nStatus: ok\n\n"
+        return f"error: unknown command: {command}\n"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                return
+
+            def answer(self, commands):
+                with server.lock:
+                    server.request_count += 1
+                    failing = server.fail_next > 0
+                    server.fail_next -= 1 if failing else 0
+                if server.latency:
+                    time.sleep(server.latency)
+                if failing:
+                    self.send_error(503)
+                    return
+                body = "".join(server.run_command(command) for command in commands).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                query = self.path.partition("?")[2]
+                self.answer([unquote_plus(query)])
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                script = self.rfile.read(length).decode()
+                self.answer([line.strip() for line in script.splitlines() if line.strip()])
+
+        return Handler
+
+class StandInSolrServer(StandInServer):
+    '''A Solr core look-alike on localhost that takes JSON updates at <url>/update
+    - An array adds documents; an object can hold "add", "delete" (ids) and "commit"
+    - Added and deleted documents only show in `documents` after a commit, like Solr
+    - Counts requests, and fail_next answers the next N requests with a 503
+    '''
+
+    def __init__(self, port=0):
+        self.documents: dict[str, dict] = {}
+        self.pending: dict[str, dict] = {} # id: document, or None for a delete
+        self.request_count = 0
+        self.commits = 0
+        self.fail_next = 0
+        super().__init__(port)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/solr/blacklight-core"
+
+    def update(self, body) -> None:
+        if isinstance(body, list):
+            body = {"add": body}
+        with self.lock:
+            for document in body.get("add", []):
+                document = document.get("doc", document)
+                self.pending[document["id"]] = document
+            for solr_id in body.get("delete", []):
+                self.pending[solr_id] = None
+            if "commit" in body:
+                for solr_id, document in self.pending.items():
+                    if document is None:
+                        self.documents.pop(solr_id, None)
+                    else:
+                        self.documents[solr_id] = document
+                self.pending = {}
+                self.commits += 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                return
+
+            def do_POST(self):
+                with server.lock:
+                    server.request_count += 1
+                    failing = server.fail_next > 0
+                    server.fail_next -= 1 if failing else 0
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if failing:
+                    self.send_error(503)
+                    return
+                if not self.path.split("?")[0].endswith("/update"):
+                    self.send_error(404)
+                    return
+                try:
+                    server.update(json.loads(body))
+                except (ValueError, KeyError, AttributeError) as error:
+                    self.send_error(400, str(error))
+                    return
+                answer = json.dumps({"responseHeader": {"status": 0, "QTime": 0}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+        return Handler
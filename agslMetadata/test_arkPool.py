@@ -0,0 +1,89 @@
+"""
+ArkPool against the stand-in NOID server: no ARK is handed out twice, an empty pool refills, and binds made offline
+reach NOID on reconcile(). Run `python -m pytest`
+"""
+
+import arkPool
+import bindCache
+import functools
+import multiprocessing
+import noidClient
+import pytest
+import re
+import requests
+import standInServer
+
+from arkPool import ArkPool
+from standInServer import StandInNoidServer
+
+def mint(noid_url, count) -> list[str]:
+    return re.findall(r"id: (\S+)", requests.get(f"{noid_url}mint+{count}").text)
+
+def take_many(pool_path, noid_url, count) -> list[str]:
+    # One worker process taking count ARKs from a shared pool
+    pool = ArkPool(pool_path, functools.partial(mint, noid_url), batch_size=7)
+    return [pool.take() for _ in range(count)]
+
+def test_refills_when_exhausted(tmp_path):
+    with StandInNoidServer() as server:
+        pool = ArkPool(tmp_path / "pool.sqlite", functools.partial(mint, server.url), batch_size=3)
+        taken = [pool.take() for _ in range(7)]
+        assert server.request_count == 3 and server.minted == 9
+        # Oldest first, in the order NOID minted them
+        assert taken == [f"{standInServer.NAAN}/{standInServer.template_name(number)}" for number in range(7)]
+        assert pool.available() == 2
+
+        # The unused ARKs are handed out first on the next run
+        again = ArkPool(tmp_path / "pool.sqlite", functools.partial(mint, server.url), batch_size=3)
+        assert again.take() not in taken and server.request_count == 3
+
+def test_concurrent_takes_never_share_an_ark(tmp_path):
+    with StandInNoidServer() as server, multiprocessing.Pool(4) as workers:
+        results = workers.starmap(take_many, [(tmp_path / "pool.sqlite", server.url, 25)] * 4)
+        taken = [arkid for result in results for arkid in result]
+        assert len(taken) == len(set(taken)) == 100
+        # Every minted ARK was either handed out or is still in the pool
+        pool = ArkPool(tmp_path / "pool.sqlite", functools.partial(mint, server.url))
+        assert len(taken) + pool.available() == server.minted
+
+def test_offline_binds_wait_for_reconcile(tmp_path):
+    with StandInNoidServer() as server:
+        online = noidClient.NoidClient(server.url, retries=0)
+        ArkPool(tmp_path / "pool.sqlite", online.mint).refill(2)
+        offline = arkPool.OfflineNoidClient(tmp_path / "pool.sqlite")
+        first, second = offline.mint(2)
+        with pytest.raises(noidClient.NoidError):
+            offline.mint(1)
+
+        assert offline.bind(first, {"who": "AGSL", "what": "Roads"}) == "ok"
+        with noidClient.BindBatch(offline) as batch:
+            batch.set(second, {"who": "AGSL"})
+            batch.purge(second, ["who"])
+            batch.set(second, {"what": "Rivers"})
+        # Nothing reached NOID, but fetching offline answers with what it will have
+        assert server.bindings == {}
+        assert offline.fetch([first]) == {first: {"who": "AGSL", "what": "Roads"}}
+        assert offline.pool.pending_binds() == {first: ({"who": "AGSL", "what": "Roads"}, [], None),
+                                                second: ({"what": "Rivers"}, ["who"], None)}
+
+        server.bindings[second] = {"who": "stale", "when": "1999"}
+        cache = bindCache.BindCache(tmp_path / "binds.sqlite")
+        summary = arkPool.reconcile(offline.pool, online, cache)
+        assert summary == {"bound": 2, "verified": 2, "failed": {}}
+        assert server.bindings == {first: {"who": "AGSL", "what": "Roads"}, second: {"when": "1999", "what": "Rivers"}}
+        assert cache.get_all() == {first: {"who": "AGSL", "what": "Roads"}, second: {"what": "Rivers"}}
+        assert offline.pool.pending_binds() == {} and offline.pool.pending_binds(verified=True) == {}
+
+def test_reconcile_keeps_failed_binds_pending(tmp_path):
+    with StandInNoidServer() as server:
+        online = noidClient.NoidClient(server.url, retries=0)
+        ArkPool(tmp_path / "pool.sqlite", online.mint).refill(1)
+        offline = arkPool.OfflineNoidClient(tmp_path / "pool.sqlite")
+        arkid, = offline.mint(1)
+        offline.bind(arkid, {"who": "AGSL"})
+        server.fail_next = 1
+        summary = arkPool.reconcile(offline.pool, online)
+        assert summary["bound"] == 0 and arkid in summary["failed"]
+        assert list(offline.pool.pending_binds()) == [arkid]
+        assert arkPool.reconcile(offline.pool, online) == {"bound": 1, "verified": 1, "failed": {}}
+        assert server.bindings == {arkid: {"who": "AGSL"}}
@@ -0,0 +1,118 @@
+"""
+run_batch() against the stand-in NOID server and a temporary fileserver: resuming from the journal, cleaning
+out staging, and unbinding datasets that fail. Run `python -m pytest`
+"""
+
+import batchIngest
+import fixtures
+import ingestJournal
+import pytest
+import updateMetadata
+
+from pathlib import Path
+from standInServer import StandInNoidServer
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    web = tmp_path / "web"
+    for directory in ["metadata"] + updateMetadata.RIGHTS:
+        (web / directory).mkdir(parents=True)
+    with StandInNoidServer() as server:
+        monkeypatch.setattr(updateMetadata, "NOID_URL", server.url)
+        monkeypatch.setattr(updateMetadata, "FILE_SERVER_PATH", web)
+        monkeypatch.setattr(updateMetadata, "METADATA_BACKEND", "xml")
+        yield server
+
+def archive(tmp_path, count) -> list[Path]:
+    return fixtures.synthetic_archive(tmp_path / "archive", count, ("shapefile",), 0.01)
+
+class Crash(BaseException):
+    # Stops a batch the way a crash or Ctrl+C would: nothing in ingest catches it
+    pass
+
+def counting_stages(monkeypatch, fail=None, crash=None) -> list[tuple[str, str]]:
+    '''Wrap every stage of batchIngest.STAGES to record (stage, dataset name) as it runs
+    - fail: (stage, dataset name) to raise an Exception at, crash: one to raise Crash at
+    '''
+    runs = []
+
+    def wrap(stage, run_stage):
+        def wrapped(dataset):
+            runs.append((stage, dataset.path.name))
+            if (stage, dataset.path.name) == fail:
+                raise Exception(f"{stage} failed")
+            if (stage, dataset.path.name) == crash:
+                raise Crash
+            return run_stage(dataset)
+        return wrapped
+
+    monkeypatch.setattr(batchIngest, "STAGES", [(stage, description, wrap(stage, run_stage))
+                                                for stage, description, run_stage in batchIngest.STAGES])
+    return runs
+
+def test_interrupted_batch_resumes(server, tmp_path, monkeypatch):
+    first, second = archive(tmp_path, 2)
+    journal = ingestJournal.IngestJournal(tmp_path / "journal.sqlite")
+    stages = batchIngest.STAGES
+    runs = counting_stages(monkeypatch, crash=("zipped", second.name))
+    with pytest.raises(Crash):
+        batchIngest.run_batch([first, second], tmp_path / "log.csv", workers=1, journal_path=journal.db_path)
+    arkids = {dataset: journal.arkid(dataset) for dataset in (first, second)}
+    # The crash came before the first dataset's batched bind was sent, so it is unpublished too
+    assert journal.completed(second) == {"minted", "identifiers", "hours", "exported"}
+    minted = server.minted
+
+    monkeypatch.setattr(batchIngest, "STAGES", stages)
+    runs = counting_stages(monkeypatch)
+    summary = batchIngest.run_batch([first, second], tmp_path / "log.csv", workers=1, journal_path=journal.db_path)
+    assert summary["failing"] == 0
+    # Both datasets keep their arkids and only run the stages they hadn't finished
+    assert {dataset: journal.arkid(dataset) for dataset in (first, second)} == arkids and server.minted == minted
+    assert journal.is_done(first) and journal.is_done(second)
+    # Staged outputs are cleaned out and rebuilt. Binding and publishing happen in run_batch(), not these stages.
+    for dataset in (first, second):
+        assert {stage for stage, name in runs if name == dataset.name} == set(ingestJournal.STAGED_STAGES)
+    arkid = arkids[second]
+    assert server.bindings[arkid]["what"]
+    assert (updateMetadata.FILE_SERVER_PATH / "public" / arkid.split("/")[1] / f"{second.name}.zip").exists()
+
+def test_clean_staging_discards_unpublished_outputs(server, tmp_path):
+    journal = ingestJournal.IngestJournal(tmp_path / "journal.sqlite")
+    for name, stages in [("staged", ["minted", "exported", "zipped", "verified"]), ("published", ingestJournal.STAGES)]:
+        journal.record_arkid(name, f"77981/gmgs{name}")
+        for stage in stages:
+            journal.complete(name, stage)
+    left_behind = updateMetadata.staging_root() / "gmgsstaged"
+    left_behind.mkdir(parents=True)
+    (left_behind / "staged.zip").write_bytes(b"partial")
+
+    batchIngest.clean_staging(journal)
+    assert not left_behind.exists() and list(updateMetadata.staging_root().iterdir()) == []
+    # The staged stages have to run again; the rest, and published datasets, are kept
+    assert journal.completed("staged") == {"minted", "exported"}
+    assert journal.arkid("staged") == "77981/gmgsstaged"
+    assert journal.is_done("published")
+
+def test_failure_after_an_earlier_bind_unbinds(server, tmp_path, monkeypatch):
+    dataset, = archive(tmp_path, 1)
+    journal = ingestJournal.IngestJournal(tmp_path / "journal.sqlite")
+    monkeypatch.setattr(updateMetadata, "BIND_CACHE_PATH", tmp_path / "binds.sqlite")
+    publish = updateMetadata.publish
+
+    def crash(*args):
+        raise Crash
+    monkeypatch.setattr(updateMetadata, "publish", crash)
+    with pytest.raises(Crash):
+        batchIngest.run_batch([dataset], tmp_path / "log.csv", workers=1, journal_path=journal.db_path)
+    arkid = journal.arkid(dataset)
+    assert "bound" in journal.completed(dataset) and server.bindings[arkid]
+    assert updateMetadata.bind_cache().get(arkid)
+
+    # The rerun fails the dataset, so the bind the first run sent is purged
+    monkeypatch.setattr(updateMetadata, "publish", publish)
+    counting_stages(monkeypatch, fail=("zipped", dataset.name))
+    summary = batchIngest.run_batch([dataset], tmp_path / "log.csv", workers=1, journal_path=journal.db_path)
+    assert summary["failing"] == 1
+    assert server.bindings[arkid] == {}
+    assert updateMetadata.bind_cache().get(arkid) == {}
+    assert "bound" not in journal.completed(dataset)
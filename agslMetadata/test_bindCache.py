@@ -0,0 +1,59 @@
+"""
+The bind cache only lets changed elements through to NOID, against the stand-in NOID server. Run `python -m pytest`
+"""
+
+import batchIngest
+import bindCache
+import fixtures
+import ingestJournal
+import updateMetadata
+
+from standInServer import StandInNoidServer
+
+def test_changed_params():
+    bound = {"who": "AGSL", "what": "Roads", "meta-when": "2024-01-01"}
+    assert bindCache.changed_params(bound, {"who": "AGSL ", "what": "Roads", "meta-when": "2025-06-30"}) == {}
+    assert bindCache.changed_params(bound, {"who": "AGSL", "what": "Rivers", "meta-when": "2025-06-30"}) == \
+           {"what": "Rivers", "meta-when": "2025-06-30"}
+    # Elements NOID doesn't have yet count as changed
+    assert bindCache.changed_params({}, {"who": "AGSL"}) == {"who": "AGSL"}
+
+def test_rerun_only_binds_changes(tmp_path, monkeypatch):
+    web = tmp_path / "web"
+    for directory in ["metadata"] + updateMetadata.RIGHTS:
+        (web / directory).mkdir(parents=True)
+    dataset, = fixtures.synthetic_archive(tmp_path / "archive", 1, ("shapefile",), 0.01)
+    journal = ingestJournal.IngestJournal(tmp_path / "journal.sqlite")
+    with StandInNoidServer() as server:
+        monkeypatch.setattr(updateMetadata, "NOID_URL", server.url)
+        monkeypatch.setattr(updateMetadata, "FILE_SERVER_PATH", web)
+        monkeypatch.setattr(updateMetadata, "METADATA_BACKEND", "xml")
+        monkeypatch.setattr(updateMetadata, "BIND_CACHE_PATH", tmp_path / "binds.sqlite")
+        sent = []
+        run_command = server.run_command
+        monkeypatch.setattr(server, "run_command", lambda command: sent.append(command) or run_command(command))
+
+        def ingest_again() -> list[str]:
+            # Everything but the minted arkid runs again, like a re-ingest after a metadata edit
+            journal.reset(dataset, ingestJournal.STAGES[1:])
+            sent.clear()
+            assert batchIngest.run_batch([dataset], tmp_path / "log.csv", workers=1, journal_path=journal.db_path)["failing"] == 0
+            return [command for command in sent if command.startswith("bind")]
+
+        first = ingest_again()
+        arkid = journal.arkid(dataset)
+        assert sorted(command.split(" ")[3] for command in first) == sorted(updateMetadata.BIND_ELEMENTS)
+        assert updateMetadata.bind_cache().get(arkid) == server.bindings[arkid]
+
+        # Nothing changed, so nothing is sent, not even a new meta-when
+        bindings = dict(server.bindings[arkid])
+        assert ingest_again() == []
+        assert server.bindings[arkid] == bindings
+
+        # A new title goes out with meta-when, and nothing else
+        sidecar = dataset / f"{dataset.name}.shp.xml"
+        sidecar.write_text(sidecar.read_text().replace(f"<resTitle>{dataset.name.replace('_', ' ')}</resTitle>",
+                                                       "<resTitle>Retitled</resTitle>"))
+        assert [command.split(" ")[3] for command in ingest_again()] == ["what", "meta-when"]
+        assert server.bindings[arkid]["what"] == "Retitled"
+        assert updateMetadata.bind_cache().get(arkid) == server.bindings[arkid]
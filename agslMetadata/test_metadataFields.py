@@ -0,0 +1,27 @@
+"""
+metadataFields gives the same values whether a record is parsed whole or streamed. Run `python -m pytest`
+"""
+
+import metadataFields
+
+RECORD = ('<metadata xmlns:gmd="urn:gmd"><dataIdInfo><idCitation><resTitle>Real</resTitle></idCitation></dataIdInfo>'
+          '<gmd:lineage><resTitle>History</resTitle><Binary><resTitle>Thumbnail</resTitle></Binary></gmd:lineage>'
+          '<Binary><Thumbnail>{padding}</Thumbnail></Binary></metadata>')
+
+def both_sizes(paths, multiple=()) -> tuple[dict, dict]:
+    small = RECORD.format(padding="")
+    big = RECORD.format(padding="x" * 2 * metadataFields.CHUNK_SIZE)
+    assert len(small) < metadataFields.CHUNK_SIZE < len(big)
+    return metadataFields.extract(small, paths, multiple), metadataFields.extract(big, paths, multiple)
+
+def test_skipped_subtrees_at_any_size():
+    small, big = both_sizes({"title": ".//resTitle"}, multiple={"title"})
+    assert small == big == {"title": ["Real"]}
+
+def test_named_subtrees_are_searched():
+    small, big = both_sizes({"history": ".//{*}lineage/resTitle"}, multiple={"history"})
+    assert small == big == {"history": ["History"]}
+
+def test_first_value():
+    small, big = both_sizes({"title": "dataIdInfo/idCitation/resTitle", "missing": ".//resAltTitle"})
+    assert small == big == {"title": ["Real"], "missing": []}
@@ -0,0 +1,53 @@
+"""
+migrations.apply() on parsed records, and migrate() saving (or, dry run, not saving) a dataset's metadata. Run `python -m pytest`
+"""
+
+import fixtures
+import migrations
+
+import xml.etree.ElementTree as ET
+
+RECORD = ('<metadata><dataIdInfo><idCitation><resTitle>Roads 2010</resTitle></idCitation>'
+          '<idPoC><displayName>American Geographical Society Library</displayName><rpCntInfo><cntHours>8-4</cntHours></rpCntInfo></idPoC>'
+          '<idPoC><displayName>Someone else</displayName><rpCntInfo><cntHours>8-4</cntHours></rpCntInfo></idPoC>'
+          '</dataIdInfo></metadata>')
+
+def hours(root) -> list[str]:
+    return [element.text for element in root.iter("cntHours")]
+
+def test_where_and_set():
+    root = ET.fromstring(RECORD)
+    changes = migrations.apply(root, migrations.AGSL_HOURS)
+    # Only the AGSL contact matches the where
+    assert hours(root) == ["Monday – Friday: 9:00am – 4:30pm", "8-4"]
+    assert changes == [(".//rpCntInfo/cntHours/../.. .//cntHours", "8-4", "Monday – Friday: 9:00am – 4:30pm")]
+
+def test_replace():
+    root = ET.fromstring(RECORD)
+    changes = migrations.apply(root, [{"replace": {".//resTitle": [r"(\d{4})", r"(\1)"]}}])
+    assert root.findtext(".//resTitle") == "Roads (2010)"
+    assert changes == [(". .//resTitle", "Roads 2010", "Roads (2010)")]
+
+def test_no_change():
+    root = ET.fromstring(RECORD)
+    rules = [{"set": {".//resTitle": "Roads 2010"}}, {"replace": {".//resTitle": ["Rivers", "Lakes"]}},
+             {"match": ".//idPoC", "where": {"./displayName": "Nobody"}, "set": {".//cntHours": "never"}}]
+    assert migrations.apply(root, rules) == []
+    assert ET.tostring(root, encoding="unicode") == RECORD
+
+def test_dry_run_does_not_save(tmp_path):
+    shp = fixtures.synthetic_shapefile(tmp_path / "Roads", "Roads", kilobytes=1)
+    sidecar = shp.with_name("Roads.shp.xml")
+    before = sidecar.read_text()
+
+    result = migrations.migrate(shp.parent, migrations.AGSL_HOURS, dry_run=True)
+    assert result["error"] is None and len(result["changes"]) == 1
+    assert sidecar.read_text() == before
+
+    result = migrations.migrate(shp.parent, migrations.AGSL_HOURS)
+    assert result["error"] is None and len(result["changes"]) == 1
+    assert hours(ET.parse(sidecar).getroot()) == ["Monday – Friday: 9:00am – 4:30pm"]
+    # Once migrated there is nothing left to change, so nothing is saved
+    saved = sidecar.stat().st_mtime_ns
+    assert migrations.migrate(shp.parent, migrations.AGSL_HOURS)["changes"] == []
+    assert sidecar.stat().st_mtime_ns == saved
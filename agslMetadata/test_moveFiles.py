@@ -0,0 +1,67 @@
+"""
+moveFiles.plan() orders and checks moves, and execute() leaves an undo log that plays them back. Run `python -m pytest`
+"""
+
+import moveFiles
+import os
+
+from pathlib import Path
+
+def datasets(root, *names) -> list[Path]:
+    paths = []
+    for name in names:
+        (root / name).mkdir(parents=True)
+        (root / name / f"{name}.txt").write_text(name)
+        paths.append(root / name)
+    return paths
+
+def test_chain_runs_in_waves(tmp_path):
+    a, b = datasets(tmp_path, "a", "b")
+    c = tmp_path / "c"
+    waves, problems = moveFiles.plan([(a, b), (b, c)])
+    assert problems == []
+    # b moves out of the way before a takes its place
+    assert waves == [[(b, c)], [(a, b)]]
+
+def test_swap_and_cycle_are_problems(tmp_path):
+    a, b, c, d, e = datasets(tmp_path, "a", "b", "c", "d", "e")
+    waves, problems = moveFiles.plan([(a, b), (b, a), (c, d), (d, e), (e, c)])
+    # Each move of a cycle is reported, and none of them is made
+    assert waves == []
+    assert len(problems) == 5 and all("is in a cycle of moves" in problem for problem in problems)
+    assert f"{c} is in a cycle of moves: {c} -> {d} -> {e} -> {c}" in problems
+
+def test_collisions(tmp_path):
+    a, b, c, taken = datasets(tmp_path, "a", "b", "c", "taken")
+    waves, problems = moveFiles.plan([(a, tmp_path / "x"), (b, tmp_path / "x"), (a, tmp_path / "y"),
+                                      (c, taken), (tmp_path / "missing", tmp_path / "z"), (taken, taken / "inside")])
+    assert waves == [[(a, tmp_path / "x")]]
+    assert problems == [f"{b} and {a} would both move to {tmp_path / 'x'}",
+                        f"{a} is listed more than once",
+                        f"{tmp_path / 'missing'} does not exist",
+                        f"{taken} can't move into itself ({taken / 'inside'})",
+                        f"{c} can't move to {taken}: {taken} already exists"]
+
+def test_missing_drive(tmp_path, monkeypatch):
+    a, = datasets(tmp_path, "a")
+    destination = Path("/nowhere/redo/a")
+    exists = os.path.exists
+    monkeypatch.setattr(moveFiles.os.path, "exists", lambda path: exists(path) and not str(path).startswith(os.sep))
+    assert moveFiles.existing_ancestor(destination) is None
+    waves, problems = moveFiles.plan([(a, destination)])
+    assert waves == [] and problems == [f"{a} can't move to {destination}: its drive or share does not exist"]
+
+def test_undo_log_plays_back(tmp_path):
+    a, b = datasets(tmp_path / "data", "a", "b")
+    moves = [(a, tmp_path / "redo" / "a"), (b, tmp_path / "redo" / "b")]
+    waves, problems = moveFiles.plan(moves)
+    summary = moveFiles.execute(waves, tmp_path / "move_undo.csv", workers=2)
+    assert summary == {"moved": 2, "failed": {}} and not a.exists() and (tmp_path / "redo" / "a" / "a.txt").read_text() == "a"
+
+    undo = list(reversed(moveFiles.read_moves(tmp_path / "move_undo.csv")))
+    assert sorted(undo) == sorted((destination, source) for source, destination in moves)
+    waves, problems = moveFiles.plan(undo)
+    assert problems == []
+    assert moveFiles.execute(waves, tmp_path / "move_undo_redo.csv")["moved"] == 2
+    assert (a / "a.txt").read_text() == "a" and (b / "b.txt").read_text() == "b"
+    assert not (tmp_path / "redo" / "a").exists()
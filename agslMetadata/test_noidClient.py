@@ -0,0 +1,79 @@
+"""
+NoidClient and BindBatch against the stand-in NOID server. Run `python -m pytest`
+"""
+
+import noidClient
+import pytest
+
+from standInServer import StandInNoidServer
+
+class Answer:
+    # A canned NOID answer in place of a requests response
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+
+def test_retries_with_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(noidClient.time, "sleep", sleeps.append)
+    with StandInNoidServer() as server:
+        client = noidClient.NoidClient(server.url, retries=3, backoff=0.5)
+        server.fail_next = 2
+        assert len(client.mint(2)) == 2
+        assert server.request_count == 3 and sleeps == [0.5, 1.0]
+
+        server.fail_next = 4
+        with pytest.raises(noidClient.NoidError, match="failed after 4 attempts"):
+            client.mint(1)
+        assert server.request_count == 7 and sleeps == [0.5, 1.0, 0.5, 1.0, 2.0]
+
+def test_minted_arkids(monkeypatch):
+    client = noidClient.NoidClient("http://noid.invalid/noidu_gmgs?")
+    monkeypatch.setattr(client, "request", lambda *args, **kwargs: Answer(
+        "id: 77981/gmgs0000001\nid: 77981/gmgs0000002\nnote: 77981/gmgs0000001 again\n"))
+    assert client.mint(2) == ["77981/gmgs0000001", "77981/gmgs0000002"]
+    monkeypatch.setattr(client, "request", lambda *args, **kwargs: Answer("error: minter exhausted\n"))
+    with pytest.raises(noidClient.NoidError, match="Failed to mint"):
+        client.mint(1)
+
+def test_ark_statuses():
+    arkids = ["77981/gmgs0000001", "77981/gmgs0000002"]
+    text = "id: 77981/gmgs0000001\nStatus: ok\n\nerror: bad element for 77981/gmgs0000002\n"
+    assert noidClient.ark_statuses(arkids, text) == {arkids[0]: "ok", arkids[1]: "error: bad element for 77981/gmgs0000002"}
+    # An error naming no arkid fails every arkid in the script
+    assert noidClient.ark_statuses(arkids, "error: unauthorized\n") == dict.fromkeys(arkids, "error: unauthorized")
+
+def test_bind_batch():
+    with StandInNoidServer() as server:
+        client = noidClient.NoidClient(server.url, retries=0)
+        first, second, third = client.mint(3)
+        batch = noidClient.BindBatch(client, max_commands=4, max_wait=float("inf"))
+        assert batch.set(first, {"who": "AGSL", "what": "Roads"}) == {}
+        assert not batch.due() and server.bindings == {}
+        # The fourth command fills the batch, which goes out as one POST
+        requests_before = server.request_count
+        assert batch.set(second, {"who": "AGSL", "what": "Rivers"}) == {first: "ok", second: "ok"}
+        assert server.request_count == requests_before + 1
+        assert server.bindings == {first: {"who": "AGSL", "what": "Roads"}, second: {"who": "AGSL", "what": "Rivers"}}
+
+        # Nothing to send is bound already
+        assert batch.add(third, []) == {} and batch.statuses[third] == "ok"
+
+        batch.purge(first, ["what"])
+        assert batch.flush() == {first: "ok"} and server.bindings[first] == {"who": "AGSL"}
+        assert batch.take_purged() == {first: "ok"}
+        assert first not in batch.statuses and batch.take_purged() == {}
+
+        # A failed POST fails every arkid in it
+        batch.set(third, {"who": "AGSL"})
+        server.fail_next = 1
+        assert "503" in batch.flush()[third]
+
+def test_bind_batch_max_wait():
+    with StandInNoidServer() as server:
+        client = noidClient.NoidClient(server.url, retries=0)
+        arkid, = client.mint(1)
+        batch = noidClient.BindBatch(client, max_commands=100, max_wait=0)
+        assert batch.set(arkid, {"who": "AGSL"}) == {arkid: "ok"}
+        assert not batch.due() and batch.flush() == {}
@@ -0,0 +1,28 @@
+"""
+sanity_check.check() on a small fileserver with one of every problem it reports. Run `python -m pytest`
+"""
+
+import sanity_check
+
+def test_report(tmp_path):
+    web = tmp_path / "web"
+    for directory in ["metadata", "public", "restricted-uwm"]: # restricted-uw-system is missing
+        (web / directory).mkdir(parents=True)
+    for name in ["gmgs0000001", "gmgs0000002", "gmgs0000003", "gmgs0000009"]:
+        (web / "metadata" / f"{name}_ISO.xml").write_text("<record/>")
+    (web / "metadata" / "notes.txt").write_text("")
+    for rights, name in [("public", "gmgs0000001"), ("public", "gmgs0000002"), ("restricted-uwm", "gmgs0000002"),
+                         ("public", "gmgs0000004"), ("restricted-uwm", "gmgs0000003")]:
+        (web / rights / name).mkdir()
+    (web / "public" / "gmgs0000005").write_text("a file, not a dataset")
+    (web / "restricted-uwm" / "Thumbs.db").write_text("")
+
+    report = sanity_check.check(web)
+    assert report["counts"] == {"metadata": 4, "public": 3, "restricted-uw-system": 0, "restricted-uwm": 2, "datasets": 4}
+    assert report["orphaned_metadata"] == ["gmgs0000009"]
+    assert report["missing_metadata"] == {"public": ["gmgs0000004"], "restricted-uw-system": [], "restricted-uwm": []}
+    assert report["not_directories"] == {"public": ["gmgs0000005"], "restricted-uw-system": [], "restricted-uwm": []}
+    assert report["duplicates"] == {"gmgs0000002": ["public", "restricted-uwm"]}
+    assert report["unrecognized"] == {"metadata": ["notes.txt"], "public": [], "restricted-uw-system": [],
+                                      "restricted-uwm": ["Thumbs.db"]}
+    assert report["missing_directories"] == ["restricted-uw-system"]
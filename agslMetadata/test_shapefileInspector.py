@@ -0,0 +1,59 @@
+"""
+shapefileInspector reads the facts of a shapefile from its headers, and tells broken headers from odd file sizes. Run `python -m pytest`
+"""
+
+import fixtures
+import pytest
+import shapefileInspector
+import struct
+import zipfile
+
+def test_inspect(tmp_path):
+    shp = fixtures.synthetic_shapefile(tmp_path, "roads", kilobytes=4)
+    facts = shapefileInspector.inspect(shp)
+    features = 4 * 1024 // 28
+    assert facts["errors"] == [] and facts["warnings"] == []
+    assert facts["shape_type"] == "Point" and facts["features"] == features
+    assert facts["bounds"] == fixtures.BOUNDS
+    assert facts["fields"] == [("ID", "N", 10, 0)]
+    assert facts["crs_kind"] == "geographic"
+
+def test_size_mismatches_are_warnings(tmp_path):
+    shp = fixtures.synthetic_shapefile(tmp_path, "padded", kilobytes=1)
+    for suffix in (".shp", ".shx", ".dbf"):
+        with open(shp.with_suffix(suffix), "ab") as part:
+            part.write(b"\0\0")
+    facts = shapefileInspector.validate(shp)
+    assert facts["errors"] == [] and len(facts["warnings"]) == 3
+    assert facts["features"] == 1024 // 28
+
+def test_header_problems_are_errors(tmp_path):
+    shp = fixtures.synthetic_shapefile(tmp_path, "broken", kilobytes=1)
+    with open(shp.with_suffix(".dbf"), "r+b") as dbf:
+        dbf.seek(4)
+        dbf.write(struct.pack("<I", 1)) # One record, where the .shx indexes 36 shapes
+    shp.with_suffix(".prj").unlink()
+    facts = shapefileInspector.inspect(shp)
+    assert facts["errors"] == [".dbf has 1 records and .shx 36 shapes"]
+    assert "No .prj, so the coordinate system is unknown" in facts["warnings"]
+    with pytest.raises(Exception, match="is not a valid shapefile"):
+        shapefileInspector.validate(shp)
+
+    shp.with_suffix(".shx").unlink()
+    shp.write_bytes(b"not a shapefile" * 10)
+    facts = shapefileInspector.inspect(shp)
+    assert facts["errors"] == [".shp does not start with a shapefile header"]
+
+def test_zip_extent(tmp_path):
+    shp = fixtures.synthetic_shapefile(tmp_path / "roads", "roads", kilobytes=1)
+    with zipfile.ZipFile(tmp_path / "roads.zip", "w") as archive:
+        for part in shp.parent.iterdir():
+            archive.write(part, part.name)
+    assert shapefileInspector.zip_extent(tmp_path / "roads.zip") == fixtures.BOUNDS
+
+    # Without a .prj the bounds might not be degrees
+    with zipfile.ZipFile(tmp_path / "no_prj.zip", "w") as archive:
+        archive.write(shp, shp.name)
+    assert shapefileInspector.zip_extent(tmp_path / "no_prj.zip") is None
+    (tmp_path / "not.zip").write_bytes(b"PK not really")
+    assert shapefileInspector.zip_extent(tmp_path / "not.zip") is None
@@ -0,0 +1,67 @@
+"""
+Publishing staged outputs onto a temporary fileserver, all or nothing. Run `python -m pytest`
+"""
+
+import batchIngest
+import fixtures
+import os
+import pytest
+import updateMetadata
+
+from standInServer import StandInNoidServer
+
+def test_ingest_publishes_onto_the_fileserver(tmp_path, monkeypatch):
+    web = tmp_path / "web"
+    for directory in ["metadata"] + updateMetadata.RIGHTS:
+        (web / directory).mkdir(parents=True)
+    dataset, = fixtures.synthetic_archive(tmp_path / "archive", 1, ("shapefile",), 0.01)
+    with StandInNoidServer() as server:
+        monkeypatch.setattr(updateMetadata, "NOID_URL", server.url)
+        monkeypatch.setattr(updateMetadata, "FILE_SERVER_PATH", web)
+        monkeypatch.setattr(updateMetadata, "METADATA_BACKEND", "xml")
+        result = batchIngest.ingest_dataset(dataset)
+    assert result["row"][1] == "passing"
+    assigned_name = result["row"][2]
+    assert (web / "public" / assigned_name / f"{dataset.name}.zip").is_file()
+    assert (web / "metadata" / f"{assigned_name}_ISO.xml").is_file()
+    # Nothing is left in staging
+    assert list(updateMetadata.staging_root().iterdir()) == []
+
+def staged_dataset(tmp_path) -> tuple[list, object]:
+    staging = tmp_path / "staging" / "gmgs0000001"
+    (staging / "data").mkdir(parents=True)
+    (staging / "data" / "roads.zip").write_bytes(b"new zip")
+    (staging / "gmgs0000001_ISO.xml").write_text("new record")
+    web = tmp_path / "web"
+    (web / "public").mkdir(parents=True)
+    (web / "metadata").mkdir()
+    return [(staging / "data", web / "public" / "gmgs0000001"),
+            (staging / "gmgs0000001_ISO.xml", web / "metadata" / "gmgs0000001_ISO.xml")], staging
+
+def test_publish_replaces_earlier_outputs(tmp_path):
+    outputs, staging = staged_dataset(tmp_path)
+    (outputs[1][1]).write_text("old record")
+    updateMetadata.publish(outputs, staging)
+    assert (outputs[0][1] / "roads.zip").read_bytes() == b"new zip"
+    assert outputs[1][1].read_text() == "new record"
+    assert not staging.exists()
+
+def test_failed_rename_is_rolled_back(tmp_path, monkeypatch):
+    outputs, staging = staged_dataset(tmp_path)
+    (outputs[1][1]).write_text("old record")
+    rename = os.rename
+
+    def failing_rename(source, destination):
+        if source == outputs[1][0]:
+            raise OSError("The share went away")
+        rename(source, destination)
+    monkeypatch.setattr(updateMetadata.os, "rename", failing_rename)
+    with pytest.raises(OSError):
+        updateMetadata.publish(outputs, staging)
+    monkeypatch.undo()
+
+    # The data directory went back to staging, and the record that was there before is still published
+    assert not outputs[0][1].exists()
+    assert (outputs[0][0] / "roads.zip").read_bytes() == b"new zip"
+    assert outputs[1][1].read_text() == "old record"
+    assert outputs[1][0].read_text() == "new record"
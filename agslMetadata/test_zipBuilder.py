@@ -0,0 +1,123 @@
+"""
+Round trips of zipBuilder's output through the standard library's zipfile. Run `python -m pytest`
+"""
+
+import hashlib
+import os
+import random
+import struct
+import threading
+import zipBuilder
+import zipfile
+import zlib
+
+from pathlib import Path
+
+def write_tiff(path, compression) -> None:
+    # A little-endian TIFF whose first IFD has just a Compression tag, then some pixel bytes
+    ifd = struct.pack("<H", 1) + struct.pack("<HHI4s", 259, 3, 1, struct.pack("<H", compression) + b"\0\0") + b"\0\0\0\0"
+    path.write_bytes(b"II*\x00" + struct.pack("<I", 8) + ifd + os.urandom(5000))
+
+def source_dataset(directory) -> dict[str, bytes]:
+    # A dataset directory with an empty file, an empty folder, a member of several chunks and a stored .tif
+    directory = Path(directory)
+    (directory / "info").mkdir(parents=True)
+    (directory / "info" / "empty.dat").write_bytes(b"")
+    (directory / "empty_folder").mkdir()
+    text = b"".join(f"{number},{random.random()}\n".encode() for number in range(300000))
+    big = (text * (2 * zipBuilder.CHUNK_SIZE // len(text) + 1))[:int(2.5 * zipBuilder.CHUNK_SIZE)]
+    (directory / "multichunk.csv").write_bytes(big)
+    write_tiff(directory / "scan.tif", 5) # LZW
+    (directory / "Ünïcode.txt").write_text("non-ASCII name", encoding="utf-8")
+    return {path.relative_to(directory).as_posix(): path.read_bytes() for path in directory.rglob("*") if path.is_file()}
+
+def check_round_trip(zip_path, expected) -> dict[str, zipfile.ZipInfo]:
+    with zipfile.ZipFile(zip_path) as archive:
+        assert archive.testzip() is None
+        infos = {info.filename: info for info in archive.infolist()}
+        for name, data in expected.items():
+            assert archive.read(name) == data
+    return infos
+
+def test_build_zip_round_trip(tmp_path):
+    expected = source_dataset(tmp_path / "dataset")
+    digest = hashlib.sha256()
+    manifest = zipBuilder.build_zip(tmp_path / "dataset", tmp_path / "dataset.zip", workers=3, digest=digest)
+
+    infos = check_round_trip(tmp_path / "dataset.zip", expected)
+    assert "empty_folder/" in infos and infos["empty_folder/"].is_dir()
+    assert infos["scan.tif"].compress_type == zipfile.ZIP_STORED
+    assert infos["multichunk.csv"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["multichunk.csv"].compress_size < infos["multichunk.csv"].file_size
+    assert {entry["name"]: entry["crc"] for entry in manifest if not entry["name"].endswith("/")} == \
+           {name: zlib.crc32(data) for name, data in expected.items()}
+    assert digest.hexdigest() == hashlib.sha256((tmp_path / "dataset.zip").read_bytes()).hexdigest()
+    assert not (tmp_path / "dataset.zip.part").exists()
+
+def test_small_members_compress_in_parallel(tmp_path, monkeypatch):
+    # Three one-chunk members are only read once all three are being read at the same time
+    source = tmp_path / "shapefile"
+    source.mkdir()
+    expected = {}
+    for suffix in ("dbf", "prj", "shp", "shx", "shp.xml"):
+        expected[f"roads.{suffix}"] = f"{suffix} ".encode() * 1000
+        (source / f"roads.{suffix}").write_bytes(expected[f"roads.{suffix}"])
+    barrier = threading.Barrier(3, timeout=10)
+    calls = iter(range(len(expected)))
+    read_chunk = zipBuilder._read_chunk
+
+    def read_together(*args):
+        if next(calls) < 3:
+            try:
+                barrier.wait()
+            except threading.BrokenBarrierError:
+                pass
+        return read_chunk(*args)
+    monkeypatch.setattr(zipBuilder, "_read_chunk", read_together)
+
+    manifest = zipBuilder.build_zip(source, tmp_path / "shapefile.zip", workers=3)
+    assert not barrier.broken
+    assert [entry["name"] for entry in manifest] == sorted(expected)
+    infos = check_round_trip(tmp_path / "shapefile.zip", expected)
+    assert list(infos) == sorted(expected)
+
+def test_uncompressed_tiff_is_deflated(tmp_path):
+    write_tiff(tmp_path / "plain.tif", 1)
+    assert zipBuilder.compression_for(tmp_path / "plain.tif") == zipBuilder.DEFLATED
+
+def test_crc32_combine():
+    data = os.urandom(2 * zipBuilder.CHUNK_SIZE + 12345)
+    for cut in (0, 1, 1000, zipBuilder.CHUNK_SIZE, len(data) - zipBuilder.CHUNK_SIZE, len(data)):
+        first, second = data[:cut], data[cut:]
+        assert zipBuilder.crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)) == zlib.crc32(data)
+    # Chunk by chunk, the way build_zip() combines them
+    crc = 0
+    for start in range(0, len(data), zipBuilder.CHUNK_SIZE):
+        chunk = data[start:start + zipBuilder.CHUNK_SIZE]
+        crc = zipBuilder.crc32_combine(crc, zlib.crc32(chunk), len(chunk))
+    assert crc == zlib.crc32(data)
+
+def test_forced_zip64_members(tmp_path, monkeypatch):
+    # Every non-empty member gets ZIP64 local headers and data descriptors
+    monkeypatch.setattr(zipBuilder, "ZIP64_LIMIT", 0)
+    expected = source_dataset(tmp_path / "dataset")
+    zipBuilder.build_zip(tmp_path / "dataset", tmp_path / "dataset.zip")
+    infos = check_round_trip(tmp_path / "dataset.zip", expected)
+    with open(tmp_path / "dataset.zip", "rb") as archive:
+        for name in expected:
+            archive.seek(infos[name].header_offset)
+            version, = struct.unpack("<H", archive.read(6)[4:6]) # Version needed to extract, 45 for ZIP64
+            assert version == (45 if expected[name] else 20)
+
+def test_zip64_end_of_central_directory(tmp_path):
+    # More members than the classic end record can count
+    count = 0x10000
+    with open(tmp_path / "many.zip", "wb") as output:
+        writer = zipBuilder.ZipWriter(output)
+        for number in range(count):
+            member = writer.start_member(f"{number}.txt", zipBuilder.STORED, 0, 0o644 << 16, 0)
+            writer.end_member(member, 0, 0, 0)
+        writer.close()
+    with zipfile.ZipFile(tmp_path / "many.zip") as archive:
+        assert len(archive.infolist()) == count
+        assert archive.testzip() is None
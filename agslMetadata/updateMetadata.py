@@ -2,14 +2,24 @@
 Tools for updating AGSL metadata for GeoDiscovery
 """
 
-import arcpy
+import bindCache
+import datasetScan
+import fixity
+import hashlib
+import metadataBackend
+import migrations
+import noidClient
+import os
 import requests
 import re
-import zipfile
+import shapefileInspector
+import shutil
+import zipBuilder
+import zipVerify
 
 import xml.etree.ElementTree as ET
 
-from arcpy import metadata as md
+from arkPool import ArkPool, exhausted, get_offline_client
 from datetime import datetime
 from pathlib import Path
 from enum import Enum
@@ -27,7 +37,35 @@ NOID_URL = 'https://digilib-admin.uwm.edu/noidu_gmgs?'
 FILE_SERVER_PATH = Path(r"S:\GeoBlacklight\web")
 
 
-ARK_REGEX = r"(\d{5})\/(\w{11})"
+ARK_REGEX = noidClient.ARK_REGEX
+
+# The elements bind() sets on every arkid
+BIND_ELEMENTS = ["who", "what", "when", "where", "meta-who", "meta-when", "meta-uri", "rights", "download"]
+
+# Bulk minting: set ARK_POOL_PATH to a file to mint MINT_BATCH_SIZE arkids per NOID request
+# and hand them out from a local reservation pool. None mints one arkid per dataset.
+ARK_POOL_PATH = None
+MINT_BATCH_SIZE = 50
+
+# Set to a file to remember dataset type detection between runs (see datasetScan.ScanCache)
+SCAN_CACHE_PATH = None
+
+# Outputs are built here, then renamed onto FILE_SERVER_PATH once every stage of the dataset has succeeded,
+# so nothing half-written is ever visible on the web root. It has to be on the same volume as FILE_SERVER_PATH
+# for the renames to be atomic. None puts it next to FILE_SERVER_PATH, e.g. S:\GeoBlacklight\web_staging
+STAGING_PATH = None
+
+# How dataset metadata is read, written and exported (see metadataBackend):
+# "arcpy" needs ArcGIS Pro, "xml" works on the ArcGIS-format XML files directly (shapefiles and ArcGRID only)
+METADATA_BACKEND = "arcpy"
+
+# Ingest without NOID: arkids come from the blocks reserved in the ARK pool (`python arkPool.py reserve`) and
+# binds wait in the pool until `python arkPool.py reconcile` sends them. Needs ARK_POOL_PATH.
+NOID_OFFLINE = False
+
+# The values last bound for every arkid (see bindCache), so a re-bind only sends the elements that changed.
+# None binds every element every time.
+BIND_CACHE_PATH = None
 
 SEARCH_STRING_DICT = {
     "altTitle": ".//idCitation/resAltTitle",
@@ -44,6 +82,12 @@ SEARCH_STRING_DICT = {
     "timeInstantExtent": ".//tmPosition"
 }
 
+# The SEARCH_STRING_DICT paths that AGSLMetadata reads as fields, one element each.
+# ElementPath compiles each path once and caches it; AGSLMetadata caches what it finds.
+METADATA_FIELDS = {field: SEARCH_STRING_DICT[field] for field in (
+    "altTitle", "rights", "identCode", "metadataFileID", "datasetURI", "contactHours",
+    "timeRangeBegin", "timeRangeEnd", "timeInstantExtent")}
+
 class Dataset:
 
     def __init__(self, providedPath):
@@ -59,83 +103,31 @@ class Dataset:
         elif self.datatype == 4:
             raise Exception("There are multiple data types in the directory provided")
             return
+        elif self.datatype == 1:
+            # A shapefile whose parts are missing or disagree would only fail later, in the zip or in GeoBlacklight
+            self.shapefile: dict = shapefileInspector.validate(self.data)
         
         self.metadata: AGSLMetadata = AGSLMetadata(self.get_dataset_metadata())
     
     def fetch_dataset_from_directory(self) -> tuple[Path, int]:
-        def test_dataset_type(rootdir) -> int:
-            '''Test Dataset Type
-            - Returns an integer for type:
-                - 0: Error
-                - 1: Shapefile
-                - 2: FileGeodatabase
-                - 3: ArcGRID Raster
-                - 4: Other/Mutliple
-            '''    
-            rootdir = Path(rootdir)
-
-            gdb_count = 0
-            shp_count = 0
-            raster_count = 0
-
-            for path in Path(rootdir).rglob("*"):
-                if path.suffix == ".gdb":
-                    gdb_count += 1
-                    continue
-                elif path.suffix == ".shp":
-                    shp_count += 1
-                elif path.suffix == ".adf":
-                    raster_count += 1
-
-            if gdb_count == 0 and shp_count == 0 and raster_count == 0:
-                return 0
-            elif gdb_count == 0 and shp_count == 1 and raster_count == 0:
-                return 1
-            elif gdb_count == 1 and shp_count == 0 and raster_count == 0:
-                return 2
-            elif gdb_count == 0 and shp_count == 0 and raster_count >= 1:
-                # Note that there might be more than one .adf file!
-                return 3
-            elif (gdb_count + shp_count + raster_count) >= 1:
-                return 4
-            else:
-                return 0
-        
-        dataset_type = test_dataset_type(self.path)
+        # Types: 0 Error, 1 Shapefile, 2 FileGeodatabase, 3 ArcGRID Raster, 4 Other/Multiple
+        dataset_type, found = datasetScan.classify(self.path, SCAN_CACHE_PATH)
         
-        if dataset_type != 0: # 0 would mean there is an error
-            if dataset_type == 1: # Shapefile
-                dataset = next(self.path.rglob("*.shp"))
-            elif dataset_type == 2: # FileGeodatabase
-                geodatabase = next(self.path.rglob("*.gdb")) # Path Representation of the geodatabase
-                arcpy.env.workspace = str(geodatabase) # This can't be a Path, it has to be a path as string.
-                feature_dataset_list = arcpy.ListDatasets("*","feature")
-                if not len(feature_dataset_list) > 1:
-                    dataset = Path(geodatabase) / feature_dataset_list[0]
-                else:
-                    return
-            elif dataset_type == 3: # Raster Dataset... ArcGrid only for now.
-                arcpy.env.workspace = str(self.path) # This can't be a Path, it has to be a path as string.
-                raster_dataset_list = arcpy.ListRasters("*")
-                if not len(raster_dataset_list) > 1:
-                    dataset = self.path / raster_dataset_list[0]
-                else:
-                    return  
-            elif dataset_type == 4:
-                return        
-        else:
+        if dataset_type == 0: # 0 would mean there is an error
             print("No data found in the provided dataset path. (1)")
             return
+        elif dataset_type == 4:
+            return
 
-        if md.Metadata(dataset).__class__ == arcpy.metadata.Metadata:
-            return Path(dataset), dataset_type
-        else:
+        # The shapefile, the feature dataset inside the geodatabase, or the ArcGRID folder
+        dataset = metadataBackend.get_backend(METADATA_BACKEND).resolve_dataset(found, dataset_type)
+        if dataset is None:
             print("No data found in the provided dataset path. (2)")
             return
-        
-        
-    def get_dataset_metadata(self) -> tuple[str,md.Metadata,ET.Element]:
-        dataset_Metadata_object = md.Metadata(self.data)
+        return Path(dataset), dataset_type
+
+    def get_dataset_metadata(self) -> tuple[str,"arcpy.metadata.Metadata",ET.Element]:
+        dataset_Metadata_object = metadataBackend.get_backend(METADATA_BACKEND).open_metadata(self.data)
 
         if dataset_Metadata_object.isReadOnly is None: # This means that nothing was passed
             print("A blank metadata object was created")
@@ -155,93 +147,233 @@ class Dataset:
             print(f"{spacer}+ {path.name}")
         
     def ingest(self):
-        fileserver_dir = FILE_SERVER_PATH / self.metadata.rights / self.metadata.identifier.assignedName
-        fileserver_dir.mkdir()
-        self.fileserver_dir = fileserver_dir       
-        zipPath = fileserver_dir / f"{self.metadata.altTitle}.zip"
-        self.fileserver_zip = zipPath
-        with zipfile.ZipFile(zipPath, mode="w") as archive: 
-            for member in self.path.rglob("*"):
-                try: 
-                    archive.write(member, member.relative_to(self.path))
-                except Exception as error:
-                    print(f"Warning: There was a problem adding {member.name} to the new zipfile")
-                    print(error)
-                    print()
-                    continue
-        archive.close()
-        
-        newzipfile = zipfile.ZipFile(zipPath)
+        self.write_zip()
+        self.verify_zip()
+        self.copy_metadata()
+        self.publish()
+        return 
+
+    def set_fileserver_paths(self) -> None:
+        # Where this dataset's deliverables go on the fileserver, and where they are built first
+        assignedName = self.metadata.identifier.assignedName
+        self.fileserver_dir = FILE_SERVER_PATH / self.metadata.rights / assignedName
+        self.fileserver_zip = self.fileserver_dir / f"{self.metadata.altTitle}.zip"
+        self.fileserver_metadata = FILE_SERVER_PATH / "metadata" / f"{assignedName}_ISO.xml"
+        self.staging_dir = staging_root() / assignedName
+        self.staged_dir = self.staging_dir / "data" # Becomes fileserver_dir
+        self.staged_zip = self.staged_dir / f"{self.metadata.altTitle}.zip"
+        self.staged_metadata = self.staging_dir / f"{assignedName}_ISO.xml"
+
+    def staged_outputs(self) -> list[tuple[Path, Path]]:
+        # (staged, published) pairs, in the order publish() moves them
+        return [(self.staged_dir, self.fileserver_dir), (self.staged_metadata, self.fileserver_metadata)]
+
+    def write_zip(self):
+        self.set_fileserver_paths()
+        self.staged_dir.mkdir(parents=True, exist_ok=True) # A resumed run may have created it already
+        zipPath = self.staged_zip
+        # Compressed on every core, streamed to `<zip>.part` and renamed into place when complete.
+        # Hashed as it is written, for the ARK directory's fixity manifest.
+        digest = hashlib.sha256()
+        self.zip_manifest = zipBuilder.build_zip(self.path, zipPath, digest=digest)
+        fixity.update_manifest(self.staged_dir / fixity.MANIFEST_NAME, {zipPath.name: digest.hexdigest()})
+
         print(f"\nContents of deliverable zipfile `{str(zipPath)}`")
-        newzipfile.printdir()
-        newzipfile.close()
+        print("%-46s %12s %12s" % ("File Name", "Size", "Compressed"))
+        for member in self.zip_manifest:
+            print("%-46s %12d %12d" % (member["name"], member["size"], member["compressed_size"]))
 
+    def verify_zip(self):
+        # Read the staged zip back: every member against its crc32, and every file of the dataset there at its size
+        self.set_fileserver_paths()
+        zipVerify.verify(self.staged_zip, self.path)
+        print(f"Verified `{str(self.staged_zip)}`")
+
+    def copy_metadata(self):
         # Copy the ISO metadata to the metadata directory:
+        self.set_fileserver_paths()
         ISO_Metadata = self.path / f"{self.metadata.altTitle}_ISO.xml"
         if ISO_Metadata.exists():
-            ISO_Metadata_text = ISO_Metadata.read_text()
+            ISO_Metadata_bytes = ISO_Metadata.read_bytes()
         else:
             raise Exception("ISO Metadata does not exist!")
         
-        Fileserver_ISO_Metadata = FILE_SERVER_PATH / "metadata" / f"{self.metadata.identifier.assignedName}_ISO.xml"
-        Fileserver_ISO_Metadata.touch()
-        Fileserver_ISO_Metadata.write_text(ISO_Metadata_text)
-        self.fileserver_metadata = Fileserver_ISO_Metadata
-        print(Fileserver_ISO_Metadata.absolute)
+        Fileserver_ISO_Metadata = self.staged_metadata
+        Fileserver_ISO_Metadata.parent.mkdir(parents=True, exist_ok=True)
+        Fileserver_ISO_Metadata.write_bytes(ISO_Metadata_bytes)
+        self.staged_dir.mkdir(parents=True, exist_ok=True)
+        fixity.update_manifest(self.staged_dir / fixity.MANIFEST_NAME,
+                               {fixity.metadata_entry(self.metadata.identifier.assignedName): hashlib.sha256(ISO_Metadata_bytes).hexdigest()})
+        print(self.fileserver_metadata.absolute())
         print("\n")
-        return 
+
+    def publish(self):
+        # Make the zipfile and the metadata visible on the fileserver, once everything else has succeeded
+        self.set_fileserver_paths()
+        publish(self.staged_outputs(), self.staging_dir)
+
+    def discard(self):
+        # Roll back: nothing has been published, so the staging directory is all there is to remove
+        if hasattr(self, "staging_dir"):
+            discard(self.staging_dir)
+
+def identifier_urls(arkid, rights, altTitle) -> dict[str, str]:
+    # The URLs GeoDiscovery knows a dataset by. Written into the metadata, bound in NOID and used in the Aardvark records.
+    assignedName = re.search(ARK_REGEX, arkid)[2]
+    return {
+        "ark_URI": APPLICATION_URL + 'ark:-' + arkid.replace('/','-'),
+        "download_URI": f'{FILE_SERVER_URL}{rights}/{assignedName}/{altTitle}.zip',
+        "metadata_URL": f"{FILE_SERVER_URL}metadata/{assignedName}_ISO.xml",
+    }
+
+def noid_client() -> noidClient.NoidClient:
+    # The shared NOID client, or the ARK pool standing in for NOID in offline mode
+    if not NOID_OFFLINE:
+        return noidClient.get_client(NOID_URL)
+    if ARK_POOL_PATH is None:
+        raise Exception("Offline mode takes its arkids from the ARK pool. Set ARK_POOL_PATH.")
+    return get_offline_client(ARK_POOL_PATH)
+
+def bind_cache() -> bindCache.BindCache:
+    # The bind cache at BIND_CACHE_PATH, or None
+    if BIND_CACHE_PATH is None:
+        return None
+    return bindCache.BindCache(BIND_CACHE_PATH)
+
+def remember_binding(arkid, bind_params) -> None:
+    # NOID confirmed binding bind_params to arkid
+    # Offline, NOID hasn't got them yet, only the ARK pool: arkPool.reconcile() caches them once NOID has them
+    if BIND_CACHE_PATH is not None and not NOID_OFFLINE:
+        bind_cache().store(arkid, bind_params)
+
+def forget_binding(arkid) -> None:
+    # arkid's bindings were purged
+    if BIND_CACHE_PATH is not None:
+        bind_cache().forget(arkid)
+
+def ark_pool() -> ArkPool:
+    # The ARK pool at ARK_POOL_PATH, refilled from NOID; offline it only has the ARKs reserved beforehand. None without one.
+    if ARK_POOL_PATH is None:
+        return None
+    return ArkPool(ARK_POOL_PATH, exhausted if NOID_OFFLINE else Identifier.mint_many, MINT_BATCH_SIZE)
+
+def staging_root() -> Path:
+    if STAGING_PATH is not None:
+        return Path(STAGING_PATH)
+    return FILE_SERVER_PATH.parent / f"{FILE_SERVER_PATH.name}_staging"
+
+def publish(staged_outputs, staging_dir) -> None:
+    '''Move staged outputs onto the fileserver with renames, then remove the staging directory
+    - staged_outputs is a list of (staged, published) paths
+    - Anything already at a published path (left by an interrupted earlier publish) is replaced
+    - All or nothing: if a rename fails, the ones already done are moved back
+    '''
+    done = [] # (staged, published, what used to be at published)
+    try:
+        for staged, published in staged_outputs:
+            replaced = None
+            if published.exists():
+                replaced = staging_dir / f"replaced-{published.name}"
+                os.rename(published, replaced)
+            try:
+                os.rename(staged, published)
+            except OSError:
+                if replaced is not None:
+                    os.rename(replaced, published)
+                raise
+            done.append((staged, published, replaced))
+    except OSError:
+        for staged, published, replaced in reversed(done):
+            os.rename(published, staged)
+            if replaced is not None:
+                os.rename(replaced, published)
+        raise
+    discard(staging_dir)
+
+def discard(staging_dir) -> None:
+    # A staging directory only ever holds one zipfile and one metadata record, so this takes the same time for any dataset
+    shutil.rmtree(staging_dir, ignore_errors=True)
 
 class AGSLMetadata:
 
     def __init__(self, dataset_metadata_tuple):
-        self.xml_text: str = dataset_metadata_tuple[0]
-        self.md_object: md.Metadata = dataset_metadata_tuple[1]
+        self.md_object: "arcpy.metadata.Metadata" = dataset_metadata_tuple[1] # or a metadataBackend.SidecarMetadata
+        # One live tree for the life of the object. It is only serialized when xml_text is read
+        # or the metadata is flushed, and never parsed again.
         self.rootElement: ET.Element = dataset_metadata_tuple[2]
-        self.altTitle: str = self.get_alt_title()
+        self._xml_text: str = dataset_metadata_tuple[0]
+        self._elements: dict[str, ET.Element] = {} # Lazily found elements, by METADATA_FIELDS name
         self.rights: str = self.rights_test()
-            
-    def save(self):
-        self.md_object.xml = ET.tostring(self.rootElement)
+
+    @property
+    def xml_text(self) -> str:
+        if self._xml_text is None:
+            self._xml_text = ET.tostring(self.rootElement, encoding="unicode")
+        return self._xml_text
+
+    @property
+    def altTitle(self) -> str:
+        return self.get_alt_title()
+
+    def element(self, field) -> ET.Element:
+        # The first element for one of the METADATA_FIELDS, found once and then cached
+        if field not in self._elements:
+            self._elements[field] = self.rootElement.find(METADATA_FIELDS[field])
+        return self._elements[field]
+
+    def text(self, field) -> str:
+        found = self.element(field)
+        return None if found is None else found.text
+
+    def changed(self, *fields) -> None:
+        # Call after changing the tree: drops the serialized xml and the cached elements of the fields touched
+        self._xml_text = None
+        for field in fields:
+            self._elements.pop(field, None)
+
+    def flush(self):
+        # Write the live tree back to the metadata object. The only place the tree gets serialized for saving.
+        self.md_object.xml = self.xml_text
         self.md_object.save()
-        self.xml_text = self.md_object.xml
-        self.rootElement: ET.Element = ET.fromstring(self.xml_text)
-        self.altTitle: str = self.get_alt_title()
+
+    def save(self):
+        self.flush()
 
     def get_alt_title(self) -> str:
-        rootElement = self.rootElement
-        altTitle_Element = rootElement.find(SEARCH_STRING_DICT["altTitle"])
-        if not altTitle_Element is None:
-            return altTitle_Element.text
+        return self.text("altTitle")
         
     def rights_test(self) -> str:
-        rights_list = self.rootElement.findall(SEARCH_STRING_DICT["rights"]) # Returns a list
-        if len(rights_list) == 0:
+        rights_Element = self.element("rights")
+        if rights_Element is None:
             return "public"
-        if "restricted" in rights_list[0].text.lower():
+        if "restricted" in rights_Element.text.lower():
             return "restricted-uw-system"
         else:
             return "public"
 
-    def create_and_write_identifiers(self) -> None:
-        
-        # mint a new arkid:
+    def mint_identifier(self, arkid=None) -> str:
+        # Mint a new arkid, or reuse one that was minted for this dataset before
         new_identifier = Identifier()
-        new_identifier.mint()
+        if arkid is None:
+            new_identifier.mint()
+        else:
+            new_identifier.assign(arkid)
         self.identifier: Identifier = new_identifier
+        return new_identifier.arkid
 
-        # Generate the text strings
-        ark_URI: str = APPLICATION_URL + 'ark:-' + self.identifier.arkid.replace('/','-')
-        download_URI: str = f'{FILE_SERVER_URL}{self.rights}/{self.identifier.assignedName}/{self.altTitle}.zip'
+    def create_and_write_identifiers(self, flush=True) -> None:
         
-        def check_if_existing_identifier(root, find_string) -> bool:
-            if len(root.findall(find_string)) > 0:
-                return True
-            else:
-                return False
+        # mint a new arkid, unless mint_identifier() already did:
+        if not hasattr(self, "identifier"):
+            self.mint_identifier()
 
-        if check_if_existing_identifier(self.rootElement, SEARCH_STRING_DICT["identCode"]):
-            identCode_Element = self.rootElement.find(SEARCH_STRING_DICT["identCode"])
-        else:
+        # Generate the text strings
+        urls = identifier_urls(self.identifier.arkid, self.rights, self.altTitle)
+        ark_URI: str = urls["ark_URI"]
+        download_URI: str = urls["download_URI"]
+
+        identCode_Element = self.element("identCode")
+        if identCode_Element is None:
             dataset_idCitation_Element = self.rootElement.find(SEARCH_STRING_DICT["citationIdentifier"])
             citId_Element = ET.SubElement(dataset_idCitation_Element, 'citId', xmls="")
             identCode_Element = ET.SubElement(citId_Element, 'identCode')
@@ -249,50 +381,37 @@ class AGSLMetadata:
         identCode_Element.text = ark_URI
 
         # Write the Metadata File ID Code:
-        if check_if_existing_identifier(self.rootElement, SEARCH_STRING_DICT["metadataFileID"]):
-            dataset_mdFileID_Element = self.rootElement.find(SEARCH_STRING_DICT["metadataFileID"])
-        else:
+        dataset_mdFileID_Element = self.element("metadataFileID")
+        if dataset_mdFileID_Element is None:
             dataset_mdFileID_Element = ET.SubElement(self.rootElement, 'mdFileID')
         
         dataset_mdFileID_Element.text = f'ark:/{self.identifier.arkid}'
 
         # Write the Dataset URI:
-        if check_if_existing_identifier(self.rootElement, SEARCH_STRING_DICT["datasetURI"]):
-            dataset_dataSetURI_Element = self.rootElement.find(SEARCH_STRING_DICT["datasetURI"])
-        else:
+        dataset_dataSetURI_Element = self.element("datasetURI")
+        if dataset_dataSetURI_Element is None:
             dataset_dataSetURI_Element = ET.SubElement(self.rootElement, 'dataSetURI')
         
         dataset_dataSetURI_Element.text = download_URI
 
-        self.save()
+        self.changed("identCode", "metadataFileID", "datasetURI")
+        if flush:
+            self.flush()
 
         return
     
-    def update_agsl_hours(self) -> None:
-        # Find all the AGSL contacts
-        contact_list = self.rootElement.findall('.//rpCntInfo/cntHours/../..') # Returns a list
-
-        if len(contact_list) < 1:
-            print("No contacts found!")
-            return rootElement
-        else:
-            print(f'{len(contact_list)} contacts found.')
-
-        for contact in contact_list:
-            org = contact.find('./displayName')
-
-            if not org is None:
-                org_text = org.text
-            else:
-                print("no org text!")
-                return
+    def update_agsl_hours(self, flush=True) -> None:
+        # The agsl-hours migration (see migrations.AGSL_HOURS), applied to the live tree
+        changes = migrations.apply(self.rootElement, migrations.AGSL_HOURS)
+        if not changes:
+            print("No AGSL contact hours to update.")
+            return
 
-            if "American Geographical" in org_text:
-                hours_Element = contact.find('.//cntHours')
-                hours_Element.text = "Monday – Friday: 9:00am – 4:30pm"
-                print(f'Updated {contact.tag}/rpCntInfo/cntHours.text to {hours_Element.text}')
-                
-        self.save()
+        for where, old, new in changes:
+            print(f'Updated {where} from {old} to {new}')
+        self.changed("contactHours")
+        if flush:
+            self.flush()
 
         return
 
@@ -326,98 +445,92 @@ class AGSLMetadata:
         
         return output_ISO_Path, output_FGDC_Path
     
-    def bind(self, purge=False) -> requests.models.Response:
-
-        binder = NOID_URL + '-'
-
-        def create_bind_params(metadata) -> dict:
-            root_Element = ET.fromstring(metadata.xml_text)
+    def bind_params(self) -> dict:
+        ark_URI = self.text("identCode")
 
-            mdfileid = root_Element.find(SEARCH_STRING_DICT["metadataFileID"]).text
+        download_URI = self.text("datasetURI")
 
-            ark_URI = root_Element.find(SEARCH_STRING_DICT["identCode"]).text
-            
-            download_URI = root_Element.find(SEARCH_STRING_DICT["datasetURI"]).text
-            
-            metadata_URL = f"{FILE_SERVER_URL}metadata/{self.identifier.assignedName}_ISO.xml"
-
-            try:
-                tmBegin = root_Element.find('.//tmBegin').text
-                tmEnd = root_Element.find('.//tmEnd').text
-                date_when = f'{tmBegin}/{tmEnd}'
-            except:
-                date_when = root_Element.find('.//tmPosition').text
-
-            time_now = datetime.now().replace(microsecond=0).isoformat()
-
-            parameter_dictionary = {
-                "who": f'{metadata.md_object.credits}',
-                "what": f'{metadata.md_object.title}',
-                "when": f'{date_when}',
-                "where": f'{ark_URI}',
-                "meta-who": "University of Wisconsin-Milwaukee Libraries",
-                "meta-when": f'{time_now}',
-                "meta-uri": f'{metadata_URL}',
-                "rights": f'{self.rights}',
-                "download": f'{download_URI}'
-            }
-            return parameter_dictionary
-
-        def construct_bind_request(arkid, bind_params) -> str:
-            param_string = ''
-            if purge == False:
-                for key, value in bind_params.items():
-                    param_string = param_string + f'bind set {arkid} {key} "{value}"' + '\n'
-            else:
-                print("### PURGE PURGE PURGE ###")
-                for key, value in bind_params.items():
-                    param_string = param_string + f'bind purge {arkid} {key}' + '\n'
-
-            print(param_string)
-            return param_string
+        metadata_URL = identifier_urls(self.identifier.arkid, self.rights, self.altTitle)["metadata_URL"]
 
-        bind_params = create_bind_params(self)
-        bind_params_commands = construct_bind_request(self.identifier.arkid, bind_params)
-
-        try:
-            r = requests.post(binder, data=bind_params_commands)
-        except:
-            print("There was a connection error! Check the URL you used to bind the id!")
-            return
-        if r.status_code != 200:
-            print("There was a non-200 status code from the binder: " + r.status_code)
-            return
+        tmBegin = self.text("timeRangeBegin")
+        tmEnd = self.text("timeRangeEnd")
+        if self.element("timeRangeBegin") is not None and self.element("timeRangeEnd") is not None:
+            date_when = f'{tmBegin}/{tmEnd}'
         else:
-            return r
-  
-class Identifier:
+            date_when = self.text("timeInstantExtent")
+
+        time_now = datetime.now().replace(microsecond=0).isoformat()
+
+        parameter_dictionary = {
+            "who": f'{self.md_object.credits}',
+            "what": f'{self.md_object.title}',
+            "when": f'{date_when}',
+            "where": f'{ark_URI}',
+            "meta-who": "University of Wisconsin-Milwaukee Libraries",
+            "meta-when": f'{time_now}',
+            "meta-uri": f'{metadata_URL}',
+            "rights": f'{self.rights}',
+            "download": f'{download_URI}'
+        }
+        return parameter_dictionary
+
+    def changed_bind_params(self) -> dict:
+        # bind_params() less the elements the bind cache says NOID already has. Empty if nothing changed.
+        cache = bind_cache()
+        if cache is None:
+            return self.bind_params()
+        return bindCache.changed_params(cache.get(self.identifier.arkid), self.bind_params())
+
+    def bind_commands(self, purge=False, bind_params=None) -> list[str]:
+        # The NOID `bind set` (or `bind purge`) commands for this dataset's arkid
+        if purge == False:
+            return noidClient.bind_commands(self.identifier.arkid, self.changed_bind_params() if bind_params is None else bind_params)
+        else:
+            print("### PURGE PURGE PURGE ###")
+            return noidClient.bind_commands(self.identifier.arkid, BIND_ELEMENTS, purge=True)
 
-    def mint(self) -> requests.models.Response:
+    def bind(self, purge=False) -> requests.models.Response:
+        bind_params = None if purge else self.changed_bind_params()
+        if bind_params == {}:
+            print(f"The NOID bindings of {self.identifier.arkid} are up to date")
+            return None
+        bind_commands = self.bind_commands(purge, bind_params)
+        print("\n".join(bind_commands))
+
+        # All the commands go in a single POST over the shared, retrying NOID client
+        r = noid_client().run_commands(bind_commands)
+        status = noidClient.ark_statuses([self.identifier.arkid], r.text)[self.identifier.arkid]
+        if status != "ok":
+            raise Exception(f"NOID bind failed for {self.identifier.arkid}: {status}")
+        if purge:
+            forget_binding(self.identifier.arkid)
+        else:
+            remember_binding(self.identifier.arkid, bind_params)
+        return r
 
-        minter = NOID_URL + 'mint+1'
+class Identifier:
 
-        try:
-            mint_request = requests.get(minter)
-        except Exception as ex:
-            print(ex)
-            return
+    def mint(self) -> str:
 
-        if mint_request.status_code != 200:
-            print(f"mint request status code = {mint_request.status_code}")
-            return mint_request
+        if ARK_POOL_PATH is not None:
+            # Bulk minting mode: take an arkid from the local reservation pool
+            self.assign(ark_pool().take())
         else:
-            regex = re.compile(ARK_REGEX)
-            regex_result = regex.search(mint_request.text)
-            if not regex_result is None:
-                self.arkid = regex_result[0]
-                self.nameAuthorityNumber = regex_result[1]
-                self.assignedName = regex_result[2]
-                print(f"mint request status code = {mint_request.status_code}")
-                return mint_request
-            else:
-                raise Exception("Failed to mint an arkid!")
-                print(f"mint request status code = {mint_request.status_code}")
-                return mint_request
+            self.assign(Identifier.mint_many(1)[0])
+        return self.arkid
+
+    def assign(self, arkid) -> None:
+        regex_result = re.compile(ARK_REGEX).search(arkid)
+        if regex_result is None:
+            raise Exception(f"{arkid} is not a valid arkid!")
+        self.arkid = regex_result[0]
+        self.nameAuthorityNumber = regex_result[1]
+        self.assignedName = regex_result[2]
+
+    @staticmethod
+    def mint_many(count) -> list[str]:
+        # Mint count arkids with a single `mint+N` request
+        return noid_client().mint(count)
         
 def main() -> None:
     """Main function."""
@@ -436,9 +549,9 @@ def main() -> None:
     # Test writing the identifiers:
     dataset_metadata.create_and_write_identifiers()
 
-    print(f"The Metadata File ID is: {ET.fromstring(dataset_metadata.xml_text).find(SEARCH_STRING_DICT['metadataFileID']).text}")
-    print(f"The Citation ID is: {ET.fromstring(dataset_metadata.xml_text).find(SEARCH_STRING_DICT['identCode']).text}")
-    print(f"The Dataset URI is: {ET.fromstring(dataset_metadata.xml_text).find(SEARCH_STRING_DICT['datasetURI']).text}\n")
+    print(f"The Metadata File ID is: {dataset_metadata.text('metadataFileID')}")
+    print(f"The Citation ID is: {dataset_metadata.text('identCode')}")
+    print(f"The Dataset URI is: {dataset_metadata.text('datasetURI')}\n")
     
     # Test updating agsl hours:
     dataset_metadata.update_agsl_hours()
@@ -0,0 +1,275 @@
+"""
+Streaming, parallel-compressing zipfile builder for the deliverable zipfiles
+"""
+
+import os
+import struct
+import time
+import zlib
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Every member is read and compressed in chunks of this size, so memory use is
+# bounded by CHUNK_SIZE * (number of chunks in flight) no matter how big the files are.
+CHUNK_SIZE = 4 * 1024 * 1024
+COMPRESS_LEVEL = 6
+WORKERS = os.cpu_count() or 1
+
+# Formats that are already compressed. Deflating them again costs a lot of CPU for nothing.
+STORED_SUFFIXES = {".zip", ".sid", ".jp2", ".j2k", ".ecw", ".kmz", ".gz", ".bz2", ".7z", ".png", ".jpg", ".jpeg"}
+
+# ArcGIS schema locks inside a .gdb, held open while arcpy uses the geodatabase
+SKIPPED_SUFFIXES = {".lock"}
+
+STORED = 0
+DEFLATED = 8
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP64_MARKER = 0xFFFFFFFF
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+def tiff_is_compressed(path) -> bool:
+    # Reads the Compression tag (259) from the first IFD. 1 means uncompressed.
+    with open(path, "rb") as tiff:
+        header = tiff.read(16)
+        if header[:4] in (b"II*\x00", b"MM\x00*"):
+            order = "<" if header[:2] == b"II" else ">"
+            tiff.seek(struct.unpack(order + "I", header[4:8])[0])
+            count = struct.unpack(order + "H", tiff.read(2))[0]
+            entries = tiff.read(12 * count)
+            entry_format = order + "HHI4s"
+        elif header[:4] in (b"II+\x00", b"MM\x00+"): # BigTIFF
+            order = "<" if header[:2] == b"II" else ">"
+            tiff.seek(struct.unpack(order + "Q", header[8:16])[0])
+            count = struct.unpack(order + "Q", tiff.read(8))[0]
+            entries = tiff.read(20 * count)
+            entry_format = order + "HHQ8s"
+        else:
+            return False
+    for tag, _, _, value in struct.iter_unpack(entry_format, entries):
+        if tag == 259: # A SHORT, left-justified in the value field
+            return struct.unpack(order + "H", value[:2])[0] != 1
+    return False
+
+def compression_for(path) -> int:
+    suffix = path.suffix.lower()
+    if suffix in STORED_SUFFIXES:
+        return STORED
+    if suffix in (".tif", ".tiff"):
+        try:
+            return STORED if tiff_is_compressed(path) else DEFLATED
+        except (OSError, struct.error):
+            return DEFLATED
+    return DEFLATED
+
+def _gf2_times(matrix, vector) -> int:
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return total
+
+def _gf2_square(matrix) -> list[int]:
+    return [_gf2_times(matrix, matrix[n]) for n in range(32)]
+
+def _crc32_shift(crc, length) -> int:
+    # Append `length` zero bytes to a crc32 without the bytes (the trick behind zlib's crc32_combine)
+    power = [0xEDB88320] + [1 << n for n in range(31)] # one zero bit
+    for _ in range(3):
+        power = _gf2_square(power) # one zero byte
+    while length:
+        if length & 1:
+            crc = _gf2_times(power, crc)
+        length >>= 1
+        if length:
+            power = _gf2_square(power)
+    return crc
+
+_chunk_shift = None
+
+def crc32_combine(crc1, crc2, length2) -> int:
+    # The crc32 of A + B from crc32(A), crc32(B) and len(B)
+    global _chunk_shift
+    if crc1 == 0: # Shifting is linear, so zero stays zero
+        return crc2
+    if length2 == CHUNK_SIZE:
+        # Every chunk but the last is CHUNK_SIZE long, so that shift is worth turning into a matrix
+        if _chunk_shift is None:
+            _chunk_shift = [_crc32_shift(1 << n, CHUNK_SIZE) for n in range(32)]
+        return _gf2_times(_chunk_shift, crc1) ^ crc2
+    return _crc32_shift(crc1, length2) ^ crc2
+
+def _read_chunk(path, offset, size, method, last) -> tuple[bytes, int, int]:
+    '''Read one chunk of a member and compress it
+    - Returns the bytes to write, the crc32 of the raw chunk and its length
+    - Deflated chunks are independent raw deflate streams ended with a sync flush, which can be
+      concatenated into one valid deflate stream; only the member's last chunk is finished
+    '''
+    with open(path, "rb") as member:
+        member.seek(offset)
+        data = member.read(size)
+    if len(data) != size:
+        raise OSError(f"{path} changed size while it was being zipped")
+    crc = zlib.crc32(data)
+    if method == DEFLATED:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return data, crc, size
+
+def _dos_datetime(mtime) -> tuple[int, int]:
+    year, month, day, hour, minute, second = time.localtime(mtime)[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+def list_members(source_dir) -> list[tuple[Path, str]]:
+    # Every file and directory under source_dir with its name in the archive, parents first
+    source_dir = Path(source_dir)
+    members = []
+    for path in sorted(source_dir.rglob("*")):
+        if path.suffix.lower() in SKIPPED_SUFFIXES:
+            print(f"Warning: Skipping lock file {path.name}")
+            continue
+        name = path.relative_to(source_dir).as_posix()
+        members.append((path, name + "/" if path.is_dir() else name))
+    return members
+
+class ZipWriter:
+    '''Writes a zipfile front to back, never seeking
+    - Sizes and crc32 follow each member's data in a data descriptor, so data can be streamed
+    - Uses ZIP64 records wherever sizes, offsets or the number of members need them
+    - digest (e.g. hashlib.sha256()) is updated with every byte written, so the archive's checksum needs no second read
+    '''
+
+    def __init__(self, output, digest=None):
+        self.output = output
+        self.digest = digest
+        self.offset = 0
+        self.central_directory = []
+
+    def write(self, data) -> None:
+        self.output.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.offset += len(data)
+
+    def start_member(self, name, method, mtime, mode, size_hint) -> dict:
+        encoded = name.encode("utf-8")
+        flags = FLAG_DATA_DESCRIPTOR | (FLAG_UTF8 if not name.isascii() else 0)
+        zip64 = size_hint > ZIP64_LIMIT
+        date, dos_time = _dos_datetime(mtime)
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+        member = {"name": name, "encoded": encoded, "flags": flags, "method": method, "date": date,
+                  "time": dos_time, "mode": mode, "offset": self.offset, "zip64": zip64}
+        self.write(struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, flags, method, dos_time,
+                               date, 0, ZIP64_MARKER if zip64 else 0, ZIP64_MARKER if zip64 else 0,
+                               len(encoded), len(extra)) + encoded + extra)
+        return member
+
+    def end_member(self, member, crc, compressed_size, size) -> None:
+        if member["zip64"]:
+            self.write(struct.pack("<IIQQ", 0x08074B50, crc, compressed_size, size))
+        elif compressed_size > ZIP64_MARKER or size > ZIP64_MARKER:
+            raise OSError(f"{member['name']} grew past the zip64 limit while it was being zipped")
+        else:
+            self.write(struct.pack("<IIII", 0x08074B50, crc, compressed_size, size))
+        member.update(crc=crc, compressed_size=compressed_size, size=size)
+        self.central_directory.append(member)
+
+    def close(self) -> None:
+        start = self.offset
+        for member in self.central_directory:
+            extra_fields = [value for value in (member["size"], member["compressed_size"], member["offset"])
+                            if value >= ZIP64_MARKER]
+            extra = b""
+            if extra_fields:
+                extra = struct.pack("<HH", 0x0001, 8 * len(extra_fields)) + struct.pack(f"<{len(extra_fields)}Q", *extra_fields)
+            needs_zip64 = member["zip64"] or bool(extra_fields)
+            self.write(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | 45, 45 if needs_zip64 else 20,
+                                   member["flags"], member["method"], member["time"], member["date"], member["crc"],
+                                   min(member["compressed_size"], ZIP64_MARKER), min(member["size"], ZIP64_MARKER),
+                                   len(member["encoded"]), len(extra), 0, 0, 0, member["mode"],
+                                   min(member["offset"], ZIP64_MARKER)) + member["encoded"] + extra)
+        size = self.offset - start
+        count = len(self.central_directory)
+        if count >= 0xFFFF or size >= ZIP64_MARKER or start >= ZIP64_MARKER:
+            zip64_end = self.offset
+            self.write(struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, size, start))
+            self.write(struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1))
+        self.write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                               min(size, ZIP64_MARKER), min(start, ZIP64_MARKER), 0))
+
+def build_zip(source_dir, zip_path, workers=WORKERS, digest=None) -> list[dict]:
+    '''Zip everything under source_dir into zip_path
+    - Chunks are compressed on a thread pool (zlib releases the GIL) and written in order as they finish.
+      Up to 2 * workers chunks are in flight across members, so many small files compress in parallel too.
+    - Already-compressed members are stored
+    - The archive is written to `<zip_path>.part` and renamed onto zip_path once it is complete
+    - digest, if given, ends up as the hash of the whole archive
+    - Returns the manifest: name, size, compressed_size, crc and compression of every member
+    '''
+    zip_path = Path(zip_path)
+    part_path = zip_path.with_name(zip_path.name + ".part")
+    members = list_members(source_dir)
+    manifest = []
+
+    try:
+        with open(part_path, "wb") as output, ThreadPoolExecutor(max_workers=workers) as executor:
+            writer = ZipWriter(output, digest)
+            in_flight = deque() # (future, member, is the last chunk of the member), in archive order
+            window = workers * 2
+
+            def write_chunks(keep):
+                # Write chunks in archive order until no more than `keep` are in flight, plus any that are already done.
+                # A member's header is only written just before its first chunk, so the next members' chunks compress
+                # while it is in flight, and the ones that finish first wait their turn in in_flight.
+                while len(in_flight) > keep or (in_flight and (in_flight[0][0] is None or in_flight[0][0].done())):
+                    future, member, last = in_flight.popleft()
+                    if "header" in member:
+                        member.update(writer.start_member(*member.pop("header")))
+                    if future is not None:
+                        data, crc, size = future.result()
+                        writer.write(data)
+                        member["crc"] = crc32_combine(member["crc"], crc, size)
+                        member["compressed_size"] += len(data)
+                        member["size"] += size
+                    if last:
+                        finish(member)
+
+            def finish(member):
+                writer.end_member(member, member["crc"], member["compressed_size"], member["size"])
+                manifest.append({"name": member["name"], "size": member["size"],
+                                 "compressed_size": member["compressed_size"], "crc": member["crc"],
+                                 "compression": "deflated" if member["method"] == DEFLATED else "stored"})
+
+            for path, name in members:
+                stat = path.stat()
+                is_dir = name.endswith("/")
+                size = 0 if is_dir else stat.st_size
+                method = STORED if size == 0 else compression_for(path)
+                mode = ((stat.st_mode & 0xFFFF) << 16) | (0x10 if is_dir else 0)
+                member = {"header": (name, method, stat.st_mtime, mode, size), "crc": 0, "compressed_size": 0, "size": 0}
+                if size == 0:
+                    in_flight.append((None, member, True))
+                for offset in range(0, size, CHUNK_SIZE):
+                    chunk_size = min(CHUNK_SIZE, size - offset)
+                    last = offset + chunk_size >= size
+                    in_flight.append((executor.submit(_read_chunk, path, offset, chunk_size, method, last), member, last))
+                    write_chunks(window)
+
+            write_chunks(0)
+            writer.close()
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(part_path, zip_path)
+    except BaseException:
+        if part_path.exists():
+            part_path.unlink()
+        raise
+
+    return manifest
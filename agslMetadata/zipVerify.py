@@ -0,0 +1,241 @@
+"""
+Integrity check for the deliverable zipfiles: every member's data is read back and checked against its crc32,
+and the dataset's source files are checked to all be in the zip at the right size.
+Run `python zipVerify.py` to check every zip on the fileserver.
+"""
+
+import argparse
+import os
+import struct
+import time
+import updateMetadata
+import zipBuilder
+import zipfile
+import zlib
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Bytes read at a time. The same as zipBuilder's, so crc32_combine can use its precomputed shift.
+CHUNK_SIZE = zipBuilder.CHUNK_SIZE
+
+# crc32 and inflate both release the GIL, so threads keep every core busy
+WORKERS = os.cpu_count() or 1
+
+# Zips with members being checked at once when checking the whole fileserver
+ZIPS_AHEAD = 4
+
+def data_offset(archive, info) -> int:
+    # Where a member's data starts: after its local header, whose name and extra field can differ from the central directory's
+    archive.seek(info.header_offset)
+    header = archive.read(30)
+    if len(header) != 30 or header[:4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"{info.filename}: no local header at offset {info.header_offset}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+def crc_range(zip_path, start, size) -> tuple[int, int]:
+    # (crc32, length) of one chunk of a stored member
+    with open(zip_path, "rb") as archive:
+        archive.seek(start)
+        data = archive.read(size)
+    return zlib.crc32(data), len(data)
+
+def check_stored(zip_path, info) -> str:
+    # A stored member of up to CHUNK_SIZE, or a bigger one checked on one thread. Returns the problem, or None.
+    with open(zip_path, "rb") as archive:
+        archive.seek(data_offset(archive, info))
+        crc, size = 0, 0
+        while size < info.compress_size and (data := archive.read(min(CHUNK_SIZE, info.compress_size - size))):
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+    return compare(info, crc, size)
+
+def check_deflated(zip_path, info) -> str:
+    '''A deflated member, inflated in CHUNK_SIZE pieces so a highly compressed member never fills memory
+    - Returns the problem, or None
+    '''
+    decompressor = zlib.decompressobj(-15)
+    crc, size, remaining = 0, 0, info.compress_size
+    with open(zip_path, "rb") as archive:
+        archive.seek(data_offset(archive, info))
+        while remaining:
+            data = archive.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                return f"{info.filename}: the zipfile ends {remaining} bytes into its data"
+            remaining -= len(data)
+            while data:
+                inflated = decompressor.decompress(data, CHUNK_SIZE)
+                crc = zlib.crc32(inflated, crc)
+                size += len(inflated)
+                data = decompressor.unconsumed_tail
+    inflated = decompressor.flush()
+    crc = zlib.crc32(inflated, crc)
+    size += len(inflated)
+    if not decompressor.eof:
+        return f"{info.filename}: the deflate stream is incomplete"
+    return compare(info, crc, size)
+
+def compare(info, crc, size) -> str:
+    if size != info.file_size:
+        return f"{info.filename}: {size} bytes of data, the zip says {info.file_size}"
+    if crc != info.CRC:
+        return f"{info.filename}: crc32 {crc:08x}, the zip says {info.CRC:08x}"
+    return None
+
+def check_member(zip_path, info) -> str:
+    try:
+        if info.compress_type == zipfile.ZIP_STORED:
+            return check_stored(zip_path, info)
+        elif info.compress_type == zipfile.ZIP_DEFLATED:
+            return check_deflated(zip_path, info)
+        return f"{info.filename}: compression method {info.compress_type} isn't one zipBuilder writes"
+    except (OSError, zlib.error, zipfile.BadZipFile) as error:
+        return f"{info.filename}: {error}"
+
+def submit_checks(zip_path, executor) -> list:
+    '''Queue a check of every member of a zip on executor
+    - Stored members bigger than CHUNK_SIZE (rasters that were already compressed) are split into chunks checked in
+      parallel, so one huge member doesn't check on a single core
+    - Returns a list of (info, split, futures): one future per member, or for a split member one per chunk
+    '''
+    checks = []
+    with zipfile.ZipFile(zip_path) as archive, open(zip_path, "rb") as archive_file:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            split = info.compress_type == zipfile.ZIP_STORED and info.compress_size > CHUNK_SIZE
+            if split:
+                offset = data_offset(archive_file, info)
+                futures = [executor.submit(crc_range, zip_path, offset + start, min(CHUNK_SIZE, info.compress_size - start))
+                           for start in range(0, info.compress_size, CHUNK_SIZE)]
+            else:
+                futures = [executor.submit(check_member, zip_path, info)]
+            checks.append((info, split, futures))
+    return checks
+
+def collect(checks) -> list[str]:
+    # Wait for the checks submit_checks() queued, and list the problems
+    problems = []
+    for info, split, futures in checks:
+        if not split:
+            problem = futures[0].result()
+        else:
+            crc, size = 0, 0
+            try:
+                for future in futures:
+                    chunk_crc, chunk_size = future.result()
+                    crc = zipBuilder.crc32_combine(crc, chunk_crc, chunk_size)
+                    size += chunk_size
+            except OSError as error:
+                problem = f"{info.filename}: {error}"
+            else:
+                problem = compare(info, crc, size)
+        if problem is not None:
+            problems.append(problem)
+    return problems
+
+def source_problems(zip_path, source_dir) -> list[str]:
+    # Every file and directory under source_dir that isn't in the zip, or is at a different size
+    with zipfile.ZipFile(zip_path) as archive:
+        members = {info.filename: info for info in archive.infolist()}
+    problems = []
+    for path, name in zipBuilder.list_members(source_dir):
+        if name not in members:
+            problems.append(f"{name} is not in the zip")
+        elif not name.endswith("/") and members[name].file_size != path.stat().st_size:
+            problems.append(f"{name} is {path.stat().st_size} bytes, {members[name].file_size} in the zip")
+    return problems
+
+def check_zip(zip_path, source_dir=None, workers=WORKERS) -> list[str]:
+    '''Check one zip: every member's data against its crc32 and size, and optionally that it has all of source_dir
+    - Members are checked in parallel, and memory stays at about CHUNK_SIZE per worker
+    - Returns the problems; none means the zip is good
+    '''
+    try:
+        problems = [] if source_dir is None else source_problems(zip_path, source_dir)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            problems.extend(collect(submit_checks(zip_path, executor)))
+    except (OSError, zipfile.BadZipFile) as error:
+        problems = [str(error)]
+    return problems
+
+def verify(zip_path, source_dir=None, workers=WORKERS) -> None:
+    # check_zip() for the ingest pipeline: any problem fails the dataset
+    problems = check_zip(zip_path, source_dir, workers)
+    if problems:
+        raise Exception(f"{zip_path} failed verification:\n" + "\n".join(problems))
+
+def fileserver_zips(file_server_path):
+    # The zips in every ARK directory of every rights directory
+    for rights in updateMetadata.RIGHTS:
+        try:
+            with os.scandir(Path(file_server_path) / rights) as entries:
+                ark_dirs = sorted(entry.path for entry in entries if entry.is_dir())
+        except FileNotFoundError:
+            continue
+        for ark_dir in ark_dirs:
+            yield from sorted(Path(ark_dir).glob("*.zip"))
+
+def verify_fileserver(file_server_path, workers=WORKERS) -> dict:
+    '''Check every zip on the fileserver
+    - The members of up to ZIPS_AHEAD zips share one pool, so small zips don't leave workers idle
+    - Returns the number of zips and bytes checked and the problems of each bad zip
+    '''
+    summary = {"zips": 0, "bytes": 0, "bad": {}}
+    in_flight = deque()
+
+    def finish():
+        zip_path, checks = in_flight.popleft()
+        try:
+            problems = collect(checks)
+        except zipfile.BadZipFile as error:
+            problems = [str(error)]
+        summary["zips"] += 1
+        if problems:
+            summary["bad"][str(zip_path)] = problems
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for zip_path in fileserver_zips(file_server_path):
+            try:
+                in_flight.append((zip_path, submit_checks(zip_path, executor)))
+                summary["bytes"] += zip_path.stat().st_size
+            except (OSError, zipfile.BadZipFile) as error:
+                summary["zips"] += 1
+                summary["bad"][str(zip_path)] = [str(error)]
+            if len(in_flight) > ZIPS_AHEAD:
+                finish()
+        while in_flight:
+            finish()
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the data of every zip on the fileserver against its crc32s")
+    parser.add_argument("zips", type=Path, nargs="*", help="check these zips instead of the whole fileserver")
+    parser.add_argument("--source", type=Path, help="also check that a single zip has every file in this dataset directory")
+    parser.add_argument("--file-server-path", type=Path, default=updateMetadata.FILE_SERVER_PATH)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.zips:
+        if args.source is not None and len(args.zips) != 1:
+            parser.error("--source goes with a single zip")
+        summary = {"zips": len(args.zips), "bytes": sum(path.stat().st_size for path in args.zips), "bad": {}}
+        for zip_path in args.zips:
+            problems = check_zip(zip_path, args.source, args.workers)
+            if problems:
+                summary["bad"][str(zip_path)] = problems
+    else:
+        summary = verify_fileserver(args.file_server_path, args.workers)
+    seconds = time.perf_counter() - start
+    print(f"Checked {summary['zips']} zips ({summary['bytes'] / 1024 / 1024:.1f} MB) in {seconds:.2f} s, "
+          f"{len(summary['bad'])} bad")
+    for zip_path, problems in summary["bad"].items():
+        print(f"\n{zip_path}")
+        for problem in problems:
+            print(f"  {problem}")
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,98 @@
 # listdatasets.py
 # this script will use pathlib to list all the ISO datasets in the given directory
 
+import argparse
+import json
+import os
+
+from datetime import datetime
 from pathlib import Path
-import glob
+
+ISO_DIRECTORY = r'S:\_H_GML\Departments\AGSL\GIS\Projects\METADATA\Complete_ISO\UWM_Geometadata_ISO\Open'
+ARCHIVE_ROOT = r'S:\_R_GML_Archival_AGSL\GIS_Data'
 
 def list_directory_contents(path) -> list:
     dirs = []
     entries = Path(path)
     for entry in entries.iterdir():
-        clean = entry.stem.rstrip("_ISO")
+        clean = entry.stem.removesuffix("_ISO")
         dirs.append(clean)
     return dirs
 
-def find_absolute_path(root_path, dataset) -> str:
-    entries = Path(root_path).glob(f'**/{dataset}/')
-    for entry in entries:
-        return str(entry.absolute())
+def build_index(root_path) -> dict[str, list[str]]:
+    '''Walk the archive once and map every directory name to the absolute paths where it appears
+    - Names are keyed by os.path.normcase(), so lookups are case-insensitive on Windows like the old glob was
+    - Paths are listed depth first with every directory's subdirectories sorted by name, so the first path of a name
+      is the same on every run. The old per-dataset glob took whatever order the file system listed directories in,
+      so for a name that appears more than once (see duplicates()) it could have picked another path.
+    '''
+    index = {}
+    stack = [str(Path(root_path).absolute())]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            subdirectories = sorted(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+        for path in subdirectories:
+            index.setdefault(os.path.normcase(os.path.basename(path)), []).append(path)
+        stack.extend(reversed(subdirectories))
+    return index
+
+def duplicates(index) -> dict[str, list[str]]:
+    # Names that appear in more than one place in the archive
+    return {name: paths for name, paths in index.items() if len(paths) > 1}
+
+def save_index(index, index_path, root_path) -> None:
+    Path(index_path).write_text(json.dumps({"root": str(root_path), "built_at": datetime.now().replace(microsecond=0).isoformat(),
+                                            "index": index}))
+
+def load_index(index_path, root_path) -> dict[str, list[str]]:
+    # The saved index, or None if there isn't one for root_path
+    index_path = Path(index_path)
+    if not index_path.exists():
+        return None
+    saved = json.loads(index_path.read_text())
+    if saved["root"] != str(root_path):
+        return None
+    print(f"Using the archive index built {saved['built_at']}")
+    return saved["index"]
+
+def find_absolute_path(index, dataset) -> str:
+    paths = index.get(os.path.normcase(dataset))
+    if paths:
+        return paths[0]
     return "Undefined"
 
-def write_to_csv(file, text):
-    with file.open("a") as f:
-        f.write(text + "\n")
-    f.close()
+def write_to_csv(file, lines):
+    # The whole datalist in one buffered write
+    with Path(file).open("w") as f:
+        f.writelines(line + "\n" for line in lines)
 
 if __name__ == "__main__":
-    p = Path.home() / 'Desktop' / 'datalist.csv'
-    p.touch(exist_ok=True)
-    for dir in list_directory_contents(r'S:\_H_GML\Departments\AGSL\GIS\Projects\METADATA\Complete_ISO\UWM_Geometadata_ISO\Open'):
-        abs_path = find_absolute_path(r'S:\_R_GML_Archival_AGSL\GIS_Data', dir)
-        line = dir + ", " + abs_path
+    parser = argparse.ArgumentParser(description="List the archive path of every dataset with an ISO record")
+    parser.add_argument("--iso-directory", default=ISO_DIRECTORY)
+    parser.add_argument("--archive-root", default=ARCHIVE_ROOT)
+    parser.add_argument("--output", type=Path, default=Path.home() / 'Desktop' / 'datalist.csv')
+    parser.add_argument("--index", type=Path, help="save the archive index here and reuse it on later runs")
+    parser.add_argument("--rebuild", action="store_true", help="walk the archive again even if there is a saved index")
+    args = parser.parse_args()
+
+    index = None
+    if args.index is not None and not args.rebuild:
+        index = load_index(args.index, args.archive_root)
+    if index is None:
+        index = build_index(args.archive_root)
+        if args.index is not None:
+            save_index(index, args.index, args.archive_root)
+
+    lines = []
+    datasets = list_directory_contents(args.iso_directory)
+    for dir in datasets:
+        line = dir + ", " + find_absolute_path(index, dir)
         print(line)
-        write_to_csv(p, line)
+        lines.append(line)
+    write_to_csv(args.output, lines)
+
+    listed = {os.path.normcase(dataset): dataset for dataset in datasets}
+    for name, paths in duplicates(index).items():
+        if name in listed:
+            print(f"Warning: {listed[name]} is in {len(paths)} places in the archive: {', '.join(paths)}")
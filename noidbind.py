@@ -2,37 +2,30 @@
 # this script, when passed a arkid, will bind the where field to a URL, in this case, the
 # appropriate show page on GeoDiscovery
 
-# Example bind URL: "https://digilib-dev.uwm.edu/noidu_gmgs?bind+set+77981/gmgs4x54g16+where+https://uwm.edu/libraries/"
+# Example bind: "bind set 77981/gmgs4x54g16 where https://geodiscovery.uwm.edu/77981/gmgs4x54g16"
 
-import requests
 import re
+import sys
+from pathlib import Path
 
-def generate_bind_url(arkid, field, baseURL) -> str:
+# The NOID client lives with the rest of the ingest tools
+sys.path.insert(0, str(Path(__file__).resolve().parent / "agslMetadata"))
+import noidClient
+
+NOID_URL_DEV = "https://digilib-dev.uwm.edu/noidu_gmgs?"
+
+def bindArk(arkid, field, baseURL, noid_url=NOID_URL_DEV) -> str:
     # Check to see if it is a valid arkid using regex
-    try:
-        arkregex = re.compile(r"(\d{5})\/(\w{11})")
-    except re.error as ex:
-        print(ex)
+    if re.match(noidClient.ARK_REGEX, arkid) is None:
+        print(f"{arkid} is not a valid arkid")
         return
 
-    check_arkid = arkregex.match(arkid)
-
-    if not check_arkid is None:
-        # Construct the URL:
-        bind_URL = ("https://digilib-dev.uwm.edu/noidu_gmgs?bind+set+"
-        + arkid 
-        + "+" 
-        + field
-        + "+" 
-        + baseURL
-        + arkid) 
-        return bind_URL
-    else:
+    # Returns "ok" or the error NOID reported for the arkid
+    try:
+        return noidClient.get_client(noid_url).bind(arkid, {field: baseURL + arkid})
+    except noidClient.NoidError as error:
+        print(error)
         return
 
-def bindArk(bind_URL):
-    r = requests.get(bind_URL)
-    return r.status_code
-        
 if __name__ == "__main__":
-    print(bindArk(generate_bind_url("77981/gmgssf2mb2h", "where", "https://geodiscovery.uwm.edu/")))
\ No newline at end of file
+    print(bindArk("77981/gmgssf2mb2h", "where", "https://geodiscovery.uwm.edu/"))
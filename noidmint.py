@@ -2,35 +2,34 @@
 # Stephen Appel 6/12/2023
 # Mint's a ark:id using our noid minting service at UWM Libraries
 
-import requests
 import re
+import sys
+from pathlib import Path
+
+# The NOID client lives with the rest of the ingest tools
+sys.path.insert(0, str(Path(__file__).resolve().parent / "agslMetadata"))
+import noidClient
 
 def searchForID(text) -> str:
     # Will match the whole ID
     # Group 1 will be the *Name Assigning Authority Number*
     # Group 2 will be the *Assigned Name*
-    arkregex = re.compile(r"(\d{5})\/(\w{11})")
+    arkregex = re.compile(noidClient.ARK_REGEX)
     arkid = arkregex.search(text)
     return arkid[0]
 
 def mintArk(minter) -> str:
-    #Send the request to the minter. Catch connection errors.
+    # minter is the noid minter url ending in `mint+1`. The client retries connection errors.
+    noid_url, _, command = minter.partition("?")
     try:
-        r = requests.get(minter)
-    except:
-        print("There was a connection error! Check the URL you used to request the id!")
+        r = noidClient.get_client(noid_url + "?").request("GET", command)
+    except noidClient.NoidError as error:
+        print(error)
         return
 
-    # Check the status code the minter returns. It should be 200 if the request was completed.
-    if r.status_code != 200:
-        print("There was a non-200 status code from the minter: " + r.status_code)
-        return
-    # If the status code is 200, then grab the text, run it through the searchForID function to get a string with the arkID
-    else:
-        minter_text = r.text
-        arkid = searchForID(minter_text)
-        return arkid
+    # grab the text, run it through the searchForID function to get a string with the arkID
+    return searchForID(r.text)
 
 # This function will not run if this script is imported as a subscript, it's only for testing.
 if __name__ == "__main__":
-    print(mintArk('https://digilib-dev.uwm.edu/noidu_gmgs?mint+1'))
\ No newline at end of file
+    print(mintArk('https://digilib-dev.uwm.edu/noidu_gmgs?mint+1'))